@@ -6,7 +6,7 @@ from app.schemas.auth import (
     UserResponse
 )
 from app.services.auth import (
-    authenticate_user,
+    authenticate_user_async,
     create_access_token,
     create_refresh_token,
     verify_token
@@ -22,7 +22,7 @@ async def login(credentials: LoginRequest):
     """
     Authenticate user and return access + refresh tokens
     """
-    user = authenticate_user(credentials.username, credentials.password)
+    user = await authenticate_user_async(credentials.username, credentials.password)
     
     if not user:
         raise HTTPException(
@@ -0,0 +1,81 @@
+"""
+Diagnostics API Endpoints (admin only)
+"""
+import asyncio
+import os
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse
+from app.services.profiling import get_slow_log
+from app.services.memory import memory_report, tracemalloc_graph_load
+from app.services.pathfinding import get_pathfinding_service
+from app.services.scenario import get_scenario_service
+from app.dependencies.access_control import require_admin
+from app.config import get_settings
+
+router = APIRouter(prefix="/api/diagnostics", tags=["Diagnostics"])
+
+settings = get_settings()
+
+
+@router.get("/slow")
+async def get_slow_requests(_=Depends(require_admin)):
+    """
+    Slowest recent requests (slowest first) with their inputs, for offline replay
+    (see scripts/replay_slow.py)
+    """
+    entries = get_slow_log().entries()
+    return {"count": len(entries), "requests": entries}
+
+
+@router.delete("/slow")
+async def clear_slow_requests(_=Depends(require_admin)):
+    get_slow_log().clear()
+    return {"message": "Slow request log cleared"}
+
+
+@router.get("/profiles")
+async def list_profiles(_=Depends(require_admin)):
+    """Stored pstats dumps from profile=1 requests (newest first)"""
+    if not os.path.isdir(settings.profile_dir):
+        return {"profiles": []}
+    names = [f for f in os.listdir(settings.profile_dir) if f.endswith(".pstats")]
+    names.sort(key=lambda f: os.path.getmtime(os.path.join(settings.profile_dir, f)), reverse=True)
+    return {"profiles": names}
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str, _=Depends(require_admin)):
+    """Download a pstats dump (open with `python -m pstats` or snakeviz)"""
+    # Chỉ cho phép tên file nằm trực tiếp trong profile_dir
+    if os.path.basename(name) != name or not name.endswith(".pstats"):
+        raise HTTPException(status_code=400, detail="Invalid profile name")
+    path = os.path.join(settings.profile_dir, name)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
+@router.get("/memory")
+async def get_memory_report(
+    tracemalloc: bool = Query(False, description="Also load a throwaway graph copy under tracemalloc"),
+    _=Depends(require_admin)
+):
+    """
+    Memory accounting: deep size of every graph structure (shared base + per-profile
+    weight arrays), bytes per node/edge, per-scenario edge storage and process RSS.
+    With `tracemalloc=true`, adds a snapshot diff around a full graph load
+    (temporarily needs roughly one extra graph worth of memory).
+    """
+    pf_service = get_pathfinding_service()
+    if not all(pf_service.is_ready(v) for v in pf_service.vehicle_types):
+        raise HTTPException(status_code=503, detail="Graphs are still loading. Check /ready for progress.")
+
+    def compute():
+        with pf_service.pinned():
+            report = memory_report(pf_service, get_scenario_service())
+        if tracemalloc:
+            report['graph_load'] = tracemalloc_graph_load(pf_service)
+        return report
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, compute)
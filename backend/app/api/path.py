@@ -1,8 +1,25 @@
 """
 Pathfinding API Endpoints
 """
-from fastapi import APIRouter, HTTPException, Query
-from app.services.pathfinding import get_pathfinding_service
+import asyncio
+from typing import Any, Callable, Dict, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.services.pathfinding import DISTANCE_SCALE, get_pathfinding_service
+from app.services.isochrone import get_isochrone_service
+from app.services.alternatives import find_alternatives
+from app.services.multistop import plan_multi_stop
+from pydantic import ValidationError
+from app.schemas.path import MultiStopRequest, BatchRouteRequest, RouteSubscriptionRequest, GraphDeltaRequest
+from app.services.batch import stream_batch_routes
+from app.services.scenario import get_scenario_service
+from app.services.coalescing import get_route_flights
+from app.services.route_cache import get_route_cache
+from app.services.graph_delta import list_changelog
+from app.services.subscriptions import get_route_subscriptions
+from app.services.workers import get_routing_pool
+from app.dependencies.access_control import get_current_user, require_admin, require_admin_for_profiling
+from app.services.profiling import profile_call, timed
 from app.database import get_db_connection
 from app.config import get_settings
 router = APIRouter(prefix="/api", tags=["Pathfinding"])
@@ -10,6 +27,38 @@ router = APIRouter(prefix="/api", tags=["Pathfinding"])
 settings = get_settings()
 
 
+def get_ready_service(vehicle: str):
+    """Lấy PathfindingService, trả 503 ngay nếu đồ thị của phương tiện chưa tải xong"""
+    service = get_pathfinding_service()
+    if vehicle in service.vehicle_types and not service.is_ready(vehicle):
+        raise HTTPException(
+            status_code=503,
+            detail=f"Graph for '{vehicle}' is still loading. Check /ready for progress.",
+            headers={"Retry-After": "2"}
+        )
+    return service
+
+
+async def run_routing(endpoint: str, inputs: Dict[str, Any], fn: Callable, profile: bool = False) -> Tuple[Any, Optional[Dict]]:
+    """
+    Chạy fn trên routing pool và ghi thời gian vào slow log.
+    profile=True: chạy dưới cProfile, trả về thêm báo cáo profile.
+    """
+    def job():
+        with timed(endpoint, inputs):
+            return fn()
+
+    if profile:
+        return await get_routing_pool().run(profile_call, endpoint.strip("/").replace("/", "_"), job)
+    return await get_routing_pool().run(job), None
+
+
+def not_found(message: str, report: Optional[Dict] = None) -> HTTPException:
+    """404; khi đang profile thì kèm báo cáo trong detail"""
+    detail = {"message": message, "profile": report} if report else message
+    return HTTPException(status_code=404, detail=detail)
+
+
 @router.get("/path")
 async def find_path(
     start_x: float = Query(..., description=f"Starting X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
@@ -17,7 +66,14 @@ async def find_path(
     end_x: float = Query(..., description=f"Ending X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
     end_y: float = Query(..., description=f"Ending Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
     vehicle: str = Query("foot", description="Vehicle type: 'car' or 'foot'"),
-    speed: float = Query(1.0, description="Speed of vehicle (m/s)")
+    speed: float = Query(1.0, description="Speed of vehicle (m/s)"),
+    epsilon: Optional[float] = Query(
+        None, ge=0, le=10, description="Weighted A*: cost stays within (1 + epsilon) of optimal (0 = exact)"
+    ),
+    hierarchy: bool = Query(
+        False, description="Away from both ends, expand only arterial roads (faster long routes, not guaranteed optimal)"
+    ),
+    profile: bool = Depends(require_admin_for_profiling)
 ):
     """
     Find optimal path between two points using A* algorithm
@@ -28,38 +84,361 @@ async def find_path(
     Returns path information including:
     - path: List of nodes with coordinates
     - distance: Total distance in pixels
-    - cost: Calculated cost (distance + penalties)
+    - cost: Calculated cost (distance + penalties): weighted length × DISTANCE_SCALE / `speed`.
+      For vehicles in `road_class_speed_vehicles` (car by default) every edge length is first
+      multiplied by `road_class_reference_speed` / edge speed (maxspeed, else the road class speed,
+      never below 1). `speed` is therefore the speed on a road running at the reference speed, and
+      slower roads cost proportionally more. Foot routes, and edges with neither a road class nor
+      a maxspeed, use the plain length.
     - nodes: Number of nodes in path
+    - search: `epsilon`, achieved `bound` (cost / proven lower bound) and nodes `expanded`
+      (only when `epsilon` or `hierarchy` is given); with `hierarchy`, `hierarchy` tells whether
+      the route came from the arterial-restricted search (`bound` is then null)
+    - profile: cProfile report (only with `profile=1`, admin token required)
     """
     # Get pathfinding service
-    service = get_pathfinding_service()
-    
-    # Find path
-    result = service.find_path(start_x, start_y, end_x, end_y, vehicle, speed)
+    service = get_ready_service(vehicle)
+    cache = get_route_cache()
+
+    def compute(snaps=None, key=None):
+        with service.pinned():
+            stats = {} if epsilon is not None or hierarchy else None
+            if snaps is not None:
+                result = service.route_snapped(*snaps, vehicle, speed, epsilon or 0.0, stats, hierarchy)
+            else:
+                result = service.find_path(start_x, start_y, end_x, end_y, vehicle, speed, epsilon or 0.0, stats, hierarchy)
+            if result is not None and stats is not None:
+                result = {**result, 'search': {'epsilon': epsilon or 0.0, **stats}}
+            if key is not None and cache is not None and result is not None:
+                # key[-1] là weight epoch lúc tạo khóa; cache bỏ qua nếu trọng số đã đổi
+                cache.put(key[:-1], key[-1], result, vehicle, speed, epsilon or 0.0)
+            return result
+
+    inputs = dict(start_x=start_x, start_y=start_y, end_x=end_x, end_y=end_y, vehicle=vehicle, speed=speed)
+    if epsilon is not None:
+        inputs['epsilon'] = epsilon
+    if hierarchy:
+        inputs['hierarchy'] = True
+    if profile:
+        result, report = await run_routing("/api/path", inputs, compute, profile=True)
+    else:
+        # Snap, khóa và search trên cùng một thế hệ đồ thị (lease giữ nó qua các lượt trên routing pool)
+        with service.lease() as graphs:
+            def prepare():
+                with service.pinned(graphs):
+                    snaps = service.snap_endpoints(start_x, start_y, end_x, end_y, vehicle)
+                    key = service.route_key(start_x, start_y, end_x, end_y, vehicle, speed, epsilon, hierarchy, snaps)
+                    # Route đã có trong cache (còn đúng với trọng số hiện tại) -> trả luôn
+                    return snaps, key, cache.get(key[:-1]) if cache is not None else None
+
+            def search(snaps, key):
+                with service.pinned(graphs):
+                    return compute(snaps, key)
+
+            snaps, key, result = await get_routing_pool().run(prepare)
+            report = None
+            if result is None:
+                # Find path (request trùng đang chạy -> chờ chung một lần tìm)
+                result, report = await get_route_flights().run(
+                    key, lambda: run_routing("/api/path", inputs, lambda: search(snaps, key))
+                )
     
     if result is None:
-        raise HTTPException(
-            status_code=404,
-            detail="No path found between the specified points. Make sure both points are near valid nodes."
+        raise not_found(
+            "No path found between the specified points. Make sure both points are near valid nodes.", report
         )
     
+    return {**result, "profile": report} if report else result
+
+
+@router.get("/path/distance")
+async def find_path_distance(
+    start_x: float = Query(..., description=f"Starting X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
+    start_y: float = Query(..., description=f"Starting Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
+    end_x: float = Query(..., description=f"Ending X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
+    end_y: float = Query(..., description=f"Ending Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
+    vehicle: str = Query("foot", description="Vehicle type: 'car' or 'foot'"),
+    speed: float = Query(1.0, description="Speed of vehicle (m/s)")
+):
+    """
+    Distance and cost only (no geometry), for pricing and ETA estimates
+
+    Answered from the hub-label index (scripts/build_hub_labels.py) when it is loaded and no
+    active scenario can change the result; otherwise falls back to the regular search.
+    `source` is `hub_labels` or `search`.
+    """
+    service = get_ready_service(vehicle)
+
+    def compute():
+        with service.pinned():
+            oracle = service.hub_labels.distance(start_x, start_y, end_x, end_y, vehicle)
+            if oracle is not None:
+                # Cùng quy đổi với _build_path_payload
+                cost = oracle['cost'] * DISTANCE_SCALE
+                return {
+                    'distance': round(oracle['distance'] * DISTANCE_SCALE, 2),
+                    'cost': "Blocked" if cost > 100000 else round(cost / (speed if speed > 0 else 1), 2),
+                    'source': 'hub_labels'
+                }
+            result = service.find_path(start_x, start_y, end_x, end_y, vehicle, speed)
+            if result is None:
+                return None
+            return {'distance': result['distance'], 'cost': result['cost'], 'source': 'search'}
+
+    inputs = dict(start_x=start_x, start_y=start_y, end_x=end_x, end_y=end_y, vehicle=vehicle, speed=speed)
+    result, _ = await run_routing("/api/path/distance", inputs, compute)
+
+    if result is None:
+        raise not_found("No path found between the specified points. Make sure both points are near valid nodes.")
     return result
 
 
+@router.websocket("/path/subscribe")
+async def subscribe_route(websocket: WebSocket):
+    """
+    Đăng ký route hiện tại thay vì poll /api/path: server tự tính lại và đẩy route mới khi kịch bản
+    (tạo / xóa / di chuyển / tới giờ) chạm vào cạnh trên route hoặc có thể làm route rẻ hơn.
+
+    - Client gửi JSON `{start_x, start_y, end_x, end_y, vehicle, speed}`; gửi lại để đổi route
+    - Server gửi `{type: "route", reason: "subscribed" | "updated" | "scenario", subscription,
+      weight_epoch, route}` với route giống /api/path (null nếu không có đường)
+    - Dữ liệu sai: `{type: "error", detail}`
+    """
+    await websocket.accept()
+    subscriptions = get_route_subscriptions()
+    sub = None
+    try:
+        while True:
+            try:
+                query = RouteSubscriptionRequest.model_validate(await websocket.receive_json()).model_dump()
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({'type': 'error', 'detail': str(e)})
+                continue
+            if sub is None:
+                try:
+                    sub = await subscriptions.subscribe(query, websocket.send_json)
+                except OverflowError as e:
+                    await websocket.send_json({'type': 'error', 'detail': str(e)})
+                    await websocket.close(code=1013)
+                    return
+            else:
+                await subscriptions.update(sub, query)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if sub is not None:
+            subscriptions.unsubscribe(sub)
+
+
+@router.get("/path/alternatives")
+async def find_alternative_paths(
+    start_x: float = Query(..., description=f"Starting X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
+    start_y: float = Query(..., description=f"Starting Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
+    end_x: float = Query(..., description=f"Ending X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
+    end_y: float = Query(..., description=f"Ending Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
+    vehicle: str = Query("foot", description="Vehicle type: 'car' or 'foot'"),
+    speed: float = Query(1.0, description="Speed of vehicle (m/s)"),
+    k: int = Query(3, description="Maximum number of routes", ge=1, le=10),
+    max_overlap: float = Query(0.7, description="Maximum shared cost with already chosen routes (0-1)", ge=0, le=1),
+    max_stretch: float = Query(0.3, description="Maximum extra cost relative to the optimum", ge=0, le=2),
+    profile: bool = Depends(require_admin_for_profiling)
+):
+    """
+    Find up to K diverse, locally optimal routes
+
+    Uses one forward and one backward shortest-path tree (plateau method).
+    The first route is the optimum; every route has the same shape as /api/path
+    plus `stretch` and `overlap`.
+    """
+    service = get_ready_service(vehicle)
+
+    def compute():
+        with service.pinned():
+            return find_alternatives(
+                service, start_x, start_y, end_x, end_y, vehicle, speed,
+                k=k, max_overlap=max_overlap, max_stretch=max_stretch
+            )
+
+    inputs = dict(start_x=start_x, start_y=start_y, end_x=end_x, end_y=end_y, vehicle=vehicle, speed=speed,
+                  k=k, max_overlap=max_overlap, max_stretch=max_stretch)
+    routes, report = await run_routing("/api/path/alternatives", inputs, compute, profile)
+
+    if not routes:
+        raise not_found(
+            "No path found between the specified points. Make sure both points are near valid nodes.", report
+        )
+
+    response = {"routes": routes, "count": len(routes)}
+    return {**response, "profile": report} if report else response
+
+
+@router.post("/path/multi")
+async def find_multi_stop_path(request: MultiStopRequest, profile: bool = Depends(require_admin_for_profiling)):
+    """
+    Find a route visiting several waypoints
+
+    - **optimize**: reorder waypoints (nearest insertion + 2-opt) instead of keeping the given order
+    - **fixed_start / fixed_end**: keep the first / last waypoint in place when optimizing
+
+    Returns the stitched path (same shape as /api/path) plus `order` and per-leg costs.
+    """
+    service = get_ready_service(request.vehicle)
+
+    def compute():
+        with service.pinned():
+            return plan_multi_stop(
+                service,
+                [(wp.x, wp.y) for wp in request.waypoints],
+                request.vehicle,
+                request.speed,
+                optimize=request.optimize,
+                fixed_start=request.fixed_start,
+                fixed_end=request.fixed_end
+            )
+
+    result, report = await run_routing("/api/path/multi", request.model_dump(), compute, profile)
+
+    if result is None:
+        raise not_found(
+            "No route found through all waypoints. Make sure every waypoint is near a reachable road.", report
+        )
+
+    return {**result, "profile": report} if report else result
+
+
+@router.post("/path/batch")
+async def find_path_batch(request: BatchRouteRequest, _=Depends(get_current_user)):
+    """
+    Route many OD pairs in one request (requires a logged-in user)
+
+    All points are snapped in one pass, routes are computed in parallel on the
+    routing pool and streamed back as NDJSON, one line per pair in completion order:
+    `{"index", "id", "route"}` or `{"index", "id", "error"}`. The last line is `{"summary": ...}`.
+    The body is parsed in full before streaming starts, so it is capped at `batch_max_pairs` pairs.
+    """
+    service = get_ready_service(request.vehicle)
+    return StreamingResponse(
+        stream_batch_routes(
+            service, get_routing_pool(), request.pairs, request.vehicle, request.speed, request.include_path
+        ),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/isochrone")
+async def get_isochrone(
+    x: float = Query(..., description=f"Origin X coordinate (0-{settings.MAP_WIDTH})", ge=0, le=settings.MAP_WIDTH),
+    y: float = Query(..., description=f"Origin Y coordinate (0-{settings.MAP_HEIGHT})", ge=0, le=settings.MAP_HEIGHT),
+    max_seconds: float = Query(..., description="Time budget in seconds", gt=0),
+    bands: int = Query(1, description="Number of equal time bands", ge=1, le=10),
+    shape: Literal["nodes", "hull", "grid"] = Query("hull", description="Output shape per band"),
+    vehicle: str = Query("foot", description="Vehicle type: 'car' or 'foot'"),
+    speed: float = Query(1.0, description="Speed of vehicle (m/s)"),
+    profile: bool = Depends(require_admin_for_profiling)
+):
+    """
+    Find everything reachable from a point within a time budget
+
+    Runs a single cost-bounded Dijkstra from the snapped origin and splits
+    the result into `bands` time bands (reachable nodes, convex hull or grid cells).
+    """
+    service = get_ready_service(vehicle)
+
+    def compute():
+        with service.pinned():
+            return get_isochrone_service().compute(service, x, y, vehicle, speed, max_seconds, bands, shape)
+
+    inputs = dict(x=x, y=y, max_seconds=max_seconds, bands=bands, shape=shape, vehicle=vehicle, speed=speed)
+    result, report = await run_routing("/api/isochrone", inputs, compute, profile)
+
+    if result is None:
+        raise not_found("No node found near the specified origin.", report)
+
+    return {**result, "profile": report} if report else result
+
+
 @router.post("/path/reload")
-async def reload_graph():
+async def reload_graph(_=Depends(require_admin)):
     """
-    Reload graph from database
-    Call this after updating edge weights or scenarios
+    Reload graph from database without downtime
+
+    Builds a new graph generation in the background, re-applies the active
+    scenarios to it and swaps it in atomically. Queries keep using the old
+    generation until they finish.
     """
     service = get_pathfinding_service()
-    service.reload_graph()
+    if not all(service.is_ready(v) for v in service.vehicle_types):
+        raise HTTPException(status_code=503, detail="Graphs are still loading. Check /ready for progress.")
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(None, service.reload_graph, get_scenario_service())
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     return {
         "message": "Graph reloaded successfully",
-        "nodes": len(service.graph)
+        **result
     }
 
+@router.post("/path/delta")
+async def apply_graph_delta(request: GraphDeltaRequest, _=Depends(require_admin)):
+    """
+    Apply an incremental graph change without a full reload
+
+    Writes the added / removed nodes and edges and the weight changes to the
+    graph tables with a new changelog version, patches a copy of the in-memory
+    graph, re-derives the scenario edges the delta touches and swaps the copy
+    in atomically. Invalid deltas leave both the database and the graph as they were.
+    """
+    service = get_pathfinding_service()
+    if not all(service.is_ready(v) for v in service.vehicle_types):
+        raise HTTPException(status_code=503, detail="Graphs are still loading. Check /ready for progress.")
+
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            None, service.apply_graph_delta, request.model_dump(exclude_none=True), get_scenario_service()
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {
+        "message": "Graph delta applied",
+        **result
+    }
+
+
+@router.get("/path/changelog")
+async def get_graph_changelog(
+    limit: int = Query(50, ge=1, le=500),
+    include_delta: bool = Query(False, description="Include the full delta of each version"),
+    _=Depends(require_admin)
+):
+    """Graph deltas applied so far, newest first, with the current changelog version"""
+    return list_changelog(limit, include_delta)
+
+
+@router.get("/path/stats")
+async def get_path_stats(_=Depends(require_admin)):
+    """Counters for request coalescing, the route cache, route subscriptions, the destination-tree cache, arc flags and hub labels"""
+    service = get_pathfinding_service()
+    pool = get_routing_pool()
+    cache = get_route_cache()
+    return {
+        "weight_epoch": service.weight_epoch,
+        "coalescing": get_route_flights().stats(),
+        "route_cache": cache.stats() if cache else None,
+        "subscriptions": get_route_subscriptions().stats(),
+        "routing_pool": {"in_flight": pool.in_flight, "max_concurrency": pool.max_concurrency},
+        "destination_trees": service.destination_trees.stats() if service.destination_trees else None,
+        "arc_flags": service.arc_flag_updater.stats(),
+        "hub_labels": service.hub_labels.stats()
+    }
+
+
 @router.get("/nodes", tags=["nodes"])
 async def get_all_nodes():
     """
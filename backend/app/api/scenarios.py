@@ -1,15 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List
 
 # Import schemas
-from app.schemas.scenario import ScenarioRequest, ScenarioResponse, ScenarioItem
+from app.schemas.scenario import ScenarioRequest, ScenarioResponse, ScenarioItem, ScenarioPatch, ScenarioPatchResponse
 # Import services
 from app.services.scenario import get_scenario_service
 from app.services.pathfinding import get_pathfinding_service
+from app.services.scheduler import get_scenario_scheduler
 from app.dependencies.access_control import require_admin
+from app.services.profiling import profile_call, timed
 
 router = APIRouter(prefix="/scenarios", tags=["Scenarios"])
 
+
+def require_graphs(pf_service):
+    """503 khi đồ thị chưa tải xong (chưa khôi phục được kịch bản đã lưu)"""
+    if not all(pf_service.is_ready(v) for v in pf_service.vehicle_types):
+        raise HTTPException(
+            status_code=503,
+            detail="Graphs are still loading. Check /ready for progress.",
+            headers={"Retry-After": "2"}
+        )
+
+
+async def run_blocking(fn, *args):
+    """
+    Chạy ngoài event loop như /path/reload và /path/delta: chờ khôi phục kịch bản và
+    sc_service.lock (reload / delta giữ lock suốt thời gian chạy) không được chặn request khác
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
 @router.get("/", response_model=List[ScenarioItem])
 async def get_scenarios():
     """Lấy danh sách kịch bản đang chạy (từ RAM)"""
@@ -18,41 +41,104 @@ async def get_scenarios():
 @router.post("/", response_model=ScenarioResponse)
 async def create_scenario(
     request: ScenarioRequest,
+    profile: bool = Query(False, description="Profile the geometry step (cProfile)"),
     _=Depends(require_admin)
 ):
     """
     Tạo kịch bản mới:
     1. Tính toán hình học (ScenarioService)
     2. Cập nhật RAM (PathfindingService)
+    profile=1: trả kèm báo cáo cProfile của bước tính hình học
     """
+    if request.ends_at is not None and request.ends_at <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Scenario has already ended")
+
     pf_service = get_pathfinding_service()
     sc_service = get_scenario_service()
+    require_graphs(pf_service)
     
-    # Bước 1: Tính toán xem cạnh nào bị dính (Dùng data RAM để tính)
-    # Lưu ý: Truyền pf_service vào để ScenarioService truy cập nodes/weights
-    affected_edges_map = sc_service.calculate_affected_edges(
-        pathfinding_service=pf_service,
-        line_p1=(request.line_start.lng, request.line_start.lat),
-        line_p2=(request.line_end.lng, request.line_end.lat),
-        threshold=request.threshold
-    )
-    
-    # Bước 2: Cập nhật trọng số ngay lập tức vào RAM
-    total_affected = 0
-    for v_type, edges in affected_edges_map.items():
-        total_affected += len(edges)
-        for u, v in edges:
-            pf_service.update_weight_in_ram(u, v, request.penalty_weight, v_type)
-        
-    # Bước 3: Lưu lại kịch bản để quản lý
-    saved_scenario = sc_service.add_scenario(request.dict(), affected_edges_map)
+    def geometry():
+        return sc_service.calculate_affected_edges(
+            pathfinding_service=pf_service,
+            line_p1=(request.line_start.lng, request.line_start.lat),
+            line_p2=(request.line_end.lng, request.line_end.lat),
+            threshold=request.threshold
+        )
+
+    def apply():
+        # Chờ khôi phục kịch bản từ DB xong (id mới không được đè kịch bản đã lưu)
+        sc_service.ensure_restored(pf_service)
+        report = None
+        # Giữ lock để hot reload không hoán đổi đồ thị giữa lúc tính hình học và lúc áp dụng
+        with sc_service.lock, timed("/api/scenarios", request.model_dump(mode="json")):
+            # Bước 1: Tính toán xem cạnh nào bị dính (Dùng data RAM để tính)
+            # Lưu ý: Truyền pf_service vào để ScenarioService truy cập nodes/weights
+            if profile:
+                affected_edges_map, report = profile_call("api_scenarios", geometry)
+            else:
+                affected_edges_map = geometry()
+
+            # Bước 2: Lưu lại kịch bản để quản lý
+            saved_scenario = sc_service.add_scenario(request.dict(), affected_edges_map, pf_service.graph_versions())
+
+            # Bước 3: Cập nhật trọng số vào RAM nếu đang trong khung thời gian
+            # (nếu chưa tới giờ, scheduler sẽ tự áp dụng khi tới starts_at)
+            active = sc_service.activate(pf_service, saved_scenario)
+        return affected_edges_map, active, report
+
+    affected_edges_map, active, report = await run_blocking(apply)
+    total_affected = sum(len(edges) for edges in affected_edges_map.values())
+    get_scenario_scheduler().wake()
     
-    print(f"✅ Applied scenario {request.scenario_type} to {total_affected} edges.")
+    print(f"✅ Applied scenario {request.scenario_type} to {total_affected} edges (active={active}).")
     
     return ScenarioResponse(
-        message="Scenario applied successfully (In-Memory)",
+        message="Scenario applied successfully (In-Memory)" if active else "Scenario scheduled (In-Memory)",
         affected_edges=total_affected,
-        scenario_type=request.scenario_type
+        scenario_type=request.scenario_type,
+        active=active,
+        profile=report
+    )
+
+@router.patch("/{scenario_id}", response_model=ScenarioPatchResponse)
+async def update_scenario(
+    scenario_id: int,
+    request: ScenarioPatch,
+    _=Depends(require_admin)
+):
+    """
+    Di chuyển / đổi hình dạng kịch bản (thay cho xóa rồi tạo lại):
+    chỉ các cạnh trong hiệu đối xứng giữa tập cũ và mới được tính lại trọng số,
+    weight epoch chỉ tăng một lần.
+    """
+    changes = request.model_dump(mode="json", exclude_none=True)
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+
+    pf_service = get_pathfinding_service()
+    sc_service = get_scenario_service()
+    require_graphs(pf_service)
+
+    def apply():
+        # Chờ khôi phục kịch bản từ DB xong (kịch bản cần sửa có thể chưa được nạp)
+        sc_service.ensure_restored(pf_service)
+        with timed("/api/scenarios/patch", {"id": scenario_id, **changes}):
+            return sc_service.update_scenario(pf_service, scenario_id, changes)
+
+    result = await run_blocking(apply)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    scenario, diff = result
+
+    print(f"🌧️ Scenario {scenario_id} moved: +{diff['added']} / -{diff['removed']} edges.")
+    return ScenarioPatchResponse(
+        message="Scenario updated (In-Memory)",
+        affected_edges=scenario["affected_edges"],
+        added_edges=diff["added"],
+        removed_edges=diff["removed"],
+        kept_edges=diff["kept"],
+        active=scenario["active"],
+        weight_epoch=pf_service.weight_epoch
     )
 
 @router.delete("/{scenario_id}")
@@ -62,27 +148,26 @@ async def delete_scenario(
 ):
     """
     Xóa kịch bản:
-    Chiến thuật: Reset RAM về gốc -> Apply lại các kịch bản còn lại.
-    (Đây là cách an toàn nhất để tránh sai lệch trọng số)
+    Chỉ tính lại trọng số trên các cạnh của kịch bản bị xóa
+    (các kịch bản khác cùng phủ cạnh đó vẫn được giữ nguyên hệ số).
     """
     pf_service = get_pathfinding_service()
     sc_service = get_scenario_service()
-    
-    # 1. Xóa khỏi danh sách quản lý
-    success = sc_service.remove_scenario(scenario_id)
-    if not success:
-        raise HTTPException(status_code=404, detail="Scenario not found")
+    require_graphs(pf_service)
 
-    # 2. Reset trọng số RAM về trạng thái ban đầu (như lúc mới khởi động)
-    pf_service.reset_weights_in_ram()
-    
-    # 3. Apply lại TẤT CẢ các kịch bản còn lại trong danh sách
-    # (Để đảm bảo nếu còn mưa chỗ khác thì vẫn phải mưa)
-    for scenario in sc_service.active_scenarios:
-        penalty = scenario['penalty_weight']
-        for v_type, edges in scenario['affected_edges_map'].items():
-            for u, v in edges:
-                pf_service.update_weight_in_ram(u, v, penalty, v_type)
+    def apply():
+        # Chờ khôi phục xong, nếu không kịch bản bị xóa sẽ được khôi phục lại từ DB
+        sc_service.ensure_restored(pf_service)
+        # 1. Xóa khỏi danh sách quản lý
+        scenario = sc_service.remove_scenario(scenario_id)
+        if scenario:
+            # 2. Gỡ trọng số theo delta
+            sc_service.deactivate(pf_service, scenario)
+        return scenario
+
+    if not await run_blocking(apply):
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    get_scenario_scheduler().wake()
 
     print(f"🔄 Scenario {scenario_id} removed. Graph refreshed.")
     return {"message": "Scenario deleted and graph updated"}
@@ -92,12 +177,19 @@ async def clear_all_scenarios(_=Depends(require_admin)):
     """Xóa tất cả kịch bản (Nút Clear All)"""
     pf_service = get_pathfinding_service()
     sc_service = get_scenario_service()
-    
-    # 1. Xóa danh sách
-    sc_service.clear_all()
-    
-    # 2. Reset RAM về zin
-    pf_service.reset_weights_in_ram()
+    require_graphs(pf_service)
+
+    def apply():
+        # Chờ khôi phục xong, nếu không các kịch bản đã lưu sẽ quay lại sau khi xóa
+        sc_service.ensure_restored(pf_service)
+        # 1. Xóa danh sách
+        # 2. Reset RAM về zin
+        with sc_service.lock:
+            sc_service.clear_all()
+            pf_service.reset_weights_in_ram()
+
+    await run_blocking(apply)
+    get_scenario_scheduler().wake()
     
     print("🧹 All scenarios cleared. Graph reset to original.")
     return {"message": "All scenarios cleared"}
\ No newline at end of file
@@ -16,6 +16,26 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    # Cache access token đã xác thực (TTL không vượt quá exp của token)
+    token_cache_ttl_seconds: int = 60
+    token_cache_max_entries: int = 1024
+
+    # Auth worker pool (pbkdf2 verify chạy ngoài event loop)
+    auth_workers: int = 2
+    auth_max_concurrency: int = 8
+
+    # Routing worker pool (tìm đường chạy ngoài event loop)
+    routing_workers: int = 4
+    routing_max_concurrency: int = 64
+    # Batch route: số cặp OD tối đa mỗi request (body được parse trọn trước khi stream), số cặp đang tính đồng thời
+    batch_max_pairs: int = 10000
+    batch_max_in_flight: int = 32
+
+    # Profiling (profile=1, chỉ admin) và log các request chậm nhất
+    profile_dir: str = "./data/profiles"
+    profile_max_files: int = 50
+    profile_top_n: int = 30
+    slow_request_log_size: int = 50
     
     # CORS
     allowed_origins: str = "http://localhost:8080,http://127.0.0.1:8080"
@@ -26,6 +46,62 @@ class Settings(BaseSettings):
     # Map config
     MAP_WIDTH: int = 8500
     MAP_HEIGHT: int = 7801
+
+    # Snapping: chiếu điểm lên cạnh gần nhất (False = snap vào node gần nhất như cũ)
+    snap_to_edges: bool = True
+    segment_index_cell: float = 64.0
+
+    # Isochrone
+    isochrone_cache_size: int = 64
+    isochrone_grid_cell: float = 100.0
+
+    # Scenario scheduler (giây ngủ tối đa giữa 2 lần kiểm tra)
+    scenario_scheduler_max_sleep: float = 60.0
+
+    # Cây đường đi ngược cho các đích được hỏi nhiều (POI)
+    dest_tree_enabled: bool = True
+    dest_tree_min_hits: int = 5
+    dest_tree_decay_every: int = 1000
+    dest_tree_memory_mb: float = 64.0
+
+    # Cache kết quả /api/path (số route tối đa, 0 = tắt); kịch bản đổi chỉ loại route bị ảnh hưởng
+    route_cache_size: int = 1024
+
+    # WebSocket /api/path/subscribe: số route đăng ký tối đa
+    route_subscriptions_max: int = 10000
+
+    # Arc flags (dựng offline bằng scripts/build_arc_flags.py; grid x grid ô, tối đa 64)
+    arc_flags_dir: str = "./data/arc_flags"
+    arc_flags_grid: int = 8
+    # Tính lại flags ở nền khi kịch bản đổi trọng số, chỉ các ô bị ảnh hưởng
+    # (False = tìm không cắt tỉa tới khi gỡ kịch bản)
+    arc_flags_recompute: bool = False
+
+    # Hub labels cho truy vấn chỉ cần distance/cost (dựng offline bằng scripts/build_hub_labels.py)
+    hub_labels_dir: str = "./data/hub_labels"
+    # Đọc nhãn qua mmap thay vì nạp hết vào RAM
+    hub_labels_mmap: bool = True
+
+    # Tốc độ (km/h) theo loại đường OSM, dùng cho chi phí của các phương tiện trong road_class_speed_vehicles;
+    # cạnh có maxspeed dùng maxspeed, loại không có trong danh sách dùng road_class_default_speed
+    road_class_speeds: str = (
+        "motorway=80,trunk=70,primary=50,secondary=40,tertiary=35,"
+        "unclassified=30,residential=25,living_street=10,service=15"
+    )
+    road_class_default_speed: float = 30.0
+    # Tốc độ tham chiếu (km/h): trọng số = độ dài * reference / tốc độ cạnh (không nhỏ hơn độ dài).
+    # Cố định theo cấu hình nên hệ số không phụ thuộc nội dung đồ thị; tham số speed của request
+    # là tốc độ trên đường chạy đúng tốc độ tham chiếu
+    road_class_reference_speed: float = 80.0
+    road_class_speed_vehicles: str = "car"
+    # Tìm phân cấp (hierarchy=1): cách cả hai đầu route quá bán kính này (pixel) thì chỉ đi đường trục
+    hierarchy_radius: float = 2000.0
+    hierarchy_classes: str = "motorway,trunk,primary,secondary"
+
+    # Hàng đợi của search core: lazy | indexed | radix (chọn bằng scripts/bench_queues.py)
+    search_queue: str = "lazy"
+    # Ghi đè theo phương tiện, vd. "car=radix,foot=indexed"
+    search_queue_by_vehicle: str = ""
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -35,6 +111,14 @@ class Settings(BaseSettings):
         """Convert comma-separated origins to list"""
         return [origin.strip() for origin in self.allowed_origins.split(",")]
 
+    def search_queue_for(self, vehicle_type: str) -> str:
+        """Loại hàng đợi cho một phương tiện (search_queue_by_vehicle, nếu không thì search_queue)"""
+        for pair in self.search_queue_by_vehicle.split(","):
+            name, _, kind = pair.partition("=")
+            if name.strip() == vehicle_type and kind.strip():
+                return kind.strip()
+        return self.search_queue
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -34,6 +34,83 @@ def get_db_connection():
         conn.close()
 
 
+def create_scenario_tables(cursor):
+    """Bảng lưu kịch bản; cạnh bị ảnh hưởng lưu dạng mảng int64 đóng gói, gắn phiên bản đồ thị"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scenarios (
+            id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS scenario_edges (
+            scenario_id INTEGER NOT NULL,
+            vehicle TEXT NOT NULL,
+            graph_version TEXT NOT NULL,
+            edges BLOB NOT NULL,
+            PRIMARY KEY (scenario_id, vehicle),
+            FOREIGN KEY (scenario_id) REFERENCES scenarios(id)
+        )
+    """)
+
+
+def create_graph_tables(cursor, vehicle_type: str):
+    """
+    Bảng đồ thị của một phương tiện (nodes_{vehicle}, edges_{vehicle}).
+    road_class: tag highway của OSM; maxspeed: km/h (NULL nếu không có). Bảng cũ thiếu hai cột
+    này vẫn tải được (coi như không rõ loại đường).
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS nodes_{vehicle_type} (
+            id INTEGER PRIMARY KEY,
+            x REAL NOT NULL,
+            y REAL NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS edges_{vehicle_type} (
+            node_from INTEGER NOT NULL,
+            node_to INTEGER NOT NULL,
+            weight REAL NOT NULL,
+            road_class TEXT,
+            maxspeed REAL,
+            PRIMARY KEY (node_from, node_to),
+            FOREIGN KEY (node_from) REFERENCES nodes_{vehicle_type}(id),
+            FOREIGN KEY (node_to) REFERENCES nodes_{vehicle_type}(id)
+        )
+    """)
+
+
+def add_road_class_columns(cursor, vehicle_type: str) -> bool:
+    """Thêm cột road_class / maxspeed vào edges_{vehicle} đã có; True nếu bảng vừa được nâng cấp"""
+    cursor.execute(f"PRAGMA table_info(edges_{vehicle_type})")
+    columns = {row[1] for row in cursor.fetchall()}
+    added = False
+    for name, kind in (('road_class', 'TEXT'), ('maxspeed', 'REAL')):
+        if columns and name not in columns:
+            cursor.execute(f"ALTER TABLE edges_{vehicle_type} ADD COLUMN {name} {kind}")
+            added = True
+    return added
+
+
+def create_graph_changelog_table(cursor):
+    """
+    Nhật ký các graph delta đã ghi vào bảng nodes_* / edges_*: version tăng dần,
+    delta lưu nguyên dạng JSON đã gửi, summary = số thay đổi theo phương tiện.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS graph_changelog (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL DEFAULT '',
+            delta TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
 def init_database():
     """Initialize database with required tables"""
     with get_db_connection() as conn:
@@ -80,5 +157,11 @@ def init_database():
             )
         """)
         
+        # Create scenario tables (kịch bản đang chạy, khôi phục khi khởi động lại)
+        create_scenario_tables(cursor)
+        
+        # Nhật ký graph delta (cập nhật đồ thị từng phần thay vì import lại toàn bộ)
+        create_graph_changelog_table(cursor)
+        
         conn.commit()
         print("✓ Database tables created successfully")
\ No newline at end of file
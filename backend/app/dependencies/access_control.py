@@ -1,10 +1,12 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.services.auth import verify_token
 from app.schemas.auth import TokenData
 
 # Security scheme for JWT Bearer token
 security = HTTPBearer()
+# Không bắt buộc token (endpoint public, chỉ một số tuỳ chọn cần quyền admin)
+optional_security = HTTPBearer(auto_error=False)
 
 
 async def get_current_user(
@@ -44,4 +46,24 @@ async def require_admin(
             detail="Admin access required"
         )
     
-    return current_user
\ No newline at end of file
+    return current_user
+
+
+async def require_admin_for_profiling(
+    profile: bool = Query(False, description="Run the request under the profiler (admin only)"),
+    credentials: HTTPAuthorizationCredentials = Depends(optional_security)
+) -> bool:
+    """
+    Dependency cho tham số profile=1: endpoint vẫn public,
+    nhưng bật profiler thì phải là admin. Trả về có profile hay không.
+    """
+    if not profile:
+        return False
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Profiling requires an admin token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await require_admin(await get_current_user(credentials))
+    return True
@@ -1,9 +1,15 @@
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.config import get_settings
 from app.api import auth
 from app.api import path
 from app.api import scenarios
+from app.api import diagnostics
+from app.services.scheduler import get_scenario_scheduler
+from app.services.pathfinding import get_pathfinding_service
+from app.services.scenario import get_scenario_service
 
 # Uncomment when pathfinding is implemented:
 # from app.api import path
@@ -32,6 +38,34 @@ app.include_router(scenarios.router, prefix = "/api")
 app.include_router(auth.router)
 # Uncomment when pathfinding is implemented:
 app.include_router(path.router)
+app.include_router(diagnostics.router)
+
+def restore_scenarios():
+    """Chờ đồ thị tải xong rồi khôi phục kịch bản đã lưu trong DB"""
+    pf_service = get_pathfinding_service()
+    if pf_service.wait_until_ready():
+        try:
+            get_scenario_service().ensure_restored(pf_service)
+        except Exception as e:
+            print(f"Scenario restore error: {e}")
+
+
+@app.on_event("startup")
+async def warm_up_graphs():
+    # Tải đồ thị ở thread nền ngay khi khởi động, không đợi request đầu tiên
+    get_pathfinding_service().start_background_load()
+    threading.Thread(target=restore_scenarios, name="scenario-restore", daemon=True).start()
+
+
+@app.on_event("startup")
+async def start_scenario_scheduler():
+    get_scenario_scheduler().start()
+
+
+@app.on_event("shutdown")
+async def stop_scenario_scheduler():
+    get_scenario_scheduler().stop()
+
 
 # Root endpoint
 @app.get("/")
@@ -49,6 +83,20 @@ async def health_check():
     return {"status": "healthy"}
 
 
+# Readiness endpoint (đồ thị đã tải xong chưa). Các phương tiện dùng chung một base nên cùng
+# ready một lượt; graphs[*].progress cho biết bảng nào đang được đọc
+@app.get("/ready")
+async def readiness_check():
+    readiness = get_pathfinding_service().readiness()
+    # Kịch bản đã lưu cũng phải khôi phục xong thì trọng số mới đúng
+    readiness["scenarios_restored"] = get_scenario_service().restored.is_set()
+    readiness["ready"] = readiness["ready"] and readiness["scenarios_restored"]
+    return JSONResponse(
+        status_code=200 if readiness["ready"] else 503,
+        content={"status": "ready" if readiness["ready"] else "loading", **readiness}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,131 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class Waypoint(BaseModel):
+    """Điểm dừng (toạ độ pixel)"""
+    x: float = Field(..., ge=0, le=settings.MAP_WIDTH)
+    y: float = Field(..., ge=0, le=settings.MAP_HEIGHT)
+
+
+class MultiStopRequest(BaseModel):
+    """Yêu cầu tìm đường qua nhiều điểm dừng"""
+    waypoints: List[Waypoint] = Field(..., min_length=2, max_length=50)
+    vehicle: str = "foot"
+    speed: float = 1.0
+    optimize: bool = True      # False = đi đúng thứ tự gửi lên
+    fixed_start: bool = True   # Giữ điểm đầu tiên làm điểm xuất phát
+    fixed_end: bool = False    # Giữ điểm cuối cùng làm điểm kết thúc
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "waypoints": [{"x": 1200, "y": 3400}, {"x": 2500, "y": 4100}, {"x": 1800, "y": 5200}],
+                "vehicle": "car",
+                "speed": 8.0,
+                "optimize": True,
+                "fixed_start": True,
+                "fixed_end": False
+            }
+        }
+
+
+class RouteSubscriptionRequest(BaseModel):
+    """Route hiện tại của client gửi qua WebSocket /api/path/subscribe (gửi lại để đổi route)"""
+    start_x: float = Field(..., ge=0, le=settings.MAP_WIDTH)
+    start_y: float = Field(..., ge=0, le=settings.MAP_HEIGHT)
+    end_x: float = Field(..., ge=0, le=settings.MAP_WIDTH)
+    end_y: float = Field(..., ge=0, le=settings.MAP_HEIGHT)
+    vehicle: str = "foot"
+    speed: float = 1.0
+
+
+class ODPair(BaseModel):
+    """Một cặp điểm đi - đến (toạ độ pixel)"""
+    start_x: float = Field(..., ge=0, le=settings.MAP_WIDTH)
+    start_y: float = Field(..., ge=0, le=settings.MAP_HEIGHT)
+    end_x: float = Field(..., ge=0, le=settings.MAP_WIDTH)
+    end_y: float = Field(..., ge=0, le=settings.MAP_HEIGHT)
+    id: Optional[str] = None  # Khóa của phía client, trả lại nguyên vẹn trong kết quả
+
+
+class BatchRouteRequest(BaseModel):
+    """Yêu cầu tìm đường hàng loạt (kết quả trả về dạng NDJSON)"""
+    pairs: List[ODPair] = Field(..., min_length=1, max_length=settings.batch_max_pairs)
+    vehicle: str = "foot"
+    speed: float = 1.0
+    include_path: bool = True  # False = chỉ trả distance/cost/nodes
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "pairs": [
+                    {"id": "a", "start_x": 1200, "start_y": 3400, "end_x": 2500, "end_y": 4100},
+                    {"id": "b", "start_x": 1800, "start_y": 5200, "end_x": 2500, "end_y": 4100}
+                ],
+                "vehicle": "car",
+                "speed": 8.0,
+                "include_path": False
+            }
+        }
+
+
+class DeltaNode(BaseModel):
+    """Node thêm vào bảng nodes_{vehicle} (toạ độ pixel như rawprocessing, chưa lật trục Y)"""
+    id: int
+    x: float
+    y: float
+
+
+class DeltaEdgeRef(BaseModel):
+    u: int
+    v: int
+
+
+class DeltaEdge(DeltaEdgeRef):
+    """Cạnh thêm vào edges_{vehicle}; weight bỏ trống = độ dài đoạn thẳng giữa hai node"""
+    weight: Optional[float] = Field(None, gt=0)
+    road_class: Optional[str] = None  # tag highway của OSM
+    maxspeed: Optional[float] = Field(None, gt=0)
+
+
+class DeltaWeight(DeltaEdgeRef):
+    weight: float = Field(..., gt=0)
+
+
+class ProfileDelta(BaseModel):
+    """Thay đổi của một phương tiện; áp theo thứ tự remove_edges, remove_nodes, add_nodes, add_edges, set_weights"""
+    remove_edges: List[DeltaEdgeRef] = []
+    remove_nodes: List[int] = []  # cạnh nối vào node bị xoá theo
+    add_nodes: List[DeltaNode] = []
+    add_edges: List[DeltaEdge] = []
+    set_weights: List[DeltaWeight] = []
+
+
+class GraphDeltaRequest(BaseModel):
+    """Cập nhật đồ thị từng phần (POST /api/path/delta)"""
+    description: str = ""
+    base_version: Optional[int] = None  # version changelog delta được soạn trên; đã cũ -> 409
+    changes: Dict[str, ProfileDelta] = Field(..., min_length=1)
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "description": "Open the new bridge, close the old ramp",
+                "base_version": 3,
+                "changes": {
+                    "car": {
+                        "remove_edges": [{"u": 120, "v": 121}],
+                        "add_nodes": [{"id": 90001, "x": 2410.5, "y": 3380.0}],
+                        "add_edges": [
+                            {"u": 118, "v": 90001, "road_class": "primary"},
+                            {"u": 90001, "v": 118, "road_class": "primary"}
+                        ],
+                        "set_weights": [{"u": 121, "v": 122, "weight": 35.0}]
+                    }
+                }
+            }
+        }
@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Literal, List, Optional
+from datetime import datetime, timezone
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Any, Dict, Literal, List, Optional
 
 # --- Phần Base (Cốt lõi) ---
 class Point(BaseModel):
@@ -14,6 +15,22 @@ class ScenarioRequest(BaseModel):
     line_end: Point
     penalty_weight: float
     threshold: float = 50.0
+    # Khung thời gian hiệu lực (None = không giới hạn). Thời gian không có múi giờ được hiểu là UTC
+    starts_at: Optional[datetime] = None
+    ends_at: Optional[datetime] = None
+
+    @field_validator("starts_at", "ends_at")
+    @classmethod
+    def normalize_timezone(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+    @model_validator(mode="after")
+    def check_time_window(self):
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            raise ValueError("ends_at must be after starts_at")
+        return self
 
     class Config:
         json_schema_extra = {
@@ -22,15 +39,36 @@ class ScenarioRequest(BaseModel):
                 "line_start": {"lat": 21.0, "lng": 105.8},
                 "line_end": {"lat": 21.1, "lng": 105.9},
                 "penalty_weight": 50.0,
-                "threshold": 50.0
+                "threshold": 50.0,
+                "starts_at": "2025-01-01T07:00:00Z",
+                "ends_at": "2025-01-01T09:00:00Z"
             }
         }
 
+class ScenarioPatch(BaseModel):
+    """Di chuyển / đổi hình dạng kịch bản đang chạy (chỉ gửi các trường cần đổi)"""
+    line_start: Optional[Point] = None
+    line_end: Optional[Point] = None
+    threshold: Optional[float] = None
+    penalty_weight: Optional[float] = None
+
+class ScenarioPatchResponse(BaseModel):
+    """Kết quả cập nhật: số cạnh thêm/gỡ/giữ nguyên so với tập cạnh cũ"""
+    message: str
+    affected_edges: int
+    added_edges: int
+    removed_edges: int
+    kept_edges: int
+    active: bool
+    weight_epoch: int
+
 class ScenarioResponse(BaseModel):
     """Dữ liệu trả về sau khi tạo xong"""
     message: str
     affected_edges: int
     scenario_type: str
+    active: bool = True  # False nếu kịch bản chưa tới giờ bắt đầu
+    profile: Optional[Dict[str, Any]] = None  # Báo cáo cProfile (chỉ khi profile=1)
 
 # --- Phần Mở rộng (Để hiển thị list trên Admin UI) ---
 class ScenarioItem(ScenarioRequest):
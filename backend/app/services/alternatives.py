@@ -0,0 +1,155 @@
+"""
+Alternative Routes Service
+Computes K diverse routes from one forward and one backward shortest-path tree (plateau method)
+"""
+from typing import List, Tuple, Dict, Any, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def _path_edges(path: List[int]) -> List[Tuple[int, int]]:
+    return list(zip(path, path[1:]))
+
+
+def _path_weight(edges: List[Tuple[int, int]], graph: Dict) -> float:
+    edge_index, weights = graph['edge_index'], graph['current_weights']
+    return sum(weights[edge_index[e]] for e in edges)
+
+
+def find_alternatives(
+    pathfinding_service,
+    start_x: float,
+    start_y: float,
+    end_x: float,
+    end_y: float,
+    vehicle_type: str,
+    speed: float,
+    k: int = 3,
+    max_overlap: float = 0.7,
+    max_stretch: float = 0.3,
+    min_plateau: float = 0.1
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Tìm tối đa k tuyến đường (tuyến đầu tiên là tối ưu).
+
+    Plateau = chuỗi cạnh nằm trên cả cây xuôi từ start lẫn cây ngược về end.
+    Mỗi plateau a->b cho một tuyến s->a->b->t tối ưu cục bộ trên đoạn plateau.
+    - max_stretch: chi phí tối đa (1+max_stretch) * tối ưu
+    - max_overlap: tỉ lệ chi phí trùng với các tuyến đã chọn không vượt quá ngưỡng
+    - min_plateau: plateau phải dài ít nhất min_plateau * chi phí tối ưu
+    """
+    if vehicle_type not in pathfinding_service.graphs:
+        return None
+
+    pf = pathfinding_service
+    if settings.snap_to_edges:
+        # Giống /path: hai đầu là điểm snap trên cạnh, nối vào đồ thị bằng các nửa cạnh
+        start_snap = pf.snap_to_edge(start_x, start_y, vehicle_type)
+        end_snap = pf.snap_to_edge(end_x, end_y, vehicle_type)
+        if start_snap is None or end_snap is None:
+            return None
+        if pf.separated((start_snap.u, start_snap.v), (end_snap.u, end_snap.v), vehicle_type):
+            return None
+        if pf.direct_leg(start_snap, end_snap, vehicle_type) is not None:
+            # Cùng một đoạn: chỉ trả tuyến tối ưu
+            route = pf.route_between_snaps(start_snap, end_snap, vehicle_type, speed)
+            return [{**route, 'stretch': 1.0, 'overlap': 0.0}] if route is not None else None
+        sources, out_legs = pf.snap_sources(start_snap, vehicle_type, outgoing=True)
+        tails, in_legs = pf.snap_sources(end_snap, vehicle_type, outgoing=False)
+        start_point, end_point = (start_snap.x, start_snap.y), (end_snap.x, end_snap.y)
+    else:
+        start = pf.find_nearest_node(start_x, start_y, vehicle_type)
+        end = pf.find_nearest_node(end_x, end_y, vehicle_type)
+        if start is None or end is None:
+            return None
+        if start == end:
+            return [pf._build_path_payload([start], vehicle_type, speed)]
+        sources, tails = {start: 0.0}, {end: 0.0}
+        out_legs, in_legs = {start: (None, 0.0)}, {end: (None, 0.0)}
+        start_point = end_point = None
+
+    # Một lần tìm xuôi (dừng ở (1+stretch) * tối ưu) và một lần tìm ngược, đều từ nửa cạnh của điểm snap
+    fwd_dist, fwd_parent = pf.dijkstra(sources, vehicle_type, target=tails, stretch=max_stretch)
+    reached = [fwd_dist[n] + tail for n, tail in tails.items() if n in fwd_dist]
+    if not reached:
+        return None
+    optimum = min(reached)
+    limit = optimum * (1 + max_stretch)
+    bwd_dist, bwd_next = pf.dijkstra(tails, vehicle_type, max_cost=limit, reverse=True)
+
+    # Cạnh plateau (u, v): v nhận u làm cha trong cây xuôi và u đi tiếp qua v trong cây ngược
+    plateau_next = {}
+    has_prev = set()
+    for v, u in fwd_parent.items():
+        if bwd_next.get(u) == v and v in bwd_dist:
+            plateau_next[u] = v
+            has_prev.add(v)
+
+    candidates = []
+    for a in plateau_next:
+        if a in has_prev:
+            continue
+        b = a
+        while b in plateau_next:
+            b = plateau_next[b]
+        total = fwd_dist[b] + bwd_dist[b]
+        length = fwd_dist[b] - fwd_dist[a]
+        # Tuyến tối ưu luôn đứng đầu (với điểm snap, plateau của nó chưa chắc dài nhất)
+        optimal = total <= optimum * (1 + 1e-9)
+        if total <= limit and (optimal or length >= min_plateau * optimum):
+            candidates.append((not optimal, -length, total, a, b))
+    candidates.sort()
+
+    graph = pathfinding_service.graphs[vehicle_type]
+    chosen_paths: List[List[int]] = []
+    chosen_edges = set()
+    results = []
+
+    for _, _, total, a, b in candidates:
+        if len(chosen_paths) >= k:
+            break
+
+        # s -> b theo cây xuôi (bao gồm plateau), b -> t theo cây ngược; hai cây dừng ở nửa cạnh snap
+        head = [b]
+        while head[-1] in fwd_parent:
+            head.append(fwd_parent[head[-1]])
+        head.reverse()
+        tail = []
+        node = b
+        while node in bwd_next:
+            node = bwd_next[node]
+            tail.append(node)
+        path = head + tail
+
+        if len(set(path)) != len(path):
+            continue  # Có vòng lặp -> không phải đường đơn
+
+        edges = _path_edges(path)
+        cost = _path_weight(edges, graph)
+        overlap = _path_weight([e for e in edges if e in chosen_edges], graph) / cost if cost else 0
+        if chosen_paths and overlap > max_overlap:
+            continue
+
+        chosen_paths.append(path)
+        chosen_edges.update(edges)
+        payload = pf._build_path_payload(
+            path, vehicle_type, speed, [out_legs[path[0]], in_legs[path[-1]]], start_point, end_point
+        )
+        results.append({
+            **payload,
+            'stretch': round(total / optimum, 4) if optimum else 1.0,
+            'overlap': round(overlap, 4)
+        })
+
+    if not results:
+        # Tuyến tối ưu quá ngắn để thành plateau (vd. hai nửa cạnh gặp nhau ở một node)
+        path = [min((n for n in tails if n in fwd_dist), key=lambda n: fwd_dist[n] + tails[n])]
+        while path[-1] in fwd_parent:
+            path.append(fwd_parent[path[-1]])
+        path.reverse()
+        payload = pf._build_path_payload(
+            path, vehicle_type, speed, [out_legs[path[0]], in_legs[path[-1]]], start_point, end_point
+        )
+        results.append({**payload, 'stretch': 1.0, 'overlap': 0.0})
+    return results
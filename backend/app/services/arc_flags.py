@@ -0,0 +1,303 @@
+"""
+Arc Flags
+Geometric grid partition of each vehicle graph and per-edge cell bitmasks: an edge is
+flagged for cell C if it lies on a shortest path into C. A* towards a goal in C only
+needs to relax edges flagged for C.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+# Mỗi cạnh một số nguyên 64 bit -> tối đa 64 ô
+MAX_CELLS = 64
+
+
+@dataclass
+class ArcFlags:
+    """
+    flags[ei]: bit c bật nếu cạnh ei nằm trên một đường ngắn nhất đi vào ô c.
+    epoch: weight epoch mà flags đúng với nó (None = chưa xác nhận, không được dùng để cắt tỉa).
+    """
+    grid: int
+    bounds: Tuple[float, float, float, float]
+    versions: Dict[str, Optional[str]]
+    flags: array
+    cells: Dict[int, int] = field(default_factory=dict)
+    epoch: Optional[int] = None
+
+    def goal_bits(self, targets: Iterable[int]) -> int:
+        bits = 0
+        for node in targets:
+            cell = self.cells.get(node)
+            if cell is None:
+                return 0  # Node ngoài phân vùng -> không cắt tỉa
+            bits |= 1 << cell
+        return bits
+
+
+def partition(nodes: Dict[int, Tuple[float, float]], grid: int) -> Tuple[Tuple[float, float, float, float], Dict[int, int]]:
+    """Chia bounding box của đồ thị thành grid x grid ô đều; trả về (bounds, node -> ô)"""
+    if grid * grid > MAX_CELLS:
+        raise ValueError(f"Arc flag grid {grid}x{grid} exceeds {MAX_CELLS} cells")
+    if not nodes:
+        return (0.0, 0.0, 0.0, 0.0), {}
+    xs = [x for x, _ in nodes.values()]
+    ys = [y for _, y in nodes.values()]
+    bounds = (min(xs), min(ys), max(xs), max(ys))
+    return bounds, cells_for(nodes, grid, bounds)
+
+
+def cells_for(nodes: Dict[int, Tuple[float, float]], grid: int, bounds: Tuple[float, float, float, float]) -> Dict[int, int]:
+    min_x, min_y, max_x, max_y = bounds
+    width = (max_x - min_x) or 1.0
+    height = (max_y - min_y) or 1.0
+    cells = {}
+    for node, (x, y) in nodes.items():
+        cx = min(grid - 1, max(0, int((x - min_x) / width * grid)))
+        cy = min(grid - 1, max(0, int((y - min_y) / height * grid)))
+        cells[node] = cy * grid + cx
+    return cells
+
+
+def _reverse_tree(graph: Dict, root: int) -> Iterable[int]:
+    """Dijkstra ngược từ root trên trọng số hiện tại; trả về edge id của cây đường ngắn nhất"""
+    rev_adj_list = graph['rev_adj_list']
+    access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+    weights = graph['current_weights']
+    dist = {root: 0.0}
+    parent_edge = {}
+    done = set()
+    heap = [(0.0, root)]
+    while heap:
+        d, node = heapq.heappop(heap)
+        if node in done:
+            continue
+        done.add(node)
+        for neighbor, ei in rev_adj_list.get(node, ()):
+            if not access[ei] & mask or disabled[ei] or neighbor in done:
+                continue
+            nd = d + weights[ei]
+            if nd < dist.get(neighbor, float('inf')):
+                dist[neighbor] = nd
+                parent_edge[neighbor] = ei
+                heapq.heappush(heap, (nd, neighbor))
+    return parent_edge.values()
+
+
+def compute_arc_flags(graph: Dict, cells: Dict[int, int], only_cells: Optional[Set[int]] = None,
+                      previous: Optional[array] = None,
+                      cancelled: Optional[Callable[[], bool]] = None) -> Optional[array]:
+    """
+    Cạnh nằm trọn trong ô c được gắn cờ c. Với mỗi node biên của c (đầu cuối của một cạnh
+    đi từ ô khác vào c), chạy Dijkstra ngược và gắn cờ c cho mọi cạnh của cây đường ngắn nhất.
+    Cạnh bị chặn hoặc phương tiện không được đi không được gắn cờ nào.
+    only_cells + previous: chỉ tính lại các ô này, bit của ô khác lấy từ previous.
+    cancelled(): được hỏi trước mỗi node biên; True -> dừng ngay, trả về None.
+    """
+    access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+    if only_cells is None:
+        flags = array('Q', [0]) * len(graph['edges'])
+    else:
+        wanted = 0
+        for cell in only_cells:
+            wanted |= 1 << cell
+        keep = ~wanted & (1 << MAX_CELLS) - 1
+        # Cạnh thêm sau khi previous được tính (graph delta) bắt đầu không có cờ nào
+        flags = array('Q', (f & keep for f in previous))
+        flags.extend([0] * (len(graph['edges']) - len(flags)))
+    boundary: Dict[int, set] = {}
+    for ei, (u, v) in enumerate(graph['edges']):
+        if not access[ei] & mask or disabled[ei]:
+            continue
+        cu, cv = cells[u], cells[v]
+        if only_cells is not None and cv not in only_cells:
+            continue
+        if cu == cv:
+            flags[ei] |= 1 << cu
+        else:
+            boundary.setdefault(cv, set()).add(v)
+
+    for cell, entries in boundary.items():
+        bit = 1 << cell
+        for node in entries:
+            if cancelled is not None and cancelled():
+                return None
+            for ei in _reverse_tree(graph, node):
+                flags[ei] |= bit
+    return flags
+
+
+def build_arc_flags(graph: Dict, grid: int, versions: Dict[str, Optional[str]]) -> ArcFlags:
+    bounds, cells = partition(graph['nodes'], grid)
+    return ArcFlags(grid, bounds, versions, compute_arc_flags(graph, cells), cells)
+
+
+# --- LƯU / ĐỌC FILE (dựng offline bằng scripts/build_arc_flags.py) ---
+
+def flags_path(vehicle_type: str, directory: str = settings.arc_flags_dir) -> str:
+    return os.path.join(directory, f"{vehicle_type}.flags")
+
+
+def save_arc_flags(flags: ArcFlags, path: str):
+    """Dòng đầu là header JSON, phần còn lại là mảng flags dạng nhị phân"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header = {'grid': flags.grid, 'bounds': list(flags.bounds), 'versions': flags.versions, 'edges': len(flags.flags)}
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(json.dumps(header).encode() + b"\n")
+        flags.flags.tofile(f)
+    os.replace(tmp, path)
+
+
+def load_arc_flags(path: str, graph: Dict, versions: Dict[str, Optional[str]]) -> Optional[ArcFlags]:
+    """None nếu chưa có file hoặc file dựng cho phiên bản đồ thị khác"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        if header['versions'] != versions or header['edges'] != len(graph['edges']):
+            print(f"⚠️ [RAM] Arc flags {path} were built for another graph version, ignored.")
+            return None
+        flags = array('Q')
+        flags.fromfile(f, header['edges'])
+    bounds = tuple(header['bounds'])
+    return ArcFlags(header['grid'], bounds, versions, flags, cells_for(graph['nodes'], header['grid'], bounds))
+
+
+class ArcFlagUpdater:
+    """
+    Giữ arc flags đúng với trọng số hiện tại. Flags chỉ được dùng khi epoch của nó trùng weight epoch;
+    trong lúc flags cũ, search chạy không cắt tỉa.
+    Mọi việc nặng chạy ở thread nền: nếu đồ thị trở về trạng thái gốc (không còn kịch bản) thì flags
+    dựng offline dùng lại ngay. Nếu bật recompute: cạnh chỉ đắt lên / bị đóng thì chỉ tính lại các ô
+    có cờ trên cạnh đó (cây đường ngắn nhất của ô khác không đi qua cạnh này nên không đổi); cạnh rẻ đi
+    có thể kéo cây của bất kỳ ô nào nên tính lại toàn bộ. Weight epoch được kiểm tra trước mỗi node biên,
+    trọng số đổi giữa chừng thì bỏ ngay lượt tính dở.
+    """
+
+    def __init__(self, pathfinding_service, recompute: bool = settings.arc_flags_recompute):
+        self.pf = pathfinding_service
+        self.recompute = recompute
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Ô cần tính lại theo phương tiện; None = mọi ô
+        self._dirty: Dict[str, Optional[Set[int]]] = {}
+        self.counters = {
+            'recomputes': 0, 'partial_recomputes': 0, 'cancelled_recomputes': 0,
+            'pruned_searches': 0, 'unpruned_searches': 0
+        }
+        self.last_recompute_seconds: Optional[float] = None
+
+        pathfinding_service.add_weight_listener(self._on_weight_change)
+
+    def _on_weight_change(self, epoch: int, changes: Optional[Dict[str, Dict[str, set]]]):
+        """Chạy trên đường áp dụng kịch bản: chỉ ghi lại ô bị ảnh hưởng rồi đánh thức thread nền"""
+        with self._lock:
+            for v_type, graph in self.pf._graphs.items():
+                flags = graph.get('arc_flags')
+                if flags is None:
+                    continue
+                if changes is None or changes.get(v_type, {}).get('lowered'):
+                    self._dirty[v_type] = None
+                elif v_type in changes and self._dirty.get(v_type, set()) is not None:
+                    bits = 0
+                    for ei in changes[v_type]['raised']:
+                        bits |= flags.flags[ei] if ei < len(flags.flags) else 0
+                    dirty = self._dirty.setdefault(v_type, set())
+                    dirty.update(cell for cell in range(MAX_CELLS) if bits >> cell & 1)
+        self._ensure_worker()
+        self._wake.set()
+
+    def usable(self, graph: Dict) -> Optional[ArcFlags]:
+        """Flags dùng được cho search hiện tại (None = tìm không cắt tỉa)"""
+        flags = graph.get('arc_flags')
+        if flags is None:
+            return None
+        if flags.epoch == self.pf.weight_epoch:
+            self.counters['pruned_searches'] += 1
+            return flags
+        self.counters['unpruned_searches'] += 1
+        return None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="arc-flags", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            try:
+                self._recompute_stale()
+            except Exception as e:
+                print(f"❌ Arc flag recompute failed: {e}")
+
+    def _recompute_stale(self):
+        """Dùng lại flags gốc nếu trọng số đã về gốc; không thì (nếu bật) tính lại các ô bị ảnh hưởng"""
+        pf = self.pf
+        with pf.pinned() as graphs:
+            # Lấy epoch TRƯỚC khi xét: trọng số đổi giữa chừng -> kết quả bỏ đi, listener đã đánh dấu lại
+            epoch = pf.weight_epoch
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+            started = time.perf_counter()
+            for v_type, graph in graphs.items():
+                flags = graph.get('arc_flags')
+                if flags is None or flags.epoch == epoch:
+                    continue
+                pristine = graph.get('arc_flags_pristine')
+                if pristine is not None and not graph['closed_edges'] \
+                        and graph['current_weights'] == graph['original_weights']:
+                    pristine.epoch = epoch
+                    graph['arc_flags'] = pristine
+                    continue
+                if not self.recompute:
+                    continue
+                cells = dirty.get(v_type, set())
+                if cells is not None and not cells:
+                    # Không ô nào bị ảnh hưởng: flags cũ vẫn đúng với trọng số hiện tại
+                    flags.epoch = epoch
+                    continue
+                fresh = compute_arc_flags(
+                    graph, flags.cells, cells, flags.flags, cancelled=lambda: pf.weight_epoch != epoch
+                )
+                # Kiểm tra lại sau lượt tính: thay đổi tới sau node biên cuối cũng làm kết quả cũ
+                if fresh is None or pf.weight_epoch != epoch:
+                    self.counters['cancelled_recomputes'] += 1
+                    with self._lock:
+                        # Trả lại phần chưa tính để lượt sau tính cùng thay đổi mới
+                        for name, pending in dirty.items():
+                            current = self._dirty.get(name, set())
+                            self._dirty[name] = None if pending is None or current is None else current | pending
+                    break
+                graph['arc_flags'] = ArcFlags(flags.grid, flags.bounds, flags.versions, fresh, flags.cells, epoch)
+                self.counters['partial_recomputes' if cells is not None else 'recomputes'] += 1
+            self.last_recompute_seconds = round(time.perf_counter() - started, 3)
+        if pf.weight_epoch != epoch:
+            self._wake.set()
+
+    def stats(self) -> Dict:
+        graphs = self.pf.graphs
+        return {
+            'profiles': {
+                v_type: None if graph.get('arc_flags') is None else {
+                    'grid': graph['arc_flags'].grid,
+                    'valid': graph['arc_flags'].epoch == self.pf.weight_epoch
+                }
+                for v_type, graph in graphs.items()
+            },
+            'last_recompute_seconds': self.last_recompute_seconds,
+            **self.counters
+        }
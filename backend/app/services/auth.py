@@ -1,15 +1,24 @@
+import hashlib
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.config import get_settings
 from app.database import get_db_connection
+from app.services.workers import get_auth_pool
 
 settings = get_settings()
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 
+# Cache access token đã verify: sha256(token) -> (payload, hết hạn lúc)
+_token_cache: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -49,8 +58,8 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
-def verify_token(token: str, expected_type: str = "access") -> dict | None:
-    """Verify and decode JWT token"""
+def _decode_token(token: str, expected_type: str) -> tuple[dict, float] | None:
+    """Decode JWT, trả về (payload, exp timestamp)"""
     try:
         payload = jwt.decode(
             token, 
@@ -68,12 +77,41 @@ def verify_token(token: str, expected_type: str = "access") -> dict | None:
         if username is None:
             return None
         
-        return {"username": username, "role": role}
+        return {"username": username, "role": role}, float(payload.get("exp", 0))
     
     except JWTError:
         return None
 
 
+def verify_token(token: str, expected_type: str = "access") -> dict | None:
+    """Verify and decode JWT token (access token được cache theo hash)"""
+    if expected_type != "access" or settings.token_cache_ttl_seconds <= 0:
+        decoded = _decode_token(token, expected_type)
+        return decoded[0] if decoded else None
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            if cached[1] > now:
+                _token_cache.move_to_end(key)
+                return dict(cached[0])
+            del _token_cache[key]
+
+    decoded = _decode_token(token, expected_type)
+    if decoded is None:
+        return None
+
+    payload, exp = decoded
+    expires_at = min(exp, now + settings.token_cache_ttl_seconds)
+    with _token_cache_lock:
+        _token_cache[key] = (payload, expires_at)
+        while len(_token_cache) > settings.token_cache_max_entries:
+            _token_cache.popitem(last=False)
+    return dict(payload)
+
+
 def authenticate_user(username: str, password: str) -> dict | None:
     """Authenticate user against database"""
     with get_db_connection() as conn:
@@ -96,6 +134,11 @@ def authenticate_user(username: str, password: str) -> dict | None:
         }
 
 
+async def authenticate_user_async(username: str, password: str) -> dict | None:
+    """Chạy authenticate_user (SQLite + pbkdf2) trong auth worker pool"""
+    return await get_auth_pool().run(authenticate_user, username, password)
+
+
 def create_admin_user(username: str, password: str, role: str = "admin"):
     """Create a new admin user"""
     hashed_password = get_password_hash(password)
@@ -0,0 +1,98 @@
+"""
+Batch Route Service
+Snaps all OD pairs in one pass, routes them in parallel on the routing pool and
+yields one NDJSON line per pair as soon as it is ready
+"""
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional
+from app.config import get_settings
+from app.services.spatial import EdgeSnap
+
+settings = get_settings()
+
+
+def _route_one(pathfinding_service, graphs, pair, start_snap: Optional[EdgeSnap], end_snap: Optional[EdgeSnap],
+               vehicle_type: str, speed: float, include_path: bool) -> Dict:
+    """Tính một cặp OD trên thế hệ đồ thị của batch; lỗi được trả về trong dòng kết quả"""
+    line = {'id': pair.id}
+    try:
+        with pathfinding_service.pinned(graphs):
+            if not settings.snap_to_edges:
+                result = pathfinding_service.find_path(
+                    pair.start_x, pair.start_y, pair.end_x, pair.end_y, vehicle_type, speed
+                )
+            elif start_snap is None or end_snap is None:
+                line['error'] = "No road near the start or end point"
+                return line
+            else:
+                # Batch không được làm lệch thống kê đích nóng của /path
+                result = pathfinding_service.route_snapped(start_snap, end_snap, vehicle_type, speed, count_hit=False)
+    except Exception as e:
+        line['error'] = f"Routing failed: {e}"
+        return line
+
+    if result is None:
+        line['error'] = "No path found between the specified points"
+    elif include_path:
+        line['route'] = result
+    else:
+        line['route'] = {k: result[k] for k in ('distance', 'cost', 'nodes')}
+    return line
+
+
+async def stream_batch_routes(
+    pathfinding_service,
+    pool,
+    pairs: List,
+    vehicle_type: str,
+    speed: float,
+    include_path: bool = True,
+    max_in_flight: int = settings.batch_max_in_flight
+) -> AsyncIterator[str]:
+    """
+    Sinh từng dòng NDJSON theo thứ tự hoàn thành (mỗi dòng có 'index' của cặp OD).
+    Chỉ tối đa max_in_flight cặp đang tính cùng lúc nên kết quả không dồn lại trong bộ nhớ;
+    danh sách cặp và snap thì tỉ lệ với batch (giới hạn bởi batch_max_pairs).
+    Dòng cuối cùng là {'summary': {...}}.
+    """
+    n = len(pairs)
+    ok = failed = 0
+    pending = set()
+
+    # Cả batch dùng chung một thế hệ đồ thị (reload giữa chừng không làm lệch snap)
+    with pathfinding_service.lease() as graphs:
+        def snap_all():
+            with pathfinding_service.pinned(graphs):
+                points = [(p.start_x, p.start_y) for p in pairs] + [(p.end_x, p.end_y) for p in pairs]
+                return pathfinding_service.snap_many(points, vehicle_type)
+
+        snaps = await pool.run(snap_all) if settings.snap_to_edges else [None] * (2 * n)
+
+        async def run(i: int):
+            line = await pool.run(
+                _route_one, pathfinding_service, graphs, pairs[i], snaps[i], snaps[n + i],
+                vehicle_type, speed, include_path
+            )
+            return i, line
+
+        next_index = 0
+        try:
+            while next_index < n or pending:
+                while next_index < n and len(pending) < max_in_flight:
+                    pending.add(asyncio.ensure_future(run(next_index)))
+                    next_index += 1
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    i, line = task.result()
+                    if 'error' in line:
+                        failed += 1
+                    else:
+                        ok += 1
+                    yield json.dumps({'index': i, **line}) + "\n"
+        finally:
+            # Client ngắt kết nối: bỏ các cặp chưa tính
+            for task in pending:
+                task.cancel()
+
+    yield json.dumps({'summary': {'count': n, 'ok': ok, 'failed': failed}}) + "\n"
@@ -0,0 +1,50 @@
+"""
+Request Coalescing
+Single-flight: concurrent identical queries share one computation
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Mỗi khóa chỉ có một tác vụ đang chạy; request trùng khóa chờ chung kết quả.
+    Tác vụ không bị hủy khi request đầu tiên ngắt kết nối (các request còn lại vẫn chờ được).
+    Chỉ dùng trong event loop (không cần lock).
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.counters = {'leaders': 0, 'coalesced': 0}
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+            self.counters['leaders'] += 1
+        else:
+            self.counters['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Tránh cảnh báo "exception was never retrieved" khi mọi request đã ngắt
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {'in_flight': len(self._in_flight), **self.counters}
+
+
+# Singleton Instance
+_route_flights = None
+
+def get_route_flights() -> SingleFlight:
+    """Single-flight cho /api/path, khóa theo (điểm snap đầu, điểm snap cuối, phương tiện, epoch)"""
+    global _route_flights
+    if _route_flights is None:
+        _route_flights = SingleFlight()
+    return _route_flights
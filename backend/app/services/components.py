@@ -0,0 +1,139 @@
+"""
+Component Index
+Weakly connected component labels over the open edges of one vehicle profile,
+updated incrementally when edges are closed or reopened
+"""
+from typing import Dict, Iterable, List, Optional
+
+
+class ComponentIndex:
+    """
+    labels[node] = nhãn thành phần liên thông yếu (bỏ qua chiều cạnh) trên các cạnh đang mở.
+    Khác nhãn => chắc chắn không có đường đi (cùng nhãn chưa chắc có, vì đồ thị có hướng).
+    """
+
+    def __init__(self, graph: Dict):
+        self.graph = graph
+        self.labels: Dict[int, int] = {}
+        self.sizes: Dict[int, int] = {}
+        self._next_label = 0
+
+    def clone(self, graph: Dict) -> "ComponentIndex":
+        """Bản sao nhãn gắn với một thế hệ đồ thị mới (cập nhật tiếp bằng on_closed / on_opened)"""
+        index = ComponentIndex(graph)
+        index.labels = dict(self.labels)
+        index.sizes = dict(self.sizes)
+        index._next_label = self._next_label
+        return index
+
+    def _is_open(self, ei: int) -> bool:
+        return bool(self.graph['access'][ei] & self.graph['mask']) and not self.graph['disabled'][ei]
+
+    def _flood(self, start: int, label: int, within: Optional[int] = None, assigned: Optional[Dict[int, int]] = None) -> Dict[int, int]:
+        """
+        BFS qua cạnh mở (cả hai chiều) từ start, gán nhãn label.
+        within: chỉ đi qua các node đang mang nhãn này.
+        """
+        graph = self.graph
+        adj_list, rev_adj_list = graph['adj_list'], graph['rev_adj_list']
+        labels = self.labels
+        assigned = {} if assigned is None else assigned
+        assigned[start] = label
+        queue = [start]
+        while queue:
+            node = queue.pop()
+            for adjacency in (adj_list.get(node, ()), rev_adj_list.get(node, ())):
+                for neighbor, ei in adjacency:
+                    if neighbor in assigned or not self._is_open(ei):
+                        continue
+                    if within is not None and labels.get(neighbor) != within:
+                        continue
+                    assigned[neighbor] = label
+                    queue.append(neighbor)
+        return assigned
+
+    def _new_label(self) -> int:
+        self._next_label += 1
+        return self._next_label
+
+    def build(self) -> "ComponentIndex":
+        """Gán nhãn toàn bộ (lúc tải đồ thị). Node không có cạnh mở nào không có nhãn"""
+        labels: Dict[int, int] = {}
+        sizes: Dict[int, int] = {}
+        for node, adjacency in self.graph['adj_list'].items():
+            if node in labels:
+                continue
+            if not any(self._is_open(ei) for _, ei in adjacency) and \
+                    not any(self._is_open(ei) for _, ei in self.graph['rev_adj_list'].get(node, ())):
+                continue
+            label = self._new_label()
+            before = len(labels)
+            self._flood(node, label, assigned=labels)
+            sizes[label] = len(labels) - before
+        self.labels, self.sizes = labels, sizes
+        return self
+
+    def on_closed(self, edges: Iterable[int]):
+        """
+        Cạnh vừa bị đóng: chỉ các thành phần chứa cạnh đó có thể bị tách.
+        Mỗi mảnh sau khi tách đều chứa một đầu mút của cạnh bị đóng -> flood lại từ các đầu mút.
+        """
+        endpoints: List[int] = []
+        for ei in edges:
+            endpoints.extend(self.graph['edges'][ei])
+        assigned: Dict[int, int] = {}
+        new_sizes: Dict[int, int] = {}
+        touched = set()
+        for node in endpoints:
+            old = self.labels.get(node)
+            if old is None or node in assigned:
+                continue
+            touched.add(old)
+            label = self._new_label()
+            before = len(assigned)
+            self._flood(node, label, within=old, assigned=assigned)
+            new_sizes[label] = len(assigned) - before
+        self._publish(assigned, new_sizes, touched)
+
+    def on_opened(self, edges: Iterable[int]):
+        """Cạnh vừa được mở lại: gộp hai thành phần, đổi nhãn thành phần nhỏ hơn"""
+        for ei in edges:
+            u, v = self.graph['edges'][ei]
+            lu, lv = self.labels.get(u), self.labels.get(v)
+            if lu is not None and lu == lv:
+                continue
+            if lu is None and lv is None:
+                # Hai node trước đó không có cạnh mở nào -> thành phần mới gồm 2 node
+                label = self._new_label()
+                self._publish({u: label, v: label}, {label: 2}, set())
+                continue
+            # Node chưa có nhãn coi như thành phần kích thước 0
+            big, small_node = (lu, v) if self.sizes.get(lu, 0) >= self.sizes.get(lv, 0) else (lv, u)
+            small = self.labels.get(small_node)
+            assigned = self._flood(small_node, big, within=small) if small is not None else {small_node: big}
+            sizes = {big: self.sizes.get(big, 0) + len(assigned)}
+            self._publish(assigned, sizes, {small} if small is not None else set())
+
+    def _publish(self, assigned: Dict[int, int], sizes: Dict[int, int], retired: set):
+        """Ghi nhãn mới một lượt (dict.update) để query đọc song song không thấy trạng thái dở"""
+        self.labels.update(assigned)
+        for label in retired:
+            if label not in sizes:
+                self.sizes.pop(label, None)
+        self.sizes.update(sizes)
+
+    def forget(self, nodes: Iterable[int]):
+        """Bỏ nhãn của các node đã bị xoá khỏi đồ thị (không còn cạnh mở nào)"""
+        for node in nodes:
+            label = self.labels.pop(node, None)
+            if label is None:
+                continue
+            self.sizes[label] -= 1
+            if not self.sizes[label]:
+                del self.sizes[label]
+
+    def label(self, node: int) -> Optional[int]:
+        return self.labels.get(node)
+
+    def count(self) -> int:
+        return len(self.sizes)
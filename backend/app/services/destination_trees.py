@@ -0,0 +1,268 @@
+"""
+Destination Tree Cache
+Reverse shortest-path trees for frequently requested goals: a query to a hot
+destination is a walk along next-hop pointers from the snapped start, with no search
+"""
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from app.config import get_settings
+from app.services.spatial import EdgeSnap
+
+settings = get_settings()
+
+# Làm tròn vị trí trên cạnh khi gom các truy vấn về cùng một đích
+T_PRECISION = 4
+
+# Ước lượng bộ nhớ cho mỗi node trong cây (2 entry dict + 1 float)
+BYTES_PER_FLOAT = 24
+
+
+@dataclass
+class DestinationTree:
+    """dist[n] = chi phí từ n tới đích, next_hop[n] = node kế tiếp trên đường về đích"""
+    vehicle_type: str
+    snap: EdgeSnap
+    epoch: int
+    version: Optional[str]
+    dist: Dict[int, float] = field(default_factory=dict)
+    next_hop: Dict[int, int] = field(default_factory=dict)
+    in_legs: Dict[int, Tuple[Optional[int], float]] = field(default_factory=dict)
+    size_bytes: int = 0
+
+
+class DestinationTreeCache:
+    """
+    Đếm số lần mỗi đích (điểm snap) được hỏi; đích vượt ngưỡng min_hits được dựng cây ngược
+    ở thread nền.
+    Khi trọng số đổi (weight epoch), chỉ cây bị các cạnh vừa đổi ảnh hưởng bị đánh dấu cũ và
+    được dựng lại nền; trong lúc đó truy vấn quay về A* thường. Tổng bộ nhớ các cây không vượt quá memory_mb.
+    """
+
+    def __init__(
+        self,
+        pathfinding_service,
+        min_hits: int = settings.dest_tree_min_hits,
+        decay_every: int = settings.dest_tree_decay_every,
+        memory_mb: float = settings.dest_tree_memory_mb
+    ):
+        self.pf = pathfinding_service
+        self.min_hits = min_hits
+        self.decay_every = decay_every
+        self.memory_budget = int(memory_mb * 1024 * 1024)
+
+        self._lock = threading.Lock()
+        self._hits: Dict[Tuple, float] = {}
+        self._snaps: Dict[Tuple, EdgeSnap] = {}
+        self._trees: Dict[Tuple, DestinationTree] = {}
+        self._pending = set()  # Các đích cần dựng (lại) cây
+        self._queries = 0
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.counters = {'served': 0, 'stale': 0, 'builds': 0, 'evictions': 0, 'kept': 0, 'invalidated': 0}
+
+        pathfinding_service.add_weight_listener(self._on_weight_change)
+
+    @staticmethod
+    def _key(vehicle_type: str, snap: EdgeSnap) -> Tuple:
+        return vehicle_type, snap.u, snap.v, round(snap.t, T_PRECISION)
+
+    def _on_weight_change(self, epoch: int, changes: Optional[Dict[str, Dict[str, set]]]):
+        """
+        Trọng số đổi: cây không bị ảnh hưởng được đóng dấu epoch mới ngay,
+        các cây còn lại dựng lại ở nền (không chặn người gọi)
+        """
+        with self._lock:
+            if not self._trees:
+                return
+            stale = []
+            for key, tree in self._trees.items():
+                if changes is not None and tree.epoch == epoch - 1 and \
+                        not self._affected(tree, changes.get(tree.vehicle_type)):
+                    tree.epoch = epoch
+                    self.counters['kept'] += 1
+                else:
+                    stale.append(key)
+            self.counters['invalidated'] += len(stale)
+            self._pending.update(stale)
+        if stale:
+            self._wake.set()
+
+    def _affected(self, tree: DestinationTree, change: Optional[Dict[str, set]]) -> bool:
+        """
+        Cây (dist = chi phí tới đích) vẫn đúng nếu không cạnh nào của cây đắt lên và không cạnh
+        rẻ đi (u, v) nào làm w(u, v) + dist[v] < dist[u]: khi đó dist vẫn là thế vị hợp lệ
+        nên không đường nào tốt hơn xuất hiện.
+        """
+        if not change:
+            return False
+        graph = self.pf.graphs[tree.vehicle_type]
+        if graph['version'] != tree.version:
+            return True
+        edges, weights = graph['edges'], graph['current_weights']
+        leg_edges = {ei for ei, _ in tree.in_legs.values()}
+        dist, next_hop = tree.dist, tree.next_hop
+        for ei in change['raised']:
+            u, v = edges[ei]
+            if ei in leg_edges or next_hop.get(u) == v:
+                return True
+        for ei in change['lowered']:
+            u, v = edges[ei]
+            if ei in leg_edges:
+                return True
+            dv = dist.get(v)
+            if dv is not None and weights[ei] + dv < dist.get(u, float('inf')):
+                return True
+        return False
+
+    def _record_hit(self, key: Tuple, snap: EdgeSnap):
+        promote = False
+        with self._lock:
+            self._queries += 1
+            if self._queries % self.decay_every == 0:
+                self._decay()
+            count = self._hits.get(key, 0) + 1
+            self._hits[key] = count
+            if count >= self.min_hits and key not in self._trees and key not in self._pending:
+                self._snaps[key] = snap
+                self._pending.add(key)
+                promote = True
+        if promote:
+            self._ensure_worker()
+            self._wake.set()
+
+    def _decay(self):
+        """Giảm một nửa số đếm; đích không còn được hỏi thì bỏ luôn cây của nó"""
+        self._hits = {k: c / 2 for k, c in self._hits.items() if c / 2 >= 1}
+        for key in [k for k in self._trees if k not in self._hits]:
+            del self._trees[key]
+            self._snaps.pop(key, None)
+            self._pending.discard(key)
+
+    def route(self, start_snap: EdgeSnap, end_snap: EdgeSnap, vehicle_type: str, speed: float,
+              count_hit: bool = True) -> Optional[Dict]:
+        """
+        Trả về payload nếu đích có cây còn mới, None nếu cần tìm kiếm thường.
+        count_hit=False: không ghi nhận lượt hỏi (batch, tính lại nền không phản ánh đích nóng)
+        """
+        key = self._key(vehicle_type, end_snap)
+        if count_hit:
+            self._record_hit(key, end_snap)
+
+        pf = self.pf
+        tree = self._trees.get(key)
+        if tree is None:
+            return None
+        graph = pf.graphs[vehicle_type]
+        if tree.epoch != pf.weight_epoch or tree.version != graph['version']:
+            self.counters['stale'] += 1
+            return None
+
+        sources, out_legs = pf.snap_sources(start_snap, vehicle_type, outgoing=True)
+        best_node, best_cost = None, float('inf')
+        for node, head in sources.items():
+            d = tree.dist.get(node)
+            if d is not None and head + d < best_cost:
+                best_node, best_cost = node, head + d
+
+        start_point = (start_snap.x, start_snap.y)
+        end_point = (end_snap.x, end_snap.y)
+        direct = pf.direct_leg(start_snap, end_snap, vehicle_type)
+        if direct is not None and graph['current_weights'][direct[0]] * direct[1] <= best_cost:
+            self.counters['served'] += 1
+            return pf._build_path_payload([], vehicle_type, speed, [direct], start_point, end_point)
+        if best_node is None:
+            return None
+
+        path = [best_node]
+        while path[-1] in tree.next_hop:
+            path.append(tree.next_hop[path[-1]])
+        self.counters['served'] += 1
+        partial_edges = [out_legs[path[0]], tree.in_legs[path[-1]]]
+        return pf._build_path_payload(path, vehicle_type, speed, partial_edges, start_point, end_point)
+
+    # --- DỰNG CÂY Ở THREAD NỀN ---
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="destination-trees", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    # Đích nóng nhất được dựng trước
+                    key = max(self._pending, key=lambda k: self._hits.get(k, 0))
+                    self._pending.discard(key)
+                    snap = self._snaps.get(key)
+                if snap is None:
+                    continue
+                try:
+                    tree = self._build(key[0], snap)
+                except Exception as e:
+                    print(f"❌ Destination tree build failed: {e}")
+                    continue
+                self._store(key, tree)
+
+    def _build(self, vehicle_type: str, snap: EdgeSnap) -> Optional[DestinationTree]:
+        """Dijkstra ngược một lần từ điểm đích ảo trên toàn đồ thị"""
+        pf = self.pf
+        if not pf.is_ready(vehicle_type):
+            return None
+        with pf.pinned() as graphs:
+            # Lấy epoch TRƯỚC khi tìm: trọng số đổi giữa chừng -> cây bị coi là cũ
+            epoch = pf.weight_epoch
+            sources, in_legs = pf.snap_sources(snap, vehicle_type, outgoing=False)
+            if not in_legs:
+                return None  # Cạnh không còn tồn tại (đồ thị đã reload)
+            dist, next_hop = pf.dijkstra(sources, vehicle_type, reverse=True)
+            version = graphs[vehicle_type]['version']
+
+        tree = DestinationTree(vehicle_type, snap, epoch, version, dist, next_hop, in_legs)
+        tree.size_bytes = sys.getsizeof(dist) + sys.getsizeof(next_hop) + BYTES_PER_FLOAT * len(dist)
+        self.counters['builds'] += 1
+        return tree
+
+    def _store(self, key: Tuple, tree: Optional[DestinationTree]):
+        with self._lock:
+            if key not in self._snaps:
+                return  # Đã bị bỏ (decay) trong lúc dựng
+            if tree is None:
+                self._trees.pop(key, None)
+                self._snaps.pop(key, None)
+                self._hits.pop(key, None)
+                return
+            self._trees[key] = tree
+            if tree.epoch != self.pf.weight_epoch:
+                # Trọng số đổi trong lúc dựng -> dựng lại (worker còn chạy tới khi hết pending)
+                self._pending.add(key)
+
+            # Vượt ngân sách bộ nhớ: bỏ cây của đích ít được hỏi nhất
+            total = sum(t.size_bytes for t in self._trees.values())
+            while total > self.memory_budget and self._trees:
+                coldest = min(self._trees, key=lambda k: self._hits.get(k, 0))
+                total -= self._trees.pop(coldest).size_bytes
+                self._snaps.pop(coldest, None)
+                self._pending.discard(coldest)
+                # Đếm lại từ đầu để không bị dựng lại ngay
+                self._hits[coldest] = 0
+                self.counters['evictions'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'trees': len(self._trees),
+                'pending': len(self._pending),
+                'tracked_goals': len(self._hits),
+                'memory_bytes': sum(t.size_bytes for t in self._trees.values()),
+                'memory_budget': self.memory_budget,
+                **self.counters
+            }
@@ -0,0 +1,345 @@
+"""
+Graph Delta
+Incremental graph updates: added / removed nodes and edges and weight changes per vehicle are
+written to the nodes_* / edges_* tables together with a versioned changelog entry, then applied
+to a copy-on-write clone of the in-memory graph generation instead of reloading it from disk
+"""
+import json
+import math
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from app.config import get_settings
+from app.database import add_road_class_columns, create_graph_changelog_table, get_db_connection
+from app.services.road_classes import class_speeds, edge_factor, road_class_code, uses_class_speeds
+
+settings = get_settings()
+
+# Thứ tự áp dụng trong một phương tiện: xoá trước (id được giải phóng), thêm sau, đổi trọng số cuối cùng
+OPERATIONS = ('remove_edges', 'remove_nodes', 'add_nodes', 'add_edges', 'set_weights')
+
+# Các khoá của base được mỗi profile trỏ tới trực tiếp
+BASE_VIEWS = (
+    'nodes', 'adj_list', 'rev_adj_list', 'edges', 'edge_index', 'access', 'road_class', 'maxspeed', 'segment_index'
+)
+
+
+def current_version(cursor) -> int:
+    """Version changelog mới nhất (0 = chưa có delta nào)"""
+    create_graph_changelog_table(cursor)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM graph_changelog")
+    return cursor.fetchone()[0]
+
+
+def summarize(ops: Dict[str, Dict[str, list]]) -> Dict[str, Dict[str, int]]:
+    return {v_type: {op: len(items) for op, items in profile_ops.items() if items} for v_type, profile_ops in ops.items()}
+
+
+def write_delta(cursor, delta: Dict[str, Any], vehicle_types: List[str]) -> Tuple[int, Dict[str, Dict[str, list]]]:
+    """
+    Ghi delta vào bảng đồ thị và graph_changelog trong transaction của cursor.
+    Trả về (version mới, ops) với ops[phương tiện][thao tác] = các dòng đã ghi (id, toạ độ theo bảng),
+    gồm cả cạnh bị xoá theo node và trọng số tính sẵn cho cạnh thêm không ghi trọng số.
+    ValueError: delta không khớp dữ liệu trong DB; RuntimeError: base_version đã cũ.
+    """
+    version = current_version(cursor)
+    base_version = delta.get('base_version')
+    if base_version is not None and base_version != version:
+        raise RuntimeError(f"Graph changelog is at version {version}, the delta was made against version {base_version}")
+
+    ops = {}
+    for v_type, change in delta['changes'].items():
+        if v_type not in vehicle_types:
+            raise ValueError(f"Unknown vehicle type '{v_type}'")
+        ops[v_type] = _write_profile(cursor, v_type, change, [v for v in vehicle_types if v != v_type])
+
+    cursor.execute(
+        "INSERT INTO graph_changelog (description, delta, summary) VALUES (?, ?, ?)",
+        (delta.get('description') or '', json.dumps(delta), json.dumps(summarize(ops)))
+    )
+    return cursor.lastrowid, ops
+
+
+def _write_profile(cursor, v_type: str, change: Dict[str, list], others: List[str]) -> Dict[str, list]:
+    nodes_table, edges_table = f"nodes_{v_type}", f"edges_{v_type}"
+    cursor.execute(f"PRAGMA table_info({edges_table})")
+    if not cursor.fetchall():
+        raise ValueError(f"No graph tables for '{v_type}'")
+    add_road_class_columns(cursor, v_type)
+
+    def position(node_id: int) -> Tuple[float, float]:
+        cursor.execute(f"SELECT x, y FROM {nodes_table} WHERE id = ?", (node_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise ValueError(f"{v_type}: node {node_id} does not exist")
+        return row[0], row[1]
+
+    ops = {op: [] for op in OPERATIONS}
+    for edge in change.get('remove_edges', ()):
+        cursor.execute(f"DELETE FROM {edges_table} WHERE node_from = ? AND node_to = ?", (edge['u'], edge['v']))
+        if not cursor.rowcount:
+            raise ValueError(f"{v_type}: edge {edge['u']} -> {edge['v']} does not exist")
+        ops['remove_edges'].append((edge['u'], edge['v']))
+
+    for node_id in change.get('remove_nodes', ()):
+        x, y = position(node_id)
+        # Cạnh nối vào node bị xoá theo
+        cursor.execute(f"SELECT node_from, node_to FROM {edges_table} WHERE node_from = ? OR node_to = ?", (node_id, node_id))
+        ops['remove_edges'].extend((row[0], row[1]) for row in cursor.fetchall())
+        cursor.execute(f"DELETE FROM {edges_table} WHERE node_from = ? OR node_to = ?", (node_id, node_id))
+        cursor.execute(f"DELETE FROM {nodes_table} WHERE id = ?", (node_id,))
+        # Cùng id, cùng toạ độ trong bảng phương tiện khác = node dùng chung trong RAM, phải giữ lại
+        shared = False
+        for other in others:
+            cursor.execute(f"SELECT 1 FROM nodes_{other} WHERE id = ? AND x = ? AND y = ?", (node_id, x, y))
+            shared = shared or cursor.fetchone() is not None
+        ops['remove_nodes'].append((node_id, shared))
+
+    for node in change.get('add_nodes', ()):
+        try:
+            cursor.execute(f"INSERT INTO {nodes_table} (id, x, y) VALUES (?, ?, ?)", (node['id'], node['x'], node['y']))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"{v_type}: node {node['id']} already exists")
+        ops['add_nodes'].append((node['id'], node['x'], node['y']))
+
+    for edge in change.get('add_edges', ()):
+        u, v = edge['u'], edge['v']
+        (x1, y1), (x2, y2) = position(u), position(v)
+        # Không ghi trọng số -> độ dài đoạn thẳng (cùng đơn vị pixel với rawprocessing)
+        weight = edge.get('weight') or math.hypot(x2 - x1, y2 - y1)
+        row = (u, v, weight, edge.get('road_class'), edge.get('maxspeed'))
+        try:
+            cursor.execute(
+                f"INSERT INTO {edges_table} (node_from, node_to, weight, road_class, maxspeed) VALUES (?, ?, ?, ?, ?)", row
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"{v_type}: edge {u} -> {v} already exists")
+        ops['add_edges'].append(row)
+
+    for edge in change.get('set_weights', ()):
+        cursor.execute(
+            f"UPDATE {edges_table} SET weight = ? WHERE node_from = ? AND node_to = ?", (edge['weight'], edge['u'], edge['v'])
+        )
+        if not cursor.rowcount:
+            raise ValueError(f"{v_type}: edge {edge['u']} -> {edge['v']} does not exist")
+        ops['set_weights'].append((edge['u'], edge['v'], edge['weight']))
+    return ops
+
+
+def list_changelog(limit: int = 50, include_delta: bool = False) -> Dict[str, Any]:
+    """Các delta gần nhất (mới nhất trước)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        version = current_version(cursor)
+        cursor.execute(
+            "SELECT version, description, summary, delta, applied_at FROM graph_changelog ORDER BY version DESC LIMIT ?",
+            (limit,)
+        )
+        entries = []
+        for row in cursor.fetchall():
+            entry = {
+                'version': row['version'],
+                'description': row['description'],
+                'applied_at': row['applied_at'],
+                'summary': json.loads(row['summary'])
+            }
+            if include_delta:
+                entry['delta'] = json.loads(row['delta'])
+            entries.append(entry)
+    return {'version': version, 'entries': entries}
+
+
+def clone_generation(graphs: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Bản sao thế hệ đồ thị để áp delta trong khi thế hệ cũ vẫn phục vụ search.
+    Dict / mảng được sao (chép ở tầng C); danh sách kề và ô lưới dùng chung cho tới khi bị sửa.
+    """
+    old = next(iter(graphs.values()))['base']
+    base = dict(old)
+    for key in ('nodes', 'adj_list', 'rev_adj_list', 'edge_index'):
+        base[key] = dict(old[key])
+    base['edges'] = list(old['edges'])
+    for key in ('access', 'road_class', 'maxspeed'):
+        base[key] = old[key][:]
+    base['remap'] = {v_type: dict(remap) for v_type, remap in old['remap'].items()}
+    base['segment_index'] = old['segment_index'].copy(base['nodes'])
+
+    new_graphs = {}
+    for v_type, old_graph in graphs.items():
+        graph = dict(old_graph)
+        graph['base'] = base
+        graph.update({key: base[key] for key in BASE_VIEWS})
+        original = old_graph['original_weights'][:]
+        graph['original_weights'] = original
+        # lengths là chính original_weights khi profile không nhân tốc độ -> giữ nguyên quan hệ đó
+        graph['lengths'] = original if old_graph['lengths'] is old_graph['original_weights'] else old_graph['lengths'][:]
+        graph['current_weights'] = old_graph['current_weights'][:]
+        graph['disabled'] = old_graph['disabled'][:]
+        graph['components'] = old_graph['components'].clone(graph)
+        new_graphs[v_type] = graph
+    return new_graphs
+
+
+@dataclass
+class DeltaEffects:
+    """Những gì delta đã đổi trên thế hệ mới (cặp (u, v) theo id trong RAM)"""
+    removed: Dict[str, Set[Tuple[int, int]]] = field(default_factory=dict)     # cạnh phương tiện không còn được đi
+    reweighted: Dict[str, Set[Tuple[int, int]]] = field(default_factory=dict)  # cạnh thêm / đổi trọng số
+    added: Set[int] = field(default_factory=set)                               # edge id vừa được bật bit access
+    removed_nodes: Set[int] = field(default_factory=set)
+
+
+class _DeltaApplier:
+    """Áp ops của write_delta lên một thế hệ vừa clone_generation (chưa publish nên sửa tại chỗ)"""
+
+    def __init__(self, graphs: Dict[str, Dict]):
+        self.graphs = graphs
+        self.base = next(iter(graphs.values()))['base']
+        self.speeds = class_speeds()
+        self.effects = DeltaEffects(
+            removed={v_type: set() for v_type in graphs}, reweighted={v_type: set() for v_type in graphs}
+        )
+        self.closed = {v_type: [] for v_type in graphs}
+        self.dropped = {v_type: set() for v_type in graphs}  # node phương tiện này không còn dùng
+        self.opened = {v_type: [] for v_type in graphs}
+        self._next_id: Optional[int] = None
+        # Mỗi mảng trọng số một lần (lengths có thể là chính original_weights)
+        self._weight_arrays = list({
+            id(arr): arr for graph in graphs.values()
+            for arr in (graph['lengths'], graph['original_weights'], graph['current_weights'])
+        }.values())
+
+    def apply(self, ops: Dict[str, Dict[str, list]]) -> DeltaEffects:
+        for v_type, profile_ops in ops.items():
+            graph = self.graphs[v_type]
+            remap = self.base['remap'].setdefault(v_type, {})
+            for u, v in profile_ops['remove_edges']:
+                self._remove_edge(v_type, graph, remap.get(u, u), remap.get(v, v))
+            for node_id, shared in profile_ops['remove_nodes']:
+                node = remap.pop(node_id, node_id)
+                self.dropped[v_type].add(node)
+                # Node được cấp id riêng (remap) chỉ thuộc phương tiện này
+                if node != node_id or not shared:
+                    self._drop_node(node)
+            for node_id, x, y in profile_ops['add_nodes']:
+                self._add_node(remap, node_id, (x, settings.MAP_HEIGHT - y))
+            for u, v, weight, road_class, maxspeed in profile_ops['add_edges']:
+                self._add_edge(v_type, graph, remap.get(u, u), remap.get(v, v), weight, road_class, maxspeed)
+            for u, v, weight in profile_ops['set_weights']:
+                u, v = remap.get(u, u), remap.get(v, v)
+                ei = self.base['edge_index'].get((u, v))
+                if ei is not None and graph['access'][ei] & graph['mask']:
+                    self._set_weight(v_type, graph, ei, weight)
+                    self.effects.reweighted[v_type].add((u, v))
+
+        # Nhãn thành phần: tách theo cạnh mở bị xoá, bỏ node đã xoá, rồi gộp theo cạnh mới
+        for v_type, graph in self.graphs.items():
+            if self.closed[v_type]:
+                graph['components'].on_closed(self.closed[v_type])
+            graph['components'].forget(self.effects.removed_nodes | self.dropped[v_type])
+            if self.opened[v_type]:
+                graph['components'].on_opened(self.opened[v_type])
+        return self.effects
+
+    def _sync_segment(self, u: int, v: int):
+        """Bitmask của đoạn (u, v) trong chỉ mục không gian = OR access của cả hai chiều"""
+        edge_index, access = self.base['edge_index'], self.base['access']
+        mask = 0
+        for pair in ((u, v), (v, u)):
+            ei = edge_index.get(pair)
+            if ei is not None:
+                mask |= access[ei]
+        self.base['segment_index'].set_mask(min(u, v), max(u, v), mask)
+
+    def _remove_edge(self, v_type: str, graph: Dict, u: int, v: int):
+        base = self.base
+        access, mask = base['access'], graph['mask']
+        ei = base['edge_index'].get((u, v))
+        if ei is None or not access[ei] & mask:
+            return  # Không có trong RAM (vd. node thiếu lúc tải)
+        if graph['disabled'][ei]:
+            graph['disabled'][ei] = 0
+            graph['closed_edges'] -= 1
+        else:
+            self.closed[v_type].append(ei)
+        access[ei] &= ~mask
+        inf = float('inf')
+        graph['lengths'][ei] = graph['original_weights'][ei] = graph['current_weights'][ei] = inf
+        self.effects.removed[v_type].add((u, v))
+        if not access[ei]:
+            # Không phương tiện nào còn đi: gỡ khỏi danh sách kề; edge id thành ô trống tới lần reload sau
+            base['adj_list'][u] = [pair for pair in base['adj_list'][u] if pair[1] != ei]
+            base['rev_adj_list'][v] = [pair for pair in base['rev_adj_list'][v] if pair[1] != ei]
+            del base['edge_index'][(u, v)]
+        self._sync_segment(u, v)
+
+    def _drop_node(self, node: int):
+        base = self.base
+        if base['adj_list'].get(node) or base['rev_adj_list'].get(node):
+            return  # Phương tiện khác vẫn còn cạnh qua node này
+        base['nodes'].pop(node, None)
+        base['adj_list'].pop(node, None)
+        base['rev_adj_list'].pop(node, None)
+        self.effects.removed_nodes.add(node)
+
+    def _add_node(self, remap: Dict[int, int], node_id: int, pos: Tuple[float, float]):
+        """Như _merge_nodes: trùng id khác toạ độ với node của phương tiện khác -> cấp id mới"""
+        nodes = self.base['nodes']
+        node = node_id
+        if node in nodes and nodes[node] != pos:
+            if self._next_id is None:
+                self._next_id = max(max(nodes), node_id) + 1
+            node = remap[node_id] = self._next_id
+            self._next_id += 1
+        if node not in nodes:
+            nodes[node] = pos
+            self.base['adj_list'][node] = []
+            self.base['rev_adj_list'][node] = []
+
+    def _add_edge(self, v_type: str, graph: Dict, u: int, v: int, weight: float,
+                  road_class: Optional[str], maxspeed: Optional[float]):
+        base = self.base
+        if u not in base['nodes'] or v not in base['nodes']:
+            raise ValueError(f"{v_type}: edge {u} -> {v} references a node missing from the loaded graph")
+        edge_index, access = base['edge_index'], base['access']
+        ei = edge_index.get((u, v))
+        if ei is None:
+            ei = len(base['edges'])
+            base['edges'].append((u, v))
+            edge_index[(u, v)] = ei
+            access.append(0)
+            base['road_class'].append(0)
+            base['maxspeed'].append(0.0)
+            for arr in self._weight_arrays:
+                arr.append(float('inf'))
+            for other in self.graphs.values():
+                other['disabled'].append(0)
+            # Danh sách mới thay vì append: danh sách cũ vẫn thuộc thế hệ đang phục vụ
+            base['adj_list'][u] = base['adj_list'][u] + [(v, ei)]
+            base['rev_adj_list'][v] = base['rev_adj_list'][v] + [(u, ei)]
+        # Cạnh chung nhiều bảng: như lúc tải, dữ liệu của bảng tải trước được giữ
+        profiles = list(self.graphs)
+        first = not any(access[ei] & self.graphs[other]['mask'] for other in profiles[:profiles.index(v_type)])
+        access[ei] |= graph['mask']
+        if road_class and (first or not base['road_class'][ei]):
+            base['road_class'][ei] = road_class_code(road_class)
+        if maxspeed and (first or not base['maxspeed'][ei]):
+            base['maxspeed'][ei] = maxspeed
+        self._set_weight(v_type, graph, ei, weight)
+        self.effects.added.add(ei)
+        self.effects.reweighted[v_type].add((u, v))
+        self.opened[v_type].append(ei)
+        self._sync_segment(u, v)
+
+    def _set_weight(self, v_type: str, graph: Dict, ei: int, length: float):
+        """Trọng số gốc = độ dài * hệ số tốc độ của cạnh; trọng số hiện tại về gốc (kịch bản được áp lại sau)"""
+        base = self.base
+        factor = edge_factor(base['road_class'][ei], base['maxspeed'][ei], self.speeds) if uses_class_speeds(v_type) else 1.0
+        graph['lengths'][ei] = length
+        graph['original_weights'][ei] = length * factor
+        graph['current_weights'][ei] = graph['original_weights'][ei]
+
+
+def apply_ops(graphs: Dict[str, Dict], ops: Dict[str, Dict[str, list]]) -> DeltaEffects:
+    """Áp ops (kết quả write_delta) lên thế hệ graphs, thường là bản clone_generation chưa publish"""
+    return _DeltaApplier(graphs).apply(ops)
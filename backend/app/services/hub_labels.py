@@ -0,0 +1,412 @@
+"""
+Hub Labels
+Pruned landmark labeling of each vehicle graph on its original weights: every node keeps
+a forward label (hub, d(node, hub)) and a backward label (hub, d(hub, node)) sorted by hub
+rank, and d(s, t) is the best common hub found by merging the two lists. Each entry also
+carries the physical length of its shortest path, which differs from d when road class
+speeds scale the weights. Built offline by
+scripts/build_hub_labels.py and memory-mapped at load.
+"""
+import heapq
+import json
+import math
+import mmap
+import os
+import sys
+import time
+from array import array
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+# Thứ tự các mảng trong file (mảng 8 byte trước để giữ căn lề)
+SECTIONS = (
+    ('node_ids', 'q'), ('out_dists', 'd'), ('in_dists', 'd'), ('out_lengths', 'd'), ('in_lengths', 'd'),
+    ('out_offsets', 'I'), ('in_offsets', 'I'), ('out_hubs', 'I'), ('in_hubs', 'I')
+)
+# Sai số khi so chi phí cộng dồn bằng float
+TOLERANCE = 1e-9
+
+
+class HubLabels:
+    """
+    Nhãn của node thứ i (theo node_ids): out_hubs/out_dists[out_offsets[i]:out_offsets[i+1]]
+    (hub đi tới được từ node) và in_hubs/in_dists tương ứng (hub đi tới node), tăng dần theo hub rank;
+    *_lengths: độ dài của chính đường ngắn nhất đó.
+    changed = (raised, lowered): edge id đang đắt hơn (hoặc bị chặn) / rẻ hơn trọng số gốc mà nhãn được dựng trên.
+    Cả cặp được thay bằng một phép gán nên truy vấn đọc song song luôn thấy một trạng thái trọn vẹn.
+    """
+
+    def __init__(self, versions: Dict[str, Optional[str]], arrays: Dict[str, object], source: Optional[mmap.mmap] = None):
+        self.versions = versions
+        for name, _ in SECTIONS:
+            setattr(self, name, arrays[name])
+        self.index = {node: i for i, node in enumerate(self.node_ids)}
+        self.nbytes = sum(len(arrays[name]) * arrays[name].itemsize for name, _ in SECTIONS)
+        self._mmap = source
+        self.changed: Tuple[FrozenSet[int], FrozenSet[int]] = (frozenset(), frozenset())
+
+    def _label(self, offsets, hubs, dists, node: int) -> Tuple[List[int], List[float], int]:
+        """(hubs, dists, vị trí bắt đầu trong mảng) của nhãn một phía"""
+        i = self.index.get(node)
+        if i is None:
+            return [], [], 0
+        start, end = offsets[i], offsets[i + 1]
+        return hubs[start:end].tolist(), dists[start:end].tolist(), start
+
+    def _merge(self, s: int, t: int) -> Tuple[float, int, int]:
+        """Trộn hai danh sách nhãn đã sắp theo hub rank: (d, vị trí entry out, vị trí entry in) của hub tốt nhất"""
+        out_hubs, out_dists, out_start = self._label(self.out_offsets, self.out_hubs, self.out_dists, s)
+        in_hubs, in_dists, in_start = self._label(self.in_offsets, self.in_hubs, self.in_dists, t)
+        best, best_a, best_b = math.inf, -1, -1
+        a, b = 0, 0
+        len_a, len_b = len(out_hubs), len(in_hubs)
+        while a < len_a and b < len_b:
+            ha, hb = out_hubs[a], in_hubs[b]
+            if ha == hb:
+                d = out_dists[a] + in_dists[b]
+                if d < best:
+                    best, best_a, best_b = d, out_start + a, in_start + b
+                a += 1
+                b += 1
+            elif ha < hb:
+                a += 1
+            else:
+                b += 1
+        return best, best_a, best_b
+
+    def distance(self, s: int, t: int) -> float:
+        """d(s, t) trên trọng số gốc (inf nếu không có đường)"""
+        return self._merge(s, t)[0]
+
+    def measure(self, s: int, t: int) -> Tuple[float, float]:
+        """(d(s, t), độ dài của đường ngắn nhất đó)"""
+        d, a, b = self._merge(s, t)
+        if a < 0:
+            return math.inf, math.inf
+        return d, self.out_lengths[a] + self.in_lengths[b]
+
+    def entries(self) -> int:
+        return len(self.out_hubs) + len(self.in_hubs)
+
+
+# --- DỰNG OFFLINE (PLL) ---
+
+def _pruned_search(root: int, rank: int, adjacency: Dict, root_label: Tuple[List[int], List[float], List[float]],
+                   labels: Dict[int, Tuple[List[int], List[float], List[float]]], usable, weights, lengths) -> int:
+    """
+    Dijkstra từ root; node v đã được nhãn hiện có phủ (query <= d) thì cắt tỉa,
+    ngược lại thêm (rank, d, độ dài) vào nhãn của v. Trả về số nhãn đã thêm.
+    """
+    known = dict(zip(root_label[0], root_label[1]))
+    inf = math.inf
+    dist = {root: 0.0}
+    length = {root: 0.0}
+    done = set()
+    heap = [(0.0, root)]
+    added = 0
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in done:
+            continue
+        done.add(v)
+        hubs, dists, node_lengths = labels[v]
+        if any(known.get(h, inf) + hd <= d for h, hd in zip(hubs, dists)):
+            continue
+        hubs.append(rank)
+        dists.append(d)
+        node_lengths.append(length[v])
+        added += 1
+        for neighbor, ei in adjacency.get(v, ()):
+            if not usable(ei) or neighbor in done:
+                continue
+            nd = d + weights[ei]
+            if nd < dist.get(neighbor, inf):
+                dist[neighbor] = nd
+                length[neighbor] = length[v] + lengths[ei]
+                heapq.heappush(heap, (nd, neighbor))
+    return added
+
+
+def _hub_order(graph: Dict, nodes: List[int], usable, weights, samples: int) -> List[int]:
+    """
+    Thứ tự hub: node nằm trên nhiều đường ngắn nhất đứng trước (nhãn ngắn hơn nhiều so với xếp theo bậc).
+    Điểm = tổng kích thước cây con trong cây đường ngắn nhất từ `samples` gốc rải đều; hòa thì xét bậc.
+    """
+    adj_list = graph['adj_list']
+    degree = {n: 0 for n in nodes}
+    for ei, (u, v) in enumerate(graph['edges']):
+        if usable(ei):
+            degree[u] += 1
+            degree[v] += 1
+    score = {n: 0 for n in nodes}
+    step = max(1, len(nodes) // max(samples, 1))
+    for root in nodes[::step][:samples]:
+        dist, parent, settled = {root: 0.0}, {}, []
+        heap = [(0.0, root)]
+        done = set()
+        while heap:
+            d, v = heapq.heappop(heap)
+            if v in done:
+                continue
+            done.add(v)
+            settled.append(v)
+            for neighbor, ei in adj_list.get(v, ()):
+                if usable(ei) and neighbor not in done and d + weights[ei] < dist.get(neighbor, math.inf):
+                    dist[neighbor] = d + weights[ei]
+                    parent[neighbor] = v
+                    heapq.heappush(heap, (dist[neighbor], neighbor))
+        # Cộng dồn kích thước cây con từ lá lên gốc
+        subtree = dict.fromkeys(settled, 1)
+        for v in reversed(settled):
+            if v in parent:
+                subtree[parent[v]] += subtree[v]
+            score[v] += subtree[v]
+    return sorted(nodes, key=lambda n: (-score[n], -degree[n], n))
+
+
+def build_hub_labels(graph: Dict, versions: Dict[str, Optional[str]], progress_every: int = 0,
+                     samples: int = 32) -> HubLabels:
+    """PLL trên trọng số gốc (bỏ qua kịch bản), hub theo thứ tự của _hub_order"""
+    access, mask = graph['access'], graph['mask']
+    weights, lengths = graph['original_weights'], graph['lengths']
+    adj_list, rev_adj_list = graph['adj_list'], graph['rev_adj_list']
+
+    def usable(ei):
+        return access[ei] & mask
+
+    nodes = sorted({n for ei, edge in enumerate(graph['edges']) if usable(ei) for n in edge})
+    order = _hub_order(graph, nodes, usable, weights, samples)
+    out_labels = {n: ([], [], []) for n in order}
+    in_labels = {n: ([], [], []) for n in order}
+
+    started = time.perf_counter()
+    for rank, hub in enumerate(order):
+        # Xuôi: d(hub, v) vào nhãn in của v; ngược: d(v, hub) vào nhãn out của v
+        _pruned_search(hub, rank, adj_list, out_labels[hub], in_labels, usable, weights, lengths)
+        _pruned_search(hub, rank, rev_adj_list, in_labels[hub], out_labels, usable, weights, lengths)
+        if progress_every and (rank + 1) % progress_every == 0:
+            print(f"   {rank + 1}/{len(order)} hubs, {time.perf_counter() - started:.1f}s")
+
+    node_ids = sorted(order)
+    arrays = {'node_ids': array('q', node_ids)}
+    for side, labels in (('out', out_labels), ('in', in_labels)):
+        offsets, hubs, dists, side_lengths = array('I', [0]), array('I'), array('d'), array('d')
+        for node in node_ids:
+            node_hubs, node_dists, node_lengths = labels[node]
+            hubs.extend(node_hubs)
+            dists.extend(node_dists)
+            side_lengths.extend(node_lengths)
+            offsets.append(len(hubs))
+        arrays[f'{side}_offsets'], arrays[f'{side}_hubs'] = offsets, hubs
+        arrays[f'{side}_dists'], arrays[f'{side}_lengths'] = dists, side_lengths
+    return HubLabels(versions, arrays)
+
+
+# --- LƯU / ĐỌC FILE ---
+
+def labels_path(vehicle_type: str, directory: str = settings.hub_labels_dir) -> str:
+    return os.path.join(directory, f"{vehicle_type}.labels")
+
+
+def save_hub_labels(labels: HubLabels, path: str):
+    """Header JSON (đệm tới bội số 8 byte) rồi các mảng little-endian theo thứ tự SECTIONS"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    header = {'versions': labels.versions, 'lengths': {name: len(getattr(labels, name)) for name, _ in SECTIONS}}
+    raw = json.dumps(header).encode()
+    raw += b" " * (-(len(raw) + 1) % 8) + b"\n"
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(raw)
+        for name, typecode in SECTIONS:
+            data = array(typecode, getattr(labels, name))
+            if sys.byteorder != 'little':
+                data.byteswap()
+            data.tofile(f)
+    os.replace(tmp, path)
+
+
+def load_hub_labels(path: str, versions: Dict[str, Optional[str]], use_mmap: bool = settings.hub_labels_mmap) -> Optional[HubLabels]:
+    """
+    None nếu chưa có file hoặc file dựng cho phiên bản đồ thị khác.
+    use_mmap: các mảng là memoryview trên file (trang nào được hỏi mới nằm trong RAM);
+    máy big-endian luôn đọc vào array.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        header_line = f.readline()
+        header = json.loads(header_line)
+        if header['versions'] != versions:
+            print(f"⚠️ [RAM] Hub labels {path} were built for another graph version, ignored.")
+            return None
+        lengths = header['lengths']
+        if set(lengths) != {name for name, _ in SECTIONS}:
+            print(f"⚠️ [RAM] Hub labels {path} use an older file layout, rebuild them.")
+            return None
+        if use_mmap and sys.byteorder == 'little':
+            source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(source)
+            offset, arrays = len(header_line), {}
+            for name, typecode in SECTIONS:
+                size = lengths[name] * array(typecode).itemsize
+                arrays[name] = view[offset:offset + size].cast(typecode)
+                offset += size
+            return HubLabels(versions, arrays, source)
+        arrays = {}
+        for name, typecode in SECTIONS:
+            data = array(typecode)
+            data.fromfile(f, lengths[name])
+            if sys.byteorder != 'little':
+                data.byteswap()
+            arrays[name] = data
+    return HubLabels(versions, arrays)
+
+
+# --- ORACLE ---
+
+class HubLabelOracle:
+    """
+    Trả lời truy vấn chỉ cần distance/cost bằng nhãn. Nhãn dựng trên trọng số gốc nên khi có kịch bản
+    chỉ dùng được nếu không cạnh nào đổi trọng số có thể ảnh hưởng cặp điểm:
+    - cạnh đắt lên / bị chặn (u, v) không nằm trên đường ngắn nhất gốc: d(s, u) + w(u, v) + d(v, t) > d(s, t)
+    - cạnh rẻ đi (u, v) không thể tạo đường rẻ hơn: |s, u| + w(u, v) + |v, t| >= d(s, t)
+    (cả hai đều lọc trước bằng cận dưới Euclid). Ngược lại trả None để người gọi tìm kiếm thường.
+    """
+
+    def __init__(self, pathfinding_service):
+        self.pf = pathfinding_service
+        self.counters = {'label_queries': 0, 'fallback_changed': 0, 'fallback_missing': 0, 'fallback_unreachable': 0}
+
+        pathfinding_service.add_weight_listener(self._on_weight_change)
+
+    def _on_weight_change(self, epoch: int, changes: Optional[Dict[str, Dict[str, set]]]):
+        # Listener chạy ở thread áp trọng số (không ghim thế hệ) -> graphs là thế hệ mới nhất
+        for v_type, graph in self.pf.graphs.items():
+            labels = graph.get('hub_labels')
+            if labels is None:
+                continue
+            if changes is None:
+                labels.changed = self._classify(graph, (), range(len(graph['edges'])))
+            elif v_type in changes:
+                labels.changed = self._classify(graph, labels.changed, changes[v_type]['raised'] | changes[v_type]['lowered'])
+
+    @staticmethod
+    def _classify(graph: Dict, changed, candidates) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        """So trạng thái hiện tại của các cạnh candidates với trọng số gốc; trả về cặp (raised, lowered) mới"""
+        access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+        original, current = graph['original_weights'], graph['current_weights']
+        raised, lowered = (set(changed[0]), set(changed[1])) if changed else (set(), set())
+        for ei in candidates:
+            raised.discard(ei)
+            lowered.discard(ei)
+            if not access[ei] & mask:
+                continue
+            if disabled[ei] or current[ei] > original[ei]:
+                raised.add(ei)
+            elif current[ei] < original[ei]:
+                lowered.add(ei)
+        return frozenset(raised), frozenset(lowered)
+
+    def distance(self, start_x: float, start_y: float, end_x: float, end_y: float, vehicle_type: str) -> Optional[Dict]:
+        """
+        {'distance', 'cost'} theo đơn vị trọng số (distance theo độ dài cạnh, cost trên trọng số hiện tại),
+        hoặc None nếu phải tìm kiếm thường. Gọi trong pinned().
+        """
+        pf = self.pf
+        graph = pf.graphs.get(vehicle_type)
+        labels = graph.get('hub_labels') if graph is not None else None
+        if labels is None:
+            self.counters['fallback_missing'] += 1
+            return None
+
+        # Các điểm nối: node -> (chi phí hiện tại, độ dài) của nửa cạnh tới/từ điểm snap
+        if settings.snap_to_edges:
+            start_snap = pf.snap_to_edge(start_x, start_y, vehicle_type)
+            end_snap = pf.snap_to_edge(end_x, end_y, vehicle_type)
+            if start_snap is None or end_snap is None:
+                return None
+            sources = self._legs(graph, pf.snap_sources(start_snap, vehicle_type, outgoing=True)[1])
+            targets = self._legs(graph, pf.snap_sources(end_snap, vehicle_type, outgoing=False)[1])
+            start_point, end_point = (start_snap.x, start_snap.y), (end_snap.x, end_snap.y)
+            direct = pf.direct_leg(start_snap, end_snap, vehicle_type)
+        else:
+            start_node = pf.find_nearest_node(start_x, start_y, vehicle_type)
+            end_node = pf.find_nearest_node(end_x, end_y, vehicle_type)
+            if start_node is None or end_node is None:
+                return None
+            sources, targets = {start_node: (0.0, 0.0)}, {end_node: (0.0, 0.0)}
+            start_point, end_point = graph['nodes'][start_node], graph['nodes'][end_node]
+            direct = None
+
+        best_cost, best_distance = math.inf, math.inf
+        for a, (a_cost, a_dist) in sources.items():
+            for b, (b_cost, b_dist) in targets.items():
+                d, length = (0.0, 0.0) if a == b else labels.measure(a, b)
+                if a_cost + d + b_cost < best_cost:
+                    best_cost, best_distance = a_cost + d + b_cost, a_dist + length + b_dist
+        if direct is not None:
+            ei, fraction = direct
+            if graph['current_weights'][ei] * fraction <= best_cost:
+                best_cost, best_distance = graph['current_weights'][ei] * fraction, graph['lengths'][ei] * fraction
+
+        if best_cost == math.inf:
+            self.counters['fallback_unreachable'] += 1
+            return None
+        if self._affected(graph, labels, sources, targets, start_point, end_point, best_cost):
+            self.counters['fallback_changed'] += 1
+            return None
+        self.counters['label_queries'] += 1
+        return {'distance': best_distance, 'cost': best_cost}
+
+    @staticmethod
+    def _legs(graph: Dict, legs: Dict[int, Tuple[Optional[int], float]]) -> Dict[int, Tuple[float, float]]:
+        current, lengths = graph['current_weights'], graph['lengths']
+        return {
+            node: (current[ei] * fraction, lengths[ei] * fraction) if ei is not None else (0.0, 0.0)
+            for node, (ei, fraction) in legs.items()
+        }
+
+    @staticmethod
+    def _affected(graph: Dict, labels: HubLabels, sources: Dict, targets: Dict,
+                  start_point: Tuple[float, float], end_point: Tuple[float, float], best: float) -> bool:
+        # Một lần đọc: listener có thể thay cặp này trong lúc truy vấn chạy
+        raised, lowered = labels.changed
+        if not raised and not lowered:
+            return False
+        nodes, edges = graph['nodes'], graph['edges']
+        original, current = graph['original_weights'], graph['current_weights']
+        (sx, sy), (tx, ty) = start_point, end_point
+        limit = best * (1 + TOLERANCE)
+
+        for ei in lowered:
+            (ux, uy), (vx, vy) = nodes[edges[ei][0]], nodes[edges[ei][1]]
+            if math.hypot(ux - sx, uy - sy) + current[ei] + math.hypot(tx - vx, ty - vy) < limit:
+                return True
+
+        for ei in raised:
+            u, v = edges[ei]
+            (ux, uy), (vx, vy) = nodes[u], nodes[v]
+            if math.hypot(ux - sx, uy - sy) + original[ei] + math.hypot(tx - vx, ty - vy) > limit:
+                continue
+            to_u = min(cost + (0.0 if a == u else labels.distance(a, u)) for a, (cost, _) in sources.items())
+            from_v = min((0.0 if b == v else labels.distance(v, b)) + cost for b, (cost, _) in targets.items())
+            if to_u + original[ei] + from_v <= limit:
+                return True
+        return False
+
+    def stats(self) -> Dict:
+        return {
+            'profiles': {
+                v_type: None if graph.get('hub_labels') is None else {
+                    'entries': graph['hub_labels'].entries(),
+                    'bytes': graph['hub_labels'].nbytes,
+                    'mmap': graph['hub_labels']._mmap is not None,
+                    'raised_edges': len(graph['hub_labels'].changed[0]),
+                    'lowered_edges': len(graph['hub_labels'].changed[1])
+                }
+                for v_type, graph in self.pf.graphs.items()
+            },
+            **self.counters
+        }
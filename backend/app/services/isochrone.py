@@ -0,0 +1,150 @@
+"""
+Isochrone Service
+Computes reachable areas (time bands) with one cost-bounded Dijkstra per origin
+"""
+import threading
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Any, Optional
+from app.config import get_settings
+from app.services.pathfinding import DISTANCE_SCALE
+
+settings = get_settings()
+
+
+def convex_hull(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Bao lồi theo thuật toán monotone chain (ngược chiều kim đồng hồ)"""
+    pts = sorted(set(points))
+    if len(pts) <= 2:
+        return pts
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower = []
+    for p in pts:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+
+    upper = []
+    for p in reversed(pts):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+
+    return lower[:-1] + upper[:-1]
+
+
+class IsochroneService:
+    """Service for reachability queries, cached per (origin node, vehicle, weight epoch)"""
+
+    def __init__(self, cache_size: int = settings.isochrone_cache_size):
+        # Key: (origin, vehicle, epoch) -> (max_cost đã tính, dist); origin = node hoặc (u, v, t) của điểm snap
+        self._cache: "OrderedDict[Tuple[Any, str, int], Tuple[float, Dict[int, float]]]" = OrderedDict()
+        self.cache_size = cache_size
+        # Request chạy song song trên routing pool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _reachable(self, pathfinding_service, origin, sources, vehicle_type: str, max_cost: float) -> Dict[int, float]:
+        """
+        Lấy kết quả Dijkstra từ cache, chỉ tính lại khi ngưỡng mới lớn hơn ngưỡng đã lưu.
+        sources: node hoặc dict node -> chi phí ban đầu (nửa cạnh từ điểm snap)
+        """
+        key = (origin, vehicle_type, pathfinding_service.weight_epoch)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] >= max_cost:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        dist, _ = pathfinding_service.dijkstra(sources, vehicle_type, max_cost=max_cost)
+        with self._lock:
+            self._cache[key] = (max_cost, dist)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return dist
+
+    def compute(
+        self,
+        pathfinding_service,
+        x: float,
+        y: float,
+        vehicle_type: str,
+        speed: float,
+        max_seconds: float,
+        bands: int = 1,
+        shape: str = "hull"
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Tính vùng có thể đến được trong max_seconds, chia thành `bands` mốc thời gian đều nhau.
+        shape: 'nodes' (danh sách node), 'hull' (bao lồi) hoặc 'grid' (các ô lưới).
+        """
+        # Điểm xuất phát giống /path: snap lên cạnh gần nhất qua segment index
+        if settings.snap_to_edges:
+            snap = pathfinding_service.snap_to_edge(x, y, vehicle_type)
+            if snap is None:
+                return None
+            sources, _ = pathfinding_service.snap_sources(snap, vehicle_type, outgoing=True)
+            if not sources:
+                return None
+            origin = (snap.u, snap.v, snap.t)
+            origin_node = snap.u if snap.t <= 0.5 else snap.v
+            origin_xy = (snap.x, snap.y)
+        else:
+            origin = sources = origin_node = pathfinding_service.find_nearest_node(x, y, vehicle_type)
+            if origin is None:
+                return None
+            origin_xy = None
+
+        if speed <= 0: speed = 1
+        # Quy đổi giây -> đơn vị trọng số giống _reconstruct_path: cost = w * DISTANCE_SCALE / speed
+        to_weight = speed / DISTANCE_SCALE
+        dist = self._reachable(pathfinding_service, origin, sources, vehicle_type, max_seconds * to_weight)
+
+        nodes = pathfinding_service.graphs[vehicle_type]['nodes']
+        cell = settings.isochrone_grid_cell
+        result_bands = []
+
+        for i in range(1, bands + 1):
+            limit_seconds = max_seconds * i / bands
+            limit = limit_seconds * to_weight
+            reachable = [n for n, d in dist.items() if d <= limit]
+            band = {"seconds": round(limit_seconds, 2), "nodes": len(reachable)}
+
+            if shape == "nodes":
+                band["node_ids"] = reachable
+            elif shape == "grid":
+                cells = {(int(nodes[n][0] // cell), int(nodes[n][1] // cell)) for n in reachable}
+                band["cell_size"] = cell
+                band["cells"] = [
+                    [cx * cell, cy * cell, (cx + 1) * cell, (cy + 1) * cell]
+                    for cx, cy in sorted(cells)
+                ]
+            else:
+                hull = convex_hull([nodes[n] for n in reachable])
+                band["polygon"] = [{"x": px, "y": py} for px, py in hull]
+
+            result_bands.append(band)
+
+        ox, oy = origin_xy or nodes[origin_node]
+        return {
+            "origin": {"node_id": origin_node, "x": ox, "y": oy},
+            "vehicle": vehicle_type,
+            "weight_epoch": pathfinding_service.weight_epoch,
+            "bands": result_bands
+        }
+
+
+# Singleton Instance
+_isochrone_service = None
+
+def get_isochrone_service() -> IsochroneService:
+    global _isochrone_service
+    if _isochrone_service is None:
+        _isochrone_service = IsochroneService()
+    return _isochrone_service
@@ -0,0 +1,202 @@
+"""
+Memory Accounting
+Deep sizes of the in-memory graph, scenario state and caches, plus a tracemalloc
+diff around a full graph load
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from array import array
+from typing import Any, Dict, Optional
+
+# Kiểu không chứa tham chiếu tới object khác
+_LEAF_TYPES = (str, bytes, bytearray, int, float, bool, complex, array, type(None))
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """
+    Tổng sys.getsizeof của obj và mọi object nó tham chiếu (dict/list/tuple/set/__dict__/__slots__).
+    seen: dùng chung giữa nhiều lần gọi để object chia sẻ chỉ được tính một lần.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, _LEAF_TYPES):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        else:
+            if hasattr(o, '__dict__'):
+                stack.append(vars(o))
+            for slot in getattr(type(o), '__slots__', ()):
+                if hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+def _per(total: int, count: int) -> Optional[float]:
+    return round(total / count, 1) if count else None
+
+
+def graph_memory_report(pathfinding_service) -> Dict[str, Any]:
+    """Kích thước từng cấu trúc của base graph dùng chung và của từng profile phương tiện"""
+    graphs = pathfinding_service.graphs
+    base = next(iter(graphs.values()))['base']
+    node_count, edge_count = len(base['nodes']), len(base['edges'])
+    seen = set()
+
+    structures = {}
+    for name in ('nodes', 'adj_list', 'rev_adj_list', 'edges', 'edge_index', 'access', 'road_class', 'maxspeed',
+                 'remap', 'segment_index'):
+        structures[name] = deep_sizeof(base[name], seen)
+    base_total = sum(structures.values())
+
+    profiles = {}
+    for v_type, graph in graphs.items():
+        # lengths chỉ tốn thêm khi trọng số được nhân tốc độ theo loại đường (không thì là original_weights)
+        sizes = {
+            name: deep_sizeof(graph[name], seen)
+            for name in ('original_weights', 'lengths', 'current_weights', 'disabled')
+        }
+        # Chỉ tính nhãn, không đi theo tham chiếu ngược về graph
+        sizes['components'] = deep_sizeof(graph['components'].labels, seen) + deep_sizeof(graph['components'].sizes, seen)
+        for name in ('arc_flags', 'arc_flags_pristine'):
+            flags = graph.get(name)
+            if flags is not None:
+                sizes[name] = deep_sizeof(flags.flags, seen) + deep_sizeof(flags.cells, seen)
+        labels = graph.get('hub_labels')
+        if labels is not None:
+            # Với mmap, mảng nhãn nằm trong page cache (tính theo kích thước file), chỉ index ở heap
+            sizes['hub_labels'] = labels.nbytes + deep_sizeof(labels.index, seen)
+        total = sum(sizes.values())
+        profiles[v_type] = {
+            'edges': graph['edge_count'],
+            'bytes': sizes,
+            'total_bytes': total,
+            'bytes_per_edge': _per(total, graph['edge_count'])
+        }
+
+    total = base_total + sum(p['total_bytes'] for p in profiles.values())
+    return {
+        'generation': pathfinding_service.generation,
+        'nodes': node_count,
+        'edges': edge_count,
+        'base': {
+            'bytes': structures,
+            'total_bytes': base_total,
+            'bytes_per_node': _per(base_total, node_count),
+            'bytes_per_edge': _per(base_total, edge_count)
+        },
+        'profiles': profiles,
+        'total_bytes': total,
+        'total_bytes_per_node': _per(total, node_count),
+        'total_bytes_per_edge': _per(total, edge_count)
+    }
+
+
+def scenario_memory_report(scenario_service) -> Dict[str, Any]:
+    """affected_edges_map của từng kịch bản, theo thứ tự tạo (tăng dần theo số kịch bản)"""
+    rows = []
+    cumulative = 0
+    with scenario_service.lock:
+        scenarios = list(scenario_service.active_scenarios)
+    for scenario in scenarios:
+        size = deep_sizeof(scenario['affected_edges_map'])
+        cumulative += size
+        rows.append({
+            'id': scenario['id'],
+            'active': scenario['active'],
+            'affected_edges': scenario['affected_edges'],
+            'bytes': size,
+            'bytes_per_edge': _per(size, scenario['affected_edges']),
+            'cumulative_bytes': cumulative
+        })
+    return {'count': len(rows), 'total_bytes': cumulative, 'scenarios': rows}
+
+
+def process_memory() -> Dict[str, Optional[int]]:
+    """RSS hiện tại (Linux /proc) và RSS đỉnh"""
+    rss = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    peak = None
+    try:
+        import resource
+        # ru_maxrss: KB trên Linux, byte trên macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    return {'rss_bytes': rss, 'peak_rss_bytes': peak}
+
+
+def memory_report(pathfinding_service, scenario_service) -> Dict[str, Any]:
+    started = time.perf_counter()
+    report = {
+        'process': process_memory(),
+        'graph': graph_memory_report(pathfinding_service),
+        'scenarios': scenario_memory_report(scenario_service)
+    }
+    trees = pathfinding_service.destination_trees
+    if trees is not None:
+        stats = trees.stats()
+        report['destination_trees'] = {'trees': stats['trees'], 'estimated_bytes': stats['memory_bytes']}
+    report['elapsed'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def tracemalloc_graph_load(pathfinding_service, top: int = 15) -> Dict[str, Any]:
+    """
+    Tải thêm một bản đồ thị từ DB dưới tracemalloc và so sánh snapshot trước/sau.
+    Bản tải thử bị bỏ ngay sau khi đo (không ảnh hưởng đồ thị đang phục vụ), nhưng
+    trong lúc đo bộ nhớ tăng thêm khoảng một lần kích thước đồ thị.
+    """
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        graphs = pathfinding_service._load_graphs()
+        load_time = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+
+        diff = after.compare_to(before, 'lineno')
+        retained = sum(stat.size_diff for stat in diff)
+        del graphs
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+
+    return {
+        'load_seconds': round(load_time, 3),
+        'retained_bytes': retained,
+        'peak_traced_bytes': peak,
+        'top': [
+            {
+                'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_diff': stat.size_diff,
+                'count_diff': stat.count_diff
+            }
+            for stat in diff[:top]
+        ]
+    }
@@ -0,0 +1,214 @@
+"""
+Multi-stop Route Service
+Pairwise cost matrix from one-to-many searches, visit order from nearest insertion + 2-opt
+"""
+from typing import List, Tuple, Dict, Any, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+# Thay cho vô cực trong bài toán TSP để tránh inf - inf = nan
+UNREACHABLE = 1e18
+
+
+def path_cost(order: List[int], matrix: List[List[float]]) -> float:
+    return sum(matrix[a][b] for a, b in zip(order, order[1:]))
+
+
+def nearest_insertion(matrix: List[List[float]], fixed_start: bool, fixed_end: bool) -> List[int]:
+    """Dựng lộ trình mở (không quay về điểm đầu) bằng nearest insertion"""
+    n = len(matrix)
+    if fixed_start and fixed_end:
+        tour = [0, n - 1] if n > 1 else [0]
+    elif fixed_start:
+        tour = [0]
+    elif fixed_end:
+        tour = [n - 1]
+    else:
+        pairs = [(matrix[i][j], i, j) for i in range(n) for j in range(n) if i != j]
+        _, i, j = min(pairs)
+        tour = [i, j]
+
+    remaining = [k for k in range(n) if k not in tour]
+    while remaining:
+        # Điểm gần lộ trình hiện tại nhất (theo cả hai chiều)
+        k = min(remaining, key=lambda c: min(min(matrix[t][c], matrix[c][t]) for t in tour))
+        best_pos, best_delta = None, None
+        for pos in range(len(tour) + 1):
+            if pos == 0 and fixed_start:
+                continue
+            if pos == len(tour) and fixed_end:
+                continue
+            before = tour[pos - 1] if pos > 0 else None
+            after = tour[pos] if pos < len(tour) else None
+            delta = 0.0
+            if before is not None:
+                delta += matrix[before][k]
+            if after is not None:
+                delta += matrix[k][after]
+            if before is not None and after is not None:
+                delta -= matrix[before][after]
+            if best_delta is None or delta < best_delta:
+                best_pos, best_delta = pos, delta
+        tour.insert(best_pos, k)
+        remaining.remove(k)
+    return tour
+
+
+def two_opt(order: List[int], matrix: List[List[float]], fixed_start: bool, fixed_end: bool) -> List[int]:
+    """Đảo đoạn [i..j] khi giảm được tổng chi phí (ma trận bất đối xứng nên tính lại toàn bộ)"""
+    lo = 1 if fixed_start else 0
+    hi = len(order) - 1 if fixed_end else len(order)
+    best = path_cost(order, matrix)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(lo, hi - 1):
+            for j in range(i + 1, hi):
+                candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                cost = path_cost(candidate, matrix)
+                if cost < best - 1e-9:
+                    order, best = candidate, cost
+                    improved = True
+    return order
+
+
+def _merge_payloads(legs: List[Dict]) -> Dict:
+    """Nối kết quả từng chặng thành một payload giống /api/path"""
+    path_coords, node_ids = [], []
+    distance, cost = 0.0, 0.0
+    for i, leg in enumerate(legs):
+        coords, ids = leg['path'], leg['node_ids']
+        if i > 0:
+            # Điểm đầu chặng chính là điểm dừng cuối chặng trước
+            coords = coords[1:]
+            # Điểm dừng nằm đúng trên node: node đó đã là node cuối chặng trước
+            if ids and node_ids and ids[0] == node_ids[-1]:
+                ids = ids[1:]
+        for coord in coords:
+            if not path_coords or (coord['x'], coord['y']) != (path_coords[-1]['x'], path_coords[-1]['y']):
+                path_coords.append(coord)
+        node_ids.extend(ids)
+        distance += leg['distance']
+        if isinstance(cost, str) or isinstance(leg['cost'], str):
+            cost = "Blocked"
+        else:
+            cost += leg['cost']
+    return {
+        'path': path_coords,
+        'node_ids': node_ids,
+        'distance': round(distance, 2),
+        'cost': cost if isinstance(cost, str) else round(cost, 2),
+        'nodes': len(node_ids)
+    }
+
+
+def plan_multi_stop(
+    pathfinding_service,
+    waypoints: List[Tuple[float, float]],
+    vehicle_type: str,
+    speed: float,
+    optimize: bool = True,
+    fixed_start: bool = True,
+    fixed_end: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Tìm lộ trình qua nhiều điểm dừng.
+    1. Snap tất cả điểm một lượt (hoặc node gần nhất khi tắt snap_to_edges); điểm khác thành phần -> None ngay
+    2. Ma trận chi phí: mỗi điểm một lần Dijkstra one-to-many (dừng khi đã chốt mọi đích)
+    3. Thứ tự thăm: nearest insertion + 2-opt (hoặc giữ nguyên nếu optimize=False)
+    4. Ghép các chặng từ cây tìm kiếm đã có, không tìm lại
+    """
+    if vehicle_type not in pathfinding_service.graphs:
+        return None
+
+    if settings.snap_to_edges:
+        # Giống /path: snap một lượt, mỗi điểm nối vào đồ thị bằng các nửa cạnh
+        snaps = pathfinding_service.snap_many(waypoints, vehicle_type)
+        if any(snap is None for snap in snaps):
+            return None
+        ends = [(snap.u, snap.v) for snap in snaps]
+        out_costs, out_legs = zip(*(pathfinding_service.snap_sources(snap, vehicle_type, outgoing=True) for snap in snaps))
+        in_costs, in_legs = zip(*(pathfinding_service.snap_sources(snap, vehicle_type, outgoing=False) for snap in snaps))
+        points = [(snap.x, snap.y) for snap in snaps]
+    else:
+        nodes = [pathfinding_service.find_nearest_node(x, y, vehicle_type) for x, y in waypoints]
+        if any(node is None for node in nodes):
+            return None
+        snaps = [None] * len(nodes)
+        ends = [(node,) for node in nodes]
+        out_costs = in_costs = [{node: 0.0} for node in nodes]
+        out_legs = in_legs = [{node: (None, 0.0)} for node in nodes]
+        points = [None] * len(nodes)
+
+    # Chỉ tra nhãn thành phần, không tìm kiếm: phải đi qua mọi điểm nên chỉ một điểm khác thành phần là hỏng cả lộ trình
+    if any(pathfinding_service.separated(ends[0], e, vehicle_type) for e in ends[1:]):
+        return None
+
+    n = len(waypoints)
+
+    # Chỉ cần các cặp liên tiếp khi giữ nguyên thứ tự
+    if optimize:
+        wanted = {i: [j for j in range(n) if j != i] for i in range(n)}
+    else:
+        wanted = {i: [i + 1] for i in range(n - 1)}
+
+    matrix = [[0.0 if i == j else UNREACHABLE for j in range(n)] for i in range(n)]
+    # (i, j) -> ('direct', leg) hoặc ('tree', node cuối trên cây của i)
+    best_leg: Dict[Tuple[int, int], Tuple[str, Any]] = {}
+    trees: Dict[int, Dict[int, int]] = {}
+
+    for i, targets in wanted.items():
+        settle = set()
+        for j in targets:
+            settle.update(in_costs[j])
+        dist, came_from = pathfinding_service.dijkstra(out_costs[i], vehicle_type, settle=settle)
+        trees[i] = came_from
+
+        for j in targets:
+            for node, tail in in_costs[j].items():
+                if node in dist and dist[node] + tail < matrix[i][j]:
+                    matrix[i][j] = dist[node] + tail
+                    best_leg[(i, j)] = ('tree', node)
+            direct = pathfinding_service.direct_leg(snaps[i], snaps[j], vehicle_type) if settings.snap_to_edges else None
+            if direct is not None:
+                weights = pathfinding_service.graphs[vehicle_type]['current_weights']
+                direct_cost = weights[direct[0]] * direct[1]
+                if direct_cost <= matrix[i][j]:
+                    matrix[i][j] = direct_cost
+                    best_leg[(i, j)] = ('direct', direct)
+
+    if optimize:
+        order = nearest_insertion(matrix, fixed_start, fixed_end)
+        order = two_opt(order, matrix, fixed_start, fixed_end)
+    else:
+        order = list(range(n))
+
+    legs = []
+    for a, b in zip(order, order[1:]):
+        if (a, b) not in best_leg:
+            return None  # Có chặng không đi được
+
+        kind, value = best_leg[(a, b)]
+        start_point, end_point = points[a], points[b]
+        if kind == 'direct':
+            legs.append(pathfinding_service._build_path_payload([], vehicle_type, speed, [value], start_point, end_point))
+            continue
+
+        path = [value]
+        came_from = trees[a]
+        while path[-1] in came_from:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        partial_edges = [out_legs[a][path[0]], in_legs[b][path[-1]]]
+        legs.append(pathfinding_service._build_path_payload(
+            path, vehicle_type, speed, partial_edges, start_point, end_point
+        ))
+
+    result = _merge_payloads(legs)
+    result['order'] = order
+    result['legs'] = [
+        {'from': a, 'to': b, 'distance': leg['distance'], 'cost': leg['cost']}
+        for (a, b), leg in zip(zip(order, order[1:]), legs)
+    ]
+    return result
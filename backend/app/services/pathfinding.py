@@ -3,66 +3,423 @@ Pathfinding Service
 Implements A* algorithm with In-Memory Graph capability for high performance
 """
 import ast
-import heapq
+import hashlib
 import math
-from typing import List, Tuple, Dict, Optional
+import threading
+import time
+from array import array
+from contextlib import contextmanager, nullcontext
+from typing import Callable, List, Tuple, Dict, Optional
 from app.database import get_db_connection
 from app.config import get_settings
+from app.services.spatial import EdgeSnap, SegmentIndex
+from app.services.destination_trees import DestinationTreeCache
+from app.services.components import ComponentIndex
+from app.services.arc_flags import ArcFlagUpdater, flags_path, load_arc_flags
+from app.services.hub_labels import HubLabelOracle, labels_path, load_hub_labels
+from app.services.graph_delta import DeltaEffects, apply_ops, clone_generation, summarize, write_delta
+from app.services.queues import SearchQueue, make_queue
+from app.services.road_classes import arterial_codes, road_class_code, speed_factors, uses_class_speeds
 
 settings = get_settings()
 
+# Hệ số quy đổi trọng số (pixel) sang mét, dùng chung cho mọi phép tính thời gian
+DISTANCE_SCALE = 0.25
+
+# Node ảo đại diện cho điểm đích nằm giữa cạnh (id OSM luôn dương)
+VIRTUAL_GOAL = -1
+
+# Chi phí trả về khi điểm đầu/cuối nằm ở hai thành phần liên thông khác nhau (vd. do đường bị chặn)
+UNREACHABLE_COST = "Unreachable"
+
+# Loại đường tìm phân cấp được đi khi đã ở xa cả hai đầu route
+ARTERIAL_CLASSES = arterial_codes()
+
+# Bit access của từng phương tiện trên base graph dùng chung (thêm profile = thêm một bit)
+PROFILE_BITS = {'car': 1, 'foot': 2}
+
+
 class PathfindingService:
     """Service for pathfinding operations using A* algorithm"""
     
     def __init__(self):
-        # Cấu trúc dữ liệu mới: Lưu trữ 2 đồ thị riêng biệt
-        self.graphs = {
-            'car': {'nodes': {}, 'adj_list': {}, 'original_weights': {}, 'current_weights': {}},
-            'foot': {'nodes': {}, 'adj_list': {}, 'original_weights': {}, 'current_weights': {}}
-        }
         # Mapping để truy cập nhanh
         self.vehicle_types = ['car', 'foot']
-        
-        # Tải dữ liệu 1 lần duy nhất khi khởi động
-        self.load_graph_from_db()
+        # Thế hệ đồ thị đang phục vụ; reload dựng thế hệ mới rồi hoán đổi nguyên khối
+        self._local = threading.local()
+        self._graphs = self._empty_graphs()
+        self.generation = 1
+        self._in_flight: Dict[int, int] = {}
+        # Bảo vệ _in_flight và cặp (generation, _graphs): lease() chạy song song trên routing pool
+        self._generation_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        # Tăng mỗi khi current_weights thay đổi, dùng làm khóa cache
+        self.weight_epoch = 0
+        self._weight_listeners: List[Callable[[int, Optional[Dict[str, Dict[str, set]]]], None]] = []
+        # Cây đường đi ngược cho các đích hay được hỏi
+        self.destination_trees = DestinationTreeCache(self) if settings.dest_tree_enabled else None
+        # Arc flags: cắt tỉa A* theo ô chứa đích, giữ đúng khi kịch bản đổi trọng số
+        self.arc_flag_updater = ArcFlagUpdater(self)
+        # Hub labels: trả lời truy vấn chỉ cần distance/cost không cần tìm kiếm
+        self.hub_labels = HubLabelOracle(self)
+
+        # Trạng thái tải nền: pending -> loading -> ready | failed. Mọi phương tiện đọc vào một base chung
+        # nên đổi trạng thái cùng lúc; chỉ tiến độ (edges_loaded / edges_total) là theo từng bảng
+        self.load_status = {v_type: 'pending' for v_type in self.vehicle_types}
+        self.load_progress = {v_type: {'edges_loaded': 0, 'edges_total': 0} for v_type in self.vehicle_types}
+        self.load_errors: Dict[str, str] = {}
+        self._ready_events = {v_type: threading.Event() for v_type in self.vehicle_types}
+        self._load_thread: Optional[threading.Thread] = None
+        self._load_lock = threading.Lock()
     
-    def load_graph_from_db(self):
-        """Load graph from database into RAM (Run once on startup)"""
-        print("⚡ [RAM] Loading graph from Disk to Memory...")
+    @property
+    def graphs(self) -> Dict[str, Dict]:
+        """Thế hệ đồ thị đã ghim cho thread hiện tại (trong pinned()), nếu không thì thế hệ mới nhất"""
+        pinned = getattr(self._local, 'graphs', None)
+        return pinned if pinned is not None else self._graphs
+
+    @contextmanager
+    def lease(self):
+        """
+        Giữ một thế hệ đồ thị sống (đếm in-flight) mà không ghim vào thread hiện tại.
+        Dùng khi một việc trải qua nhiều thread (vd. batch chia cho routing pool).
+        """
+        with self._generation_lock:
+            generation, graphs = self.generation, self._graphs
+            self._in_flight[generation] = self._in_flight.get(generation, 0) + 1
+        try:
+            yield graphs
+        finally:
+            with self._generation_lock:
+                self._in_flight[generation] -= 1
+                released = not self._in_flight[generation]
+                if released:
+                    del self._in_flight[generation]
+            if released and generation != self.generation:
+                print(f"♻️ [RAM] Graph generation {generation} released.")
+
+    @contextmanager
+    def pinned(self, graphs: Optional[Dict[str, Dict]] = None):
+        """
+        Ghim một thế hệ đồ thị cho cả request (snap + search + payload đọc cùng một thế hệ).
+        Thế hệ cũ được giải phóng khi request cuối cùng đang dùng nó kết thúc.
+        graphs: ghim thế hệ đã được lease() ở nơi khác thay vì thế hệ mới nhất
+        """
+        if getattr(self._local, 'graphs', None) is not None:
+            yield self._local.graphs
+            return
+        if graphs is not None:
+            self._local.graphs = graphs
+            try:
+                yield graphs
+            finally:
+                self._local.graphs = None
+            return
+        with self.lease() as graphs:
+            self._local.graphs = graphs
+            try:
+                yield graphs
+            finally:
+                self._local.graphs = None
+
+    def _empty_graphs(self) -> Dict[str, Dict]:
+        return self._profile_views(self._empty_base(), {v_type: array('d') for v_type in self.vehicle_types})
+
+    @staticmethod
+    def _empty_base() -> Dict:
+        """
+        Topology dùng chung cho mọi phương tiện (một bản duy nhất trong RAM):
+        - adj_list / rev_adj_list: node -> [(node kề, edge id)]
+        - edges[ei] = (u, v), edge_index[(u, v)] = ei
+        - access[ei]: bitmask phương tiện được đi trên cạnh ei
+        - road_class[ei]: mã loại đường (road_classes.ROAD_CLASSES), maxspeed[ei]: km/h (0 = không có)
+        - remap[phương tiện]: id trong bảng nodes_* -> id trong RAM (node trùng id khác toạ độ)
+        """
+        return {
+            'nodes': {}, 'adj_list': {}, 'rev_adj_list': {},
+            'edges': [], 'edge_index': {}, 'access': array('B'),
+            'road_class': array('B'), 'maxspeed': array('f'),
+            'remap': {}, 'segment_index': None
+        }
+
+    def _profile_views(self, base: Dict, original: Dict[str, array],
+                       lengths: Optional[Dict[str, array]] = None) -> Dict[str, Dict]:
+        """
+        Mỗi phương tiện = bit access + mảng trọng số riêng (index theo edge id) trên base dùng chung.
+        Cạnh phương tiện không được đi có trọng số inf.
+        lengths: độ dài cạnh (cho 'distance'); mặc định chính là original_weights (trọng số chưa nhân tốc độ).
+        disabled[ei] = số kịch bản chặn đường đang đóng cạnh ei (> 0 thì search bỏ qua cạnh).
+        """
+        graphs = {}
+        for v_type in self.vehicle_types:
+            mask = PROFILE_BITS[v_type]
+            graphs[v_type] = {
+                'base': base,
+                'nodes': base['nodes'],
+                'adj_list': base['adj_list'],
+                'rev_adj_list': base['rev_adj_list'],
+                'edges': base['edges'],
+                'edge_index': base['edge_index'],
+                'access': base['access'],
+                'road_class': base['road_class'],
+                'maxspeed': base['maxspeed'],
+                'segment_index': base['segment_index'],
+                'mask': mask,
+                'lengths': lengths[v_type] if lengths is not None else original[v_type],
+                'original_weights': original[v_type],
+                'current_weights': array('d', original[v_type]),
+                'disabled': array('I', [0]) * len(base['edges']),
+                'closed_edges': 0,
+                'version': None
+            }
+            self._count_edges(graphs[v_type])
+            graphs[v_type]['version'] = self._graph_fingerprint(graphs[v_type])
+            graphs[v_type]['components'] = ComponentIndex(graphs[v_type]).build()
+            # arc_flags_pristine: bản dựng offline (trọng số gốc); arc_flags: bản đang dùng
+            graphs[v_type]['arc_flags'] = graphs[v_type]['arc_flags_pristine'] = None
+            graphs[v_type]['hub_labels'] = None
+        return graphs
+
+    @staticmethod
+    def _count_edges(graph: Dict):
+        """edge_count và số cạnh đường trục (0 = đồ thị không có loại đường, tìm phân cấp không có tác dụng)"""
+        mask = graph['mask']
+        graph['edge_count'] = sum(1 for a in graph['access'] if a & mask)
+        graph['arterial_edges'] = sum(
+            1 for a, c in zip(graph['access'], graph['road_class']) if a & mask and c in ARTERIAL_CLASSES
+        )
+
+    @staticmethod
+    def edge_id(graph: Dict, u: int, v: int) -> Optional[int]:
+        """Edge id của (u, v) nếu phương tiện của graph được đi trên cạnh đó"""
+        ei = graph['edge_index'].get((u, v))
+        if ei is None or not graph['access'][ei] & graph['mask']:
+            return None
+        return ei
+
+    @staticmethod
+    def open_edge_id(graph: Dict, u: int, v: int) -> Optional[int]:
+        """Như edge_id nhưng bỏ qua cạnh đang bị chặn"""
+        ei = PathfindingService.edge_id(graph, u, v)
+        return ei if ei is not None and not graph['disabled'][ei] else None
+
+    def _load_graphs(self, progress: Optional[Dict[str, Dict]] = None) -> Dict[str, Dict]:
+        """
+        Đọc bảng nodes_*/edges_* của mọi phương tiện vào MỘT base chung.
+        Cạnh (u, v) xuất hiện ở nhiều bảng chỉ được lưu một lần, mỗi phương tiện bật bit access của mình.
+        Cột road_class / maxspeed là tùy chọn (bảng cũ không có thì coi như không rõ loại đường).
+        """
+        base = self._empty_base()
+        nodes = base['nodes']
+        adj_list, rev_adj_list = base['adj_list'], base['rev_adj_list']
+        edges, edge_index, access = base['edges'], base['edge_index'], base['access']
+        road_class, maxspeed = base['road_class'], base['maxspeed']
+        weights = {v_type: array('d') for v_type in self.vehicle_types}
+        inf = float('inf')
+
         with get_db_connection() as conn:
             cursor = conn.cursor()
             for v_type in self.vehicle_types:
-                # Load nodes
-                table_nodes = f"nodes_{v_type}"
-                cursor.execute(f"SELECT id, x, y FROM {table_nodes}")
-                nodes = cursor.fetchall()
-                
-                graph = self.graphs[v_type]
-                
-                for node in nodes:
-                    nid = node['id']
-                    # Giữ nguyên logic lật trục Y của bạn
-                    graph['nodes'][nid] = (node['x'], settings.MAP_HEIGHT - node['y'])
-                    graph['adj_list'][nid] = [] # Khởi tạo danh sách kề
-                
+                mask = PROFILE_BITS[v_type]
+                profile_weights = weights[v_type]
+                remap = base['remap'][v_type] = self._merge_nodes(base, cursor, v_type)
+
                 # Load edges
                 table_edges = f"edges_{v_type}"
-                cursor.execute(f"SELECT node_from, node_to, weight FROM {table_edges}")
-                edges = cursor.fetchall()
-                
-                for edge in edges:
-                    u = edge['node_from']
-                    v = edge['node_to']
-                    w = edge['weight']
-                    
-                    # Chỉ thêm vào nếu cả 2 node đều tồn tại
-                    if u in graph['nodes'] and v in graph['nodes']:
-                        graph['adj_list'][u].append(v)
-                        graph['original_weights'][(u, v)] = w
-            
-                # Khởi tạo trọng số hiện tại bằng trọng số gốc
-                graph['current_weights'] = graph['original_weights'].copy()
-                print(f"✓ [RAM] Loaded {v_type} graph: {len(graph['nodes'])} nodes, {len(graph['original_weights'])} edges")
+                if progress is not None:
+                    cursor.execute(f"SELECT COUNT(*) FROM {table_edges}")
+                    progress[v_type]['edges_total'] = cursor.fetchone()[0]
+                cursor.execute(f"PRAGMA table_info({table_edges})")
+                columns = {row['name'] for row in cursor.fetchall()}
+                has_class, has_maxspeed = 'road_class' in columns, 'maxspeed' in columns
+                extra = "".join(f", {c}" for c, present in (('road_class', has_class), ('maxspeed', has_maxspeed)) if present)
+                cursor.execute(f"SELECT node_from, node_to, weight{extra} FROM {table_edges}")
+
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    for edge in rows:
+                        u = remap.get(edge['node_from'], edge['node_from'])
+                        v = remap.get(edge['node_to'], edge['node_to'])
+
+                        # Chỉ thêm vào nếu cả 2 node đều tồn tại
+                        if u not in nodes or v not in nodes:
+                            continue
+                        ei = edge_index.get((u, v))
+                        if ei is None:
+                            ei = len(edges)
+                            edges.append((u, v))
+                            edge_index[(u, v)] = ei
+                            access.append(0)
+                            road_class.append(0)
+                            maxspeed.append(0.0)
+                            for arr in weights.values():
+                                arr.append(inf)
+                            adj_list[u].append((v, ei))
+                            rev_adj_list[v].append((u, ei))
+                        access[ei] |= mask
+                        profile_weights[ei] = edge['weight']
+                        # Cạnh chung nhiều bảng: giữ giá trị đầu tiên có dữ liệu
+                        if has_class and not road_class[ei]:
+                            road_class[ei] = road_class_code(edge['road_class'])
+                        if has_maxspeed and not maxspeed[ei] and edge['maxspeed']:
+                            maxspeed[ei] = edge['maxspeed']
+                    if progress is not None:
+                        progress[v_type]['edges_loaded'] += len(rows)
+
+        # Chỉ mục không gian theo đoạn thẳng (dùng chung), mỗi đoạn nhớ bitmask phương tiện
+        base['segment_index'] = SegmentIndex(settings.segment_index_cell).build(nodes, edges, access)
+        # Trọng số theo thời gian: độ dài * hệ số tốc độ của cạnh (độ dài giữ riêng cho 'distance')
+        lengths = dict(weights)
+        for v_type in self.vehicle_types:
+            if uses_class_speeds(v_type):
+                factors = speed_factors(road_class, maxspeed, access, PROFILE_BITS[v_type])
+                weights[v_type] = array('d', (w * f for w, f in zip(lengths[v_type], factors)))
+                print(f"✓ [RAM] {v_type} weights scaled by road class speeds")
+        graphs = self._profile_views(base, weights, lengths)
+        versions = self.graph_versions(graphs)
+        for v_type, graph in graphs.items():
+            print(f"✓ [RAM] Loaded {v_type} profile: {graph['edge_count']} edges")
+            flags = load_arc_flags(flags_path(v_type), graph, versions)
+            if flags is not None:
+                # Vừa tải xong: trọng số đang là trọng số gốc nên flags offline dùng được ngay
+                flags.epoch = self.weight_epoch
+                graph['arc_flags'] = graph['arc_flags_pristine'] = flags
+                print(f"✓ [RAM] Loaded {v_type} arc flags: {flags.grid}x{flags.grid} cells")
+            labels = load_hub_labels(labels_path(v_type), versions)
+            if labels is not None:
+                graph['hub_labels'] = labels
+                print(f"✓ [RAM] Loaded {v_type} hub labels: {labels.entries()} entries")
+        print(f"✓ [RAM] Shared base graph: {len(nodes)} nodes, {len(edges)} edges")
+        return graphs
+
+    @staticmethod
+    def _merge_nodes(base: Dict, cursor, v_type: str) -> Dict[int, int]:
+        """
+        Gộp bảng nodes_{v_type} vào base. Id trùng nhưng khác toạ độ (node chia nhỏ cạnh
+        được đánh số riêng cho từng bảng) được cấp id mới; trả về map id cũ -> id mới.
+        """
+        nodes = base['nodes']
+        remap = {}
+        cursor.execute(f"SELECT id, x, y FROM nodes_{v_type}")
+        rows = cursor.fetchall()
+        next_id = max([r['id'] for r in rows] + list(nodes.keys()) + [0]) + 1
+        for node in rows:
+            nid = node['id']
+            # Giữ nguyên logic lật trục Y của bạn
+            pos = (node['x'], settings.MAP_HEIGHT - node['y'])
+            if nid in nodes and nodes[nid] != pos:
+                remap[nid] = next_id
+                nid = next_id
+                next_id += 1
+            if nid not in nodes:
+                nodes[nid] = pos
+                base['adj_list'][nid] = [] # Khởi tạo danh sách kề
+                base['rev_adj_list'][nid] = [] # Danh sách kề ngược (cho tìm kiếm ngược)
+        if remap:
+            print(f"⚠️ [RAM] {len(remap)} {v_type} node ids clash with other profiles, renumbered.")
+        return remap
+
+    @staticmethod
+    def _graph_fingerprint(graph: Dict) -> str:
+        """Phiên bản đồ thị của một phương tiện: hash rẻ trên số node/cạnh, id và trọng số gốc"""
+        id_sum = 0
+        weight_sum = 0.0
+        count = 0
+        mask, access, original = graph['mask'], graph['access'], graph['original_weights']
+        for ei, (u, v) in enumerate(graph['edges']):
+            if access[ei] & mask:
+                id_sum += u * 31 + v
+                weight_sum += original[ei]
+                count += 1
+        raw = f"{len(graph['nodes'])}:{count}:{id_sum}:{weight_sum:.3f}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def graph_versions(self, graphs: Optional[Dict[str, Dict]] = None) -> Dict[str, str]:
+        graphs = graphs if graphs is not None else self._graphs
+        return {v_type: graph['version'] for v_type, graph in graphs.items()}
+
+    def load_graph_from_db(self):
+        """
+        Load graph from database into RAM.
+        Các bảng được đọc lần lượt vào một base chung (cạnh trùng giữa các bảng lưu một lần, chỉ mục
+        không gian dựng trên toàn bộ base), nên không phương tiện nào ready trước khi base dựng xong:
+        mọi phương tiện cùng chuyển sang ready (hoặc failed) một lượt. Đổi lại, topology chỉ tốn RAM một lần.
+        """
+        print("⚡ [RAM] Loading graph from Disk to Memory...")
+        for v_type in self.vehicle_types:
+            self.load_status[v_type] = 'loading'
+            self.load_progress[v_type] = {'edges_loaded': 0, 'edges_total': 0}
+        try:
+            self._graphs = self._load_graphs(self.load_progress)
+            for v_type in self.vehicle_types:
+                self.load_status[v_type] = 'ready'
+        except Exception as e:
+            for v_type in self.vehicle_types:
+                self.load_status[v_type] = 'failed'
+                self.load_errors[v_type] = str(e)
+            print(f"❌ [RAM] Failed to load graph: {e}")
+        finally:
+            for v_type in self.vehicle_types:
+                self._ready_events[v_type].set()
+
+    def start_background_load(self):
+        """Bắt đầu tải đồ thị ở thread nền (gọi lúc startup). Gọi nhiều lần cũng chỉ tải một lần"""
+        with self._load_lock:
+            if self._load_thread is not None:
+                return
+            self._load_thread = threading.Thread(target=self.load_graph_from_db, name="graph-warmup", daemon=True)
+            self._load_thread.start()
+
+    def is_ready(self, vehicle_type: str) -> bool:
+        return self.load_status.get(vehicle_type) == 'ready'
+
+    def wait_until_ready(self, vehicle_type: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        """Chờ đồ thị tải xong (dùng cho script / test)"""
+        self.start_background_load()
+        for v_type in [vehicle_type] if vehicle_type else self.vehicle_types:
+            if not self._ready_events[v_type].wait(timeout):
+                return False
+        return all(self.is_ready(v) for v in ([vehicle_type] if vehicle_type else self.vehicle_types))
+
+    def readiness(self) -> Dict:
+        """Tiến độ tải cho /ready: status chung cho mọi phương tiện (xem load_graph_from_db), tiến độ đọc cạnh theo từng bảng"""
+        graphs = {}
+        for v_type in self.vehicle_types:
+            progress = self.load_progress[v_type]
+            total = progress['edges_total']
+            graphs[v_type] = {
+                'status': self.load_status[v_type],
+                'edges_loaded': progress['edges_loaded'],
+                'edges_total': total,
+                'progress': round(progress['edges_loaded'] / total, 4) if total else (1.0 if self.is_ready(v_type) else 0.0)
+            }
+            if v_type in self.load_errors:
+                graphs[v_type]['error'] = self.load_errors[v_type]
+        return {
+            'ready': all(self.is_ready(v) for v in self.vehicle_types),
+            'graphs': graphs
+        }
+
+    def add_weight_listener(self, listener: Callable[[int, Optional[Dict[str, Dict[str, set]]]], None]):
+        """
+        Đăng ký hàm được gọi mỗi khi trọng số đổi, với (epoch mới, changes). Hàm phải nhanh, không chặn.
+        changes = {phương tiện: {'raised': {edge id}, 'lowered': {edge id}}} (cạnh đắt lên / đóng,
+        cạnh rẻ đi / mở lại); None = có thể đã đổi toàn bộ (reset, reload).
+        """
+        self._weight_listeners.append(listener)
+
+    def _bump_epoch(self, changes: Optional[Dict[str, Dict[str, set]]] = None):
+        self.weight_epoch += 1
+        for listener in self._weight_listeners:
+            listener(self.weight_epoch, changes)
+
+    @staticmethod
+    def _note_change(changes: Optional[Dict[str, Dict[str, set]]], v_type: str, ei: int, raised: bool):
+        if changes is not None:
+            entry = changes.setdefault(v_type, {'raised': set(), 'lowered': set()})
+            entry['raised' if raised else 'lowered'].add(ei)
 
     # --- CÁC HÀM MỚI ĐỂ SCENARIO SERVICE GỌI ---
     
@@ -71,10 +428,96 @@ class PathfindingService:
         Cập nhật trọng số trực tiếp trong RAM.
         Được gọi bởi ScenarioService. KHÔNG CHẠM VÀO DB.
         """
-        if vehicle_type in self.graphs:
-            current_weights = self.graphs[vehicle_type]['current_weights']
-            if (u, v) in current_weights:
-                current_weights[(u, v)] *= penalty
+        if vehicle_type in self._graphs:
+            graph = self._graphs[vehicle_type]
+            ei = self.edge_id(graph, u, v)
+            if ei is not None and penalty != 1:
+                graph['current_weights'][ei] *= penalty
+                self._bump_epoch({vehicle_type: {'raised': {ei} if penalty > 1 else set(), 'lowered': {ei} if penalty < 1 else set()}})
+
+    def apply_edge_factors(self, factors_map: Dict[str, Dict[Tuple[int, int], float]]) -> int:
+        """
+        Đặt current_weights = original_weights * factor cho đúng các cạnh được chỉ định.
+        Dùng để áp dụng/gỡ kịch bản theo delta, không cần reset toàn bộ đồ thị.
+        """
+        changes = {}
+        changed = self._apply_factors_to(self._graphs, factors_map, changes)
+        if changed:
+            self._bump_epoch(changes)
+        return changed
+
+    @staticmethod
+    def _apply_factors_to(graphs: Dict[str, Dict], factors_map: Dict[str, Dict[Tuple[int, int], float]],
+                          changes: Optional[Dict[str, Dict[str, set]]] = None) -> int:
+        """Trả về số cạnh thực sự đổi trọng số; changes (nếu có) nhận các cạnh đắt lên / rẻ đi"""
+        changed = 0
+        for v_type, factors in factors_map.items():
+            if v_type not in graphs:
+                continue
+            graph = graphs[v_type]
+            original_weights = graph['original_weights']
+            current_weights = graph['current_weights']
+            for (u, v), factor in factors.items():
+                ei = PathfindingService.edge_id(graph, u, v)
+                if ei is None:
+                    continue
+                weight = original_weights[ei] * factor
+                if weight != current_weights[ei]:
+                    PathfindingService._note_change(changes, v_type, ei, weight > current_weights[ei])
+                    current_weights[ei] = weight
+                    changed += 1
+        return changed
+
+    def apply_closures(self, closures_map: Dict[str, Dict[Tuple[int, int], int]]) -> int:
+        """
+        Đặt số kịch bản đang chặn cho đúng các cạnh được chỉ định (0 = mở lại).
+        Nhãn thành phần liên thông được cập nhật theo các cạnh đổi trạng thái đóng/mở.
+        """
+        changes = {}
+        changed = self._apply_closures_to(self._graphs, closures_map, changes)
+        if changed:
+            self._bump_epoch(changes)
+        return changed
+
+    @staticmethod
+    def _apply_closures_to(graphs: Dict[str, Dict], closures_map: Dict[str, Dict[Tuple[int, int], int]],
+                           changes: Optional[Dict[str, Dict[str, set]]] = None) -> int:
+        changed = 0
+        for v_type, closures in closures_map.items():
+            if v_type not in graphs:
+                continue
+            graph = graphs[v_type]
+            disabled = graph['disabled']
+            closed, opened = [], []
+            for (u, v), count in closures.items():
+                ei = PathfindingService.edge_id(graph, u, v)
+                if ei is None or bool(disabled[ei]) == bool(count):
+                    if ei is not None:
+                        disabled[ei] = count
+                    continue
+                disabled[ei] = count
+                (closed if count else opened).append(ei)
+                PathfindingService._note_change(changes, v_type, ei, bool(count))
+            if closed:
+                graph['components'].on_closed(closed)
+            if opened:
+                graph['components'].on_opened(opened)
+            graph['closed_edges'] += len(closed) - len(opened)
+            changed += len(closed) + len(opened)
+        return changed
+
+    def apply_edge_delta(
+        self,
+        factors_map: Dict[str, Dict[Tuple[int, int], float]],
+        closures_map: Dict[str, Dict[Tuple[int, int], int]]
+    ) -> int:
+        """Áp dụng hệ số phạt và trạng thái chặn cùng lúc, chỉ tăng weight epoch một lần"""
+        changes = {}
+        changed = self._apply_factors_to(self._graphs, factors_map, changes)
+        changed += self._apply_closures_to(self._graphs, closures_map, changes)
+        if changed:
+            self._bump_epoch(changes)
+        return changed
 
     def reset_weights_in_ram(self):
         """
@@ -82,7 +525,14 @@ class PathfindingService:
         Chỉ mất O(1) hoặc O(N) rất nhanh, không cần đọc lại DB.
         """
         for v_type in self.vehicle_types:
-            self.graphs[v_type]['current_weights'] = self.graphs[v_type]['original_weights'].copy()
+            graph = self._graphs[v_type]
+            graph['current_weights'] = array('d', graph['original_weights'])
+            if graph['closed_edges']:
+                # Mở lại mọi cạnh bị chặn, gán nhãn thành phần lại từ đầu
+                graph['disabled'] = array('I', [0]) * len(graph['edges'])
+                graph['closed_edges'] = 0
+                graph['components'] = ComponentIndex(graph).build()
+        self._bump_epoch()
         print("🔄 [RAM] Graph weights reset to original.")
 
     # --- CÁC HÀM LOGIC A* (Đã sửa để dùng self.current_weights) ---
@@ -101,81 +551,387 @@ class PathfindingService:
         if vehicle_type not in self.graphs:
             return None
             
-        nodes_map = self.graphs[vehicle_type]['nodes']
+        graph = self.graphs[vehicle_type]
+        nodes_map = graph['nodes']
         if not nodes_map:
             return None
         
         min_distance = float('inf')
         nearest_node = None
         
-        # Duyệt qua dict nodes trong RAM
+        # Duyệt qua dict nodes trong RAM (bỏ qua node phương tiện này không đi tới được)
         for node_id, pos in nodes_map.items():
             node_x, node_y = pos
             distance = math.sqrt((node_x - x) ** 2 + (node_y - y) ** 2)
             
-            if distance < min_distance:
+            if distance < min_distance and self._node_has_access(graph, node_id):
                 min_distance = distance
                 nearest_node = node_id
         
         return nearest_node
     
-    def a_star(self, start_id: int, goal_id: int, vehicle_type: str, speed: float) -> Optional[Dict]:
+    @staticmethod
+    def _node_has_access(graph: Dict, node_id: int) -> bool:
+        access, mask = graph['access'], graph['mask']
+        return any(access[ei] & mask for _, ei in graph['adj_list'].get(node_id, ())) or \
+            any(access[ei] & mask for _, ei in graph['rev_adj_list'].get(node_id, ()))
+
+    def snap_to_edge(self, x: float, y: float, vehicle_type: str) -> Optional[EdgeSnap]:
+        """Chiếu điểm (x, y) lên đoạn cạnh gần nhất (phương tiện được đi) qua segment index"""
         if vehicle_type not in self.graphs:
             return None
-            
         graph = self.graphs[vehicle_type]
-        nodes = graph['nodes']
-        
-        if start_id not in nodes or goal_id not in nodes:
+        index = graph.get('segment_index')
+        return index.nearest(x, y, graph['mask'], self._snap_filter(graph)) if index is not None else None
+
+    @classmethod
+    def _snap_filter(cls, graph: Dict):
+        """Khi có cạnh bị chặn: không snap vào đoạn bị chặn cả hai chiều (None = không lọc)"""
+        if not graph['closed_edges']:
             return None
-        
-        open_set = [(0, start_id)]
+        return lambda u, v: cls.open_edge_id(graph, u, v) is not None or cls.open_edge_id(graph, v, u) is not None
+
+    def _snap_legs(self, snap: EdgeSnap, vehicle_type: str, outgoing: bool) -> Dict[int, Tuple[Optional[int], float]]:
+        """
+        Các nửa cạnh nối điểm snap với đồ thị thật: node -> (edge id hoặc None, tỉ lệ độ dài).
+        outgoing=True: từ điểm snap đi ra node; False: từ node đi vào điểm snap.
+        Chỉ dùng chiều cạnh thực sự tồn tại (tôn trọng đường một chiều).
+        """
+        graph = self.graphs[vehicle_type]
+        u, v, t = snap.u, snap.v, snap.t
+        legs = {}
+        forward = self.open_edge_id(graph, u, v)
+        backward = self.open_edge_id(graph, v, u)
+        if forward is not None:
+            if outgoing:
+                legs[v] = (forward, 1 - t)
+            else:
+                legs[u] = (forward, t)
+        if backward is not None:
+            if outgoing:
+                legs[u] = (backward, t)
+            else:
+                legs[v] = (backward, 1 - t)
+        # Điểm snap trùng đầu mút: node đó nối trực tiếp (chi phí 0) bất kể chiều cạnh
+        if t <= 0.0:
+            legs.setdefault(u, (None, 0.0))
+        if t >= 1.0:
+            legs.setdefault(v, (None, 0.0))
+        return legs
+
+    def _leg_costs(self, legs: Dict[int, Tuple[Optional[int], float]], vehicle_type: str) -> Dict[int, float]:
+        """Chi phí từng phần (theo current_weights) của các nửa cạnh"""
+        current_weights = self.graphs[vehicle_type]['current_weights']
+        return {
+            node: current_weights[edge] * fraction if edge is not None else 0.0
+            for node, (edge, fraction) in legs.items()
+        }
+
+    def snap_sources(
+        self, snap: EdgeSnap, vehicle_type: str, outgoing: bool
+    ) -> Tuple[Dict[int, float], Dict[int, Tuple[Optional[int], float]]]:
+        """
+        Nối điểm snap vào đồ thị: (node -> chi phí nửa cạnh, node -> (edge id hoặc None, tỉ lệ)).
+        outgoing=True: nguồn cho tìm kiếm xuôi; False: đích (hoặc nguồn của tìm kiếm ngược).
+        Phần thứ hai dùng để dựng partial_edges của payload.
+        """
+        legs = self._snap_legs(snap, vehicle_type, outgoing)
+        return self._leg_costs(legs, vehicle_type), legs
+
+    def _search(
+        self,
+        sources: Dict[int, float],
+        targets: Dict[int, float],
+        goal_xy: Tuple[float, float],
+        vehicle_type: str,
+        epsilon: float = 0.0,
+        stats: Optional[Dict] = None,
+        queue: Optional[str] = None,
+        hierarchy: bool = False
+    ) -> Optional[Tuple[List[int], float]]:
+        """
+        A* nhiều nguồn / nhiều đích.
+        - sources: node -> chi phí ban đầu (từ điểm xuất phát ảo tới node)
+        - targets: node -> chi phí còn lại (từ node tới điểm đích ảo)
+        - goal_xy: toạ độ điểm đích, dùng cho heuristic Euclid
+        - epsilon > 0: weighted A* (f = g + (1 + epsilon) * h), chi phí <= (1 + epsilon) * tối ưu
+        - stats: nếu có, ghi số node đã mở rộng ('expanded'), cận đạt được ('bound') và bộ đếm hàng đợi
+        - queue: loại hàng đợi (mặc định theo cấu hình của phương tiện)
+        - hierarchy: node cách mọi nguồn và đích quá hierarchy_radius chỉ đi tiếp trên đường trục
+          (không còn chắc tối ưu; không tìm được thì tìm lại đầy đủ)
+        Trả về (danh sách node thật, tổng chi phí) hoặc None.
+        """
+        graph = self.graphs[vehicle_type]
+        nodes = graph['nodes']
+        adj_list = graph['adj_list']
+        access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+        current_weights = graph['current_weights']
+        gx, gy = goal_xy
+        w = 1.0 + epsilon
+        # Arc flags: chỉ đi các cạnh nằm trên đường ngắn nhất vào ô chứa đích
+        flags = self.arc_flag_updater.usable(graph)
+        goal_bits = flags.goal_bits(targets) if flags is not None else 0
+        arc_flags = flags.flags if goal_bits else None
+        # Tìm phân cấp: chỉ có tác dụng khi đồ thị có loại đường
+        restrict = hierarchy and graph['arterial_edges'] > 0
+        if restrict:
+            road_class = graph['road_class']
+            radius_sq = settings.hierarchy_radius ** 2
+            local = [nodes[n] for n in sources if n in nodes] + [goal_xy]
+
+        g_score = {}
         came_from = {}
-        
-        g_score = {node_id: float('inf') for node_id in nodes}
-        g_score[start_id] = 0
-        
-        f_score = {node_id: float('inf') for node_id in nodes}
-        f_score[start_id] = self.heuristic(start_id, goal_id, nodes)
-        
         closed_set = set()
+        # Weighted A*: f không đơn điệu, radix heap sẽ pop sai thứ tự
+        open_set = self._new_queue(vehicle_type, closed_set, queue, monotone=epsilon <= 0)
+        push, pop = open_set.push, open_set.pop
+        for node, cost in sources.items():
+            if node in nodes and cost < g_score.get(node, float('inf')):
+                g_score[node] = cost
+                x, y = nodes[node]
+                push(node, cost + w * math.hypot(gx - x, gy - y))
+
+        incons: Dict[int, float] = {}
         
-        while open_set:
-            current_f, current = heapq.heappop(open_set)
+        while True:
+            entry = pop()
+            if entry is None:
+                break
+            current_f, current = entry
             
-            if current == goal_id:
-                return self._reconstruct_path(came_from, current, vehicle_type, speed)
+            if current == VIRTUAL_GOAL:
+                path = []
+                node = came_from[VIRTUAL_GOAL]
+                path.append(node)
+                while node in came_from:
+                    node = came_from[node]
+                    path.append(node)
+                path.reverse()
+                if stats is not None:
+                    stats['expanded'] = len(closed_set)
+                    stats['bound'] = self._achieved_bound(g_score, open_set, closed_set, incons, nodes, goal_xy, epsilon)
+                    stats['arc_flags'] = arc_flags is not None
+                    stats['queue'] = open_set.stats()
+                    if restrict:
+                        # Đồ thị bị cắt bớt nên không còn cận dưới cho tối ưu
+                        stats['bound'] = None
+                        stats['hierarchy'] = True
+                return path, g_score[VIRTUAL_GOAL]
             
             if current in closed_set:
                 continue
             
             closed_set.add(current)
+            current_g = g_score[current]
+
+            # Node này nối được tới đích ảo -> đẩy đích ảo vào hàng đợi (h = 0)
+            tail = targets.get(current)
+            if tail is not None and current_g + tail < g_score.get(VIRTUAL_GOAL, float('inf')):
+                g_score[VIRTUAL_GOAL] = current_g + tail
+                came_from[VIRTUAL_GOAL] = current
+                push(VIRTUAL_GOAL, current_g + tail)
+
+            arterial_only = False
+            if restrict:
+                x, y = nodes[current]
+                arterial_only = all((x - lx) ** 2 + (y - ly) ** 2 > radius_sq for lx, ly in local)
             
-            # Lấy danh sách hàng xóm từ adj_list
-            for neighbor in graph['adj_list'].get(current, []):
+            # Lấy danh sách hàng xóm từ adj_list (bỏ cạnh phương tiện này không được đi)
+            for neighbor, ei in adj_list.get(current, ()):
+                if not access[ei] & mask or disabled[ei]:
+                    continue
+                if arterial_only and road_class[ei] not in ARTERIAL_CLASSES:
+                    continue
+                if arc_flags is not None and not arc_flags[ei] & goal_bits:
+                    continue
                 if neighbor in closed_set:
+                    if epsilon > 0:
+                        # Weighted A* không mở lại node: ghi g tốt hơn của node đã chốt để tính cận
+                        tentative_g = current_g + current_weights[ei]
+                        if tentative_g < incons.get(neighbor, g_score[neighbor]):
+                            incons[neighbor] = tentative_g
                     continue
                 
                 # QUAN TRỌNG: Lấy trọng số từ current_weights (RAM)
-                edge_weight = graph['current_weights'].get((current, neighbor), float('inf'))
+                tentative_g = current_g + current_weights[ei]
                 
-                tentative_g = g_score[current] + edge_weight
-                
-                if tentative_g < g_score[neighbor]:
+                if tentative_g < g_score.get(neighbor, float('inf')):
                     came_from[neighbor] = current
                     g_score[neighbor] = tentative_g
-                    f_score[neighbor] = tentative_g + self.heuristic(neighbor, goal_id, nodes)
-                    heapq.heappush(open_set, (f_score[neighbor], neighbor))
+                    x, y = nodes[neighbor]
+                    push(neighbor, tentative_g + w * math.hypot(gx - x, gy - y))
         
+        if restrict:
+            # Mạng đường trục không nối được -> tìm lại trên toàn đồ thị (expanded tính cả lượt hỏng)
+            result = self._search(sources, targets, goal_xy, vehicle_type, epsilon, stats, queue)
+            if stats is not None:
+                stats['expanded'] += len(closed_set)
+            return result
+        if stats is not None:
+            stats['expanded'] = len(closed_set)
+            stats['bound'] = None
+            stats['arc_flags'] = arc_flags is not None
+            stats['queue'] = open_set.stats()
         return None
+
+    @staticmethod
+    def _new_queue(vehicle_type: str, settled: set, kind: Optional[str] = None, monotone: bool = True) -> SearchQueue:
+        return make_queue(kind or settings.search_queue_for(vehicle_type), settled, monotone)
+
+    @staticmethod
+    def _achieved_bound(g_score: Dict, open_set: SearchQueue, closed_set: set, incons: Dict[int, float], nodes: Dict,
+                        goal_xy: Tuple[float, float], epsilon: float) -> float:
+        """
+        Cận dưới của tối ưu = min(g + h) trên hàng đợi còn lại và các node đã chốt với g chưa tối ưu
+        (h không nhân hệ số, như ARA*); cận đạt được = chi phí tìm được / cận dưới, không vượt quá 1 + epsilon.
+        """
+        if epsilon <= 0:
+            return 1.0
+        cost = g_score[VIRTUAL_GOAL]
+        gx, gy = goal_xy
+        lower = cost
+        for node in open_set.items():
+            if node == VIRTUAL_GOAL or node in closed_set:
+                continue
+            x, y = nodes[node]
+            lower = min(lower, g_score[node] + math.hypot(gx - x, gy - y))
+        for node, g in incons.items():
+            x, y = nodes[node]
+            lower = min(lower, g + math.hypot(gx - x, gy - y))
+        if lower <= 0:
+            return 1.0
+        return round(min(cost / lower, 1.0 + epsilon), 4)
+
+    def a_star(
+        self, start_id: int, goal_id: int, vehicle_type: str, speed: float,
+        epsilon: float = 0.0, stats: Optional[Dict] = None, hierarchy: bool = False
+    ) -> Optional[Dict]:
+        if vehicle_type not in self.graphs:
+            return None
+            
+        nodes = self.graphs[vehicle_type]['nodes']
+        
+        if start_id not in nodes or goal_id not in nodes:
+            return None
+        
+        result = self._search({start_id: 0.0}, {goal_id: 0.0}, nodes[goal_id], vehicle_type, epsilon, stats,
+                              hierarchy=hierarchy)
+        if result is None:
+            return None
+        return self._build_path_payload(result[0], vehicle_type, speed)
     
-    def _reconstruct_path(self, came_from: Dict, current: int, vehicle_type: str, speed: float) -> Dict:
+    def dijkstra(
+        self,
+        start_id,
+        vehicle_type: str,
+        max_cost: Optional[float] = None,
+        reverse: bool = False,
+        target=None,
+        stretch: float = 0.0,
+        settle: Optional[set] = None,
+        queue: Optional[str] = None
+    ) -> Tuple[Dict[int, float], Dict[int, int]]:
+        """
+        One-to-all Dijkstra over current_weights.
+        - start_id: một node, hoặc dict node -> chi phí ban đầu (nhiều nguồn, vd. điểm snap)
+        - max_cost: dừng khi chi phí vượt ngưỡng
+        - reverse: tìm trên đồ thị ngược (khoảng cách từ mọi node ĐẾN start_id)
+        - target/stretch: khi đã chốt target, giới hạn lại ngưỡng thành (1+stretch) * dist(target);
+          target có thể là dict node -> chi phí còn lại tới đích ảo (vd. điểm snap đích)
+        - settle: dừng sớm khi mọi node trong tập này đã được chốt (one-to-many)
+        - queue: loại hàng đợi (mặc định theo cấu hình của phương tiện)
+        Trả về (dist, came_from); với reverse, came_from[n] là node kế tiếp trên đường đi tới start_id.
+        """
+        if vehicle_type not in self.graphs:
+            return {}, {}
+
         graph = self.graphs[vehicle_type]
+        nodes = graph['nodes']
+        sources = start_id if isinstance(start_id, dict) else {start_id: 0.0}
+        sources = {n: c for n, c in sources.items() if n in nodes}
+        if not sources:
+            return {}, {}
+
+        adj_list = graph['rev_adj_list'] if reverse else graph['adj_list']
+        access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+        current_weights = graph['current_weights']
+
+        dist = dict(sources)
+        came_from = {}
+        closed_set = set()
+        open_set = self._new_queue(vehicle_type, closed_set, queue)
+        push, pop = open_set.push, open_set.pop
+        for n, c in sources.items():
+            push(n, c)
+        remaining = set(settle) & nodes.keys() if settle else None
+        tails = target if isinstance(target, dict) else ({target: 0.0} if target is not None else None)
+        best = float('inf')
+
+        while True:
+            entry = pop()
+            if entry is None:
+                break
+            d, current = entry
+            if current in closed_set:
+                continue
+            if max_cost is not None and d > max_cost:
+                break
+            closed_set.add(current)
+
+            if remaining is not None:
+                remaining.discard(current)
+                if not remaining:
+                    break
+
+            if tails is not None:
+                tail = tails.get(current)
+                if tail is not None and d + tail < best:
+                    best = d + tail
+                if d >= best:
+                    # Mọi node còn lại đều xa hơn -> best là chi phí tối ưu tới đích
+                    bound = best * (1 + stretch)
+                    max_cost = bound if max_cost is None else min(max_cost, bound)
+                    tails = None
+
+            for neighbor, ei in adj_list.get(current, ()):
+                if not access[ei] & mask or disabled[ei] or neighbor in closed_set:
+                    continue
+                nd = d + current_weights[ei]
+                if nd < dist.get(neighbor, float('inf')):
+                    dist[neighbor] = nd
+                    came_from[neighbor] = current
+                    push(neighbor, nd)
+
+        # Chỉ giữ lại các node đã chốt (nằm trong ngưỡng)
+        settled = {n: dist[n] for n in closed_set}
+        return settled, {n: p for n, p in came_from.items() if n in closed_set}
+    
+    def _reconstruct_path(self, came_from: Dict, current: int, vehicle_type: str, speed: float) -> Dict:
         path = [current]
         while current in came_from:
             current = came_from[current]
             path.append(current)
         path.reverse()
+        return self._build_path_payload(path, vehicle_type, speed)
+
+    def _build_path_payload(
+        self,
+        path: List[int],
+        vehicle_type: str,
+        speed: float,
+        partial_edges: List[Tuple[Optional[int], float]] = (),
+        start_point: Optional[Tuple[float, float]] = None,
+        end_point: Optional[Tuple[float, float]] = None
+    ) -> Dict:
+        """
+        Tạo kết quả trả về (toạ độ, khoảng cách, chi phí) từ danh sách node.
+        partial_edges: các nửa cạnh (edge id, tỉ lệ) nối điểm snap ở hai đầu;
+        start_point/end_point: toạ độ điểm snap (node_id = None trong path).
+        """
+        graph = self.graphs[vehicle_type]
+        edge_index = graph['edge_index']
+        lengths = graph['lengths']
+        current_weights = graph['current_weights']
         
         path_coords = []
         total_distance_physical = 0
@@ -186,23 +942,34 @@ class PathfindingService:
             path_coords.append({'node_id': node_id, 'x': x, 'y': y})
             
             if i < len(path) - 1:
-                next_node = path[i+1]
+                ei = edge_index.get((node_id, path[i+1]))
+                if ei is None:
+                    continue
                 
-                # Tính khoảng cách vật lý (Dựa trên trọng số gốc - không bị ảnh hưởng bởi mưa)
-                w_orig = graph['original_weights'].get((node_id, next_node), 0)
-                total_distance_physical += w_orig
+                # Tính khoảng cách vật lý (Dựa trên độ dài cạnh - không bị ảnh hưởng bởi mưa / tốc độ)
+                total_distance_physical += lengths[ei]
                 
                 # Tính chi phí thực tế (Dựa trên trọng số hiện tại - có mưa/tắc)
-                w_curr = graph['current_weights'].get((node_id, next_node), 0)
-                total_cost_weighted += w_curr
+                total_cost_weighted += current_weights[ei]
+
+        # Phần cạnh nối với điểm snap (tính theo tỉ lệ)
+        for ei, fraction in partial_edges:
+            if ei is not None:
+                total_distance_physical += lengths[ei] * fraction
+                total_cost_weighted += current_weights[ei] * fraction
+
+        if start_point is not None:
+            path_coords.insert(0, {'node_id': None, 'x': start_point[0], 'y': start_point[1]})
+        if end_point is not None:
+            path_coords.append({'node_id': None, 'x': end_point[0], 'y': end_point[1]})
         
         # Tính thời gian dựa trên tốc độ (Distance / Speed)
         # Giả sử weight là mét, speed là m/s (hoặc đơn vị tương ứng từ frontend)
         # Nếu speed = 0 hoặc None, tránh chia cho 0
 
         if speed <= 0: speed = 1
-        total_distance_physical*=0.25
-        total_cost_weighted*=0.25
+        total_distance_physical*=DISTANCE_SCALE
+        total_cost_weighted*=DISTANCE_SCALE
         time_cost = round(total_cost_weighted / speed, 2)
         
         if (total_cost_weighted>100000):
@@ -216,9 +983,60 @@ class PathfindingService:
             'nodes': len(path)
         }
     
-    def find_path(self, start_x: float, start_y: float, end_x: float, end_y: float, vehicle_type: str, speed: float) -> Optional[Dict]:
+    def snap_endpoints(self, start_x: float, start_y: float, end_x: float, end_y: float,
+                       vehicle_type: str) -> Optional[Tuple[EdgeSnap, EdgeSnap]]:
+        """
+        Snap hai đầu route một lần để dùng chung cho route_key và route_snapped (gọi trong pinned()).
+        None nếu tắt snap_to_edges hoặc một đầu không snap được (khi đó dùng find_path).
+        """
+        if not settings.snap_to_edges or vehicle_type not in self.graphs:
+            return None
+        start_snap = self.snap_to_edge(start_x, start_y, vehicle_type)
+        end_snap = self.snap_to_edge(end_x, end_y, vehicle_type)
+        if start_snap is None or end_snap is None:
+            return None
+        return start_snap, end_snap
+
+    def route_key(self, start_x: float, start_y: float, end_x: float, end_y: float, vehicle_type: str, speed: float,
+                  epsilon: Optional[float] = None, hierarchy: bool = False,
+                  snaps: Optional[Tuple[EdgeSnap, EdgeSnap]] = None):
+        """
+        Khóa gom request trùng: hai truy vấn cùng khóa chắc chắn cho cùng kết quả.
+        Dùng điểm snap (cạnh + vị trí trên cạnh) và weight epoch; speed đổi đơn vị chi phí nên cũng nằm trong khóa.
+        epsilon (weighted A*) và hierarchy đổi kết quả nên cũng nằm trong khóa.
+        snaps: kết quả snap_endpoints (None -> khóa theo toạ độ)
+        """
+        if snaps is not None:
+            start_snap, end_snap = snaps
+            start = (start_snap.u, start_snap.v, round(start_snap.t, 6))
+            end = (end_snap.u, end_snap.v, round(end_snap.t, 6))
+            return start, end, vehicle_type, speed, epsilon, hierarchy, self.weight_epoch
+        return (start_x, start_y), (end_x, end_y), vehicle_type, speed, epsilon, hierarchy, self.weight_epoch
+
+    def find_path(
+        self, start_x: float, start_y: float, end_x: float, end_y: float, vehicle_type: str, speed: float,
+        epsilon: float = 0.0, stats: Optional[Dict] = None, hierarchy: bool = False, count_hit: bool = True
+    ) -> Optional[Dict]:
+        """
+        epsilon > 0: weighted A* (chi phí <= (1 + epsilon) * tối ưu).
+        stats: nhận 'expanded' và 'bound' của lần tìm (0 và 1.0 nếu không cần tìm kiếm),
+        với hierarchy thêm 'hierarchy' (True nếu route đến từ tìm phân cấp).
+        hierarchy: xa hai đầu route chỉ đi đường trục (xem _search).
+        count_hit: tính request vào độ "nóng" của đích (False cho batch / tính lại nền)
+        """
         if vehicle_type not in self.graphs:
             return None
+        if stats is not None:
+            stats.update(expanded=0, bound=1.0)
+            if hierarchy:
+                stats['hierarchy'] = False
+
+        if settings.snap_to_edges:
+            start_snap = self.snap_to_edge(start_x, start_y, vehicle_type)
+            end_snap = self.snap_to_edge(end_x, end_y, vehicle_type)
+            if start_snap is None or end_snap is None:
+                return None
+            return self.route_snapped(start_snap, end_snap, vehicle_type, speed, epsilon, stats, hierarchy, count_hit)
             
         start_node = self.find_nearest_node(start_x, start_y, vehicle_type)
         end_node = self.find_nearest_node(end_x, end_y, vehicle_type)
@@ -233,16 +1051,250 @@ class PathfindingService:
                 'node_ids': [start_node],
                 'distance': 0, 'cost': 0, 'nodes': 1
             }
+
+
+        if self.separated([start_node], [end_node], vehicle_type):
+            return self._unreachable_payload()
         
-        return self.a_star(start_node, end_node, vehicle_type, speed)
+        return self.a_star(start_node, end_node, vehicle_type, speed, epsilon, stats, hierarchy)
+
+    def separated(self, start_nodes, end_nodes, vehicle_type: str) -> bool:
+        """
+        True nếu chắc chắn không có đường: không node đầu nào cùng thành phần liên thông
+        (yếu, trên các cạnh đang mở) với node cuối nào. Với điểm snap, dùng hai đầu mút cạnh.
+        """
+        components = self.graphs[vehicle_type]['components']
+        start_labels = {components.label(n) for n in start_nodes} - {None}
+        end_labels = {components.label(n) for n in end_nodes} - {None}
+        return not start_labels & end_labels
+
+    @staticmethod
+    def _unreachable_payload() -> Dict:
+        return {'path': [], 'node_ids': [], 'distance': 0, 'cost': UNREACHABLE_COST, 'nodes': 0}
+
+    def snap_many(self, points: List[Tuple[float, float]], vehicle_type: str) -> List[Optional[EdgeSnap]]:
+        """Snap nhiều điểm một lượt; điểm trùng nhau (vd. cùng gốc trong ma trận OD) chỉ tính một lần"""
+        if vehicle_type not in self.graphs:
+            return [None] * len(points)
+        graph = self.graphs[vehicle_type]
+        index, mask = graph.get('segment_index'), graph['mask']
+        if index is None:
+            return [None] * len(points)
+        usable = self._snap_filter(graph)
+        snapped: Dict[Tuple[float, float], Optional[EdgeSnap]] = {}
+        result = []
+        for point in points:
+            if point not in snapped:
+                snapped[point] = index.nearest(point[0], point[1], mask, usable)
+            result.append(snapped[point])
+        return result
+
+    def route_snapped(
+        self, start_snap: EdgeSnap, end_snap: EdgeSnap, vehicle_type: str, speed: float,
+        epsilon: float = 0.0, stats: Optional[Dict] = None, hierarchy: bool = False, count_hit: bool = True
+    ) -> Optional[Dict]:
+        """
+        Tìm đường giữa hai điểm đã snap (dùng cây đích nóng nếu có).
+        count_hit=False: vẫn dùng cây có sẵn nhưng không tính vào độ nóng của đích
+        """
+        if stats is not None:
+            # Trả lời không cần tìm kiếm (khác thành phần / cây đích) là chính xác
+            stats.update(expanded=0, bound=1.0)
+            if hierarchy:
+                stats['hierarchy'] = False
+        # O(1): hai đầu khác thành phần liên thông -> không cần tìm kiếm
+        if self.separated((start_snap.u, start_snap.v), (end_snap.u, end_snap.v), vehicle_type):
+            return self._unreachable_payload()
+        if self.destination_trees is not None:
+            # Đích hay được hỏi: đi theo cây ngược có sẵn, không cần tìm kiếm
+            result = self.destination_trees.route(start_snap, end_snap, vehicle_type, speed, count_hit)
+            if result is not None:
+                return result
+        return self.route_between_snaps(start_snap, end_snap, vehicle_type, speed, epsilon, stats, hierarchy)
+
+    def direct_leg(self, start_snap: EdgeSnap, end_snap: EdgeSnap, vehicle_type: str) -> Optional[Tuple[int, float]]:
+        """Hai điểm cùng nằm trên một đoạn: có thể đi thẳng dọc cạnh (edge id, tỉ lệ)"""
+        if (start_snap.u, start_snap.v) != (end_snap.u, end_snap.v):
+            return None
+        graph = self.graphs[vehicle_type]
+        u, v = start_snap.u, start_snap.v
+        forward = self.open_edge_id(graph, u, v)
+        backward = self.open_edge_id(graph, v, u)
+        if end_snap.t >= start_snap.t and forward is not None:
+            return forward, end_snap.t - start_snap.t
+        if start_snap.t >= end_snap.t and backward is not None:
+            return backward, start_snap.t - end_snap.t
+        return None
+
+    def route_between_snaps(
+        self, start_snap: EdgeSnap, end_snap: EdgeSnap, vehicle_type: str, speed: float,
+        epsilon: float = 0.0, stats: Optional[Dict] = None, hierarchy: bool = False
+    ) -> Optional[Dict]:
+        """Tìm đường giữa hai điểm ảo nằm trên cạnh (xuất phát/kết thúc giữa cạnh)"""
+        current_weights = self.graphs[vehicle_type]['current_weights']
+        sources, out_legs = self.snap_sources(start_snap, vehicle_type, outgoing=True)
+        targets, in_legs = self.snap_sources(end_snap, vehicle_type, outgoing=False)
+        start_point = (start_snap.x, start_snap.y)
+        end_point = (end_snap.x, end_snap.y)
+
+        direct = self.direct_leg(start_snap, end_snap, vehicle_type)
+        result = self._search(
+            sources,
+            targets,
+            end_point,
+            vehicle_type,
+            epsilon,
+            stats,
+            hierarchy=hierarchy
+        )
+
+        if direct is not None:
+            direct_cost = current_weights[direct[0]] * direct[1]
+            if result is None or direct_cost <= result[1]:
+                return self._build_path_payload([], vehicle_type, speed, [direct], start_point, end_point)
+
+        if result is None:
+            return None
+
+        path = result[0]
+        partial_edges = [out_legs[path[0]], in_legs[path[-1]]]
+        return self._build_path_payload(path, vehicle_type, speed, partial_edges, start_point, end_point)
     
-    # Hàm này không còn dùng nữa vì ta update trực tiếp, nhưng để lại cho tương thích ngược nếu cần
-    def reload_graph(self):
-        self.graphs = {
-            'car': {'nodes': {}, 'adj_list': {}, 'original_weights': {}, 'current_weights': {}},
-            'foot': {'nodes': {}, 'adj_list': {}, 'original_weights': {}, 'current_weights': {}}
-        }
-        self.load_graph_from_db()
+    def reload_graph(self, scenario_service=None) -> Dict:
+        """
+        Hot reload kiểu double-buffer:
+        1. Dựng thế hệ đồ thị mới (base chung + profile) trong khi thế hệ cũ vẫn phục vụ
+        2. Tính lại và áp dụng các kịch bản đang chạy lên thế hệ mới
+        3. Hoán đổi nguyên khối; thế hệ cũ được giải phóng khi các search đang chạy kết thúc
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError("A graph reload is already in progress")
+        try:
+            started = time.perf_counter()
+            new_graphs = self._load_graphs()
+
+            if scenario_service is not None:
+                # Hình học tính trước ngoài lock; kịch bản thêm trong lúc đó được tính trong lock
+                recomputed = {
+                    s['id']: scenario_service.affected_edges_for(self, s, new_graphs)
+                    for s in list(scenario_service.active_scenarios)
+                }
+                with scenario_service.lock:
+                    for scenario in scenario_service.active_scenarios:
+                        if scenario['id'] not in recomputed:
+                            recomputed[scenario['id']] = scenario_service.affected_edges_for(self, scenario, new_graphs)
+                        scenario_service.set_affected_edges(
+                            scenario, recomputed[scenario['id']], self.graph_versions(new_graphs)
+                        )
+                    penalized = scenario_service.penalized_edges()
+                    self._apply_factors_to(new_graphs, scenario_service.edge_factors(penalized))
+                    self._apply_closures_to(new_graphs, scenario_service.closure_counts(penalized))
+                    self._swap_generation(new_graphs)
+            else:
+                self._swap_generation(new_graphs)
+
+            build_time = time.perf_counter() - started
+            print(f"🔁 [RAM] Graph generation {self.generation} is live ({build_time:.2f}s).")
+            return {
+                'generation': self.generation,
+                'build_time': round(build_time, 3),
+                'graphs': {
+                    v_type: {'nodes': len(graph['nodes']), 'edges': graph['edge_count']}
+                    for v_type, graph in new_graphs.items()
+                },
+                'in_flight': self.in_flight()
+            }
+        finally:
+            self._reload_lock.release()
+
+    def apply_graph_delta(self, delta: Dict, scenario_service=None) -> Dict:
+        """
+        Cập nhật đồ thị từng phần thay vì reload toàn bộ:
+        1. Ghi delta vào bảng nodes_* / edges_* và graph_changelog (một transaction)
+        2. Áp delta lên bản sao copy-on-write của thế hệ hiện tại (không đọc lại DB)
+        3. Tính lại tập cạnh của các kịch bản trên những cạnh delta chạm tới, áp lại trọng số kịch bản ở đó
+        4. Hoán đổi nguyên khối như reload_graph
+        ValueError: delta không hợp lệ (DB không đổi); RuntimeError: đang reload / base_version đã cũ.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            raise RuntimeError("A graph reload is already in progress")
+        try:
+            started = time.perf_counter()
+            # Giữ lock kịch bản từ lúc sao chép tới lúc hoán đổi để không mất thay đổi kịch bản ở giữa
+            with scenario_service.lock if scenario_service is not None else nullcontext():
+                with get_db_connection() as conn:
+                    version, ops = write_delta(conn.cursor(), delta, self.vehicle_types)
+                    # Lỗi khi áp lên RAM -> transaction rollback, DB và RAM không lệch nhau
+                    new_graphs = clone_generation(self._graphs)
+                    effects = apply_ops(new_graphs, ops)
+                for graph in new_graphs.values():
+                    self._count_edges(graph)
+                    previous = graph['version']
+                    graph['version'] = self._graph_fingerprint(graph)
+                    if graph['version'] != previous:
+                        # Dựng cho đồ thị cũ: search chạy không có chúng tới khi dựng lại (build_arc_flags / build_hub_labels)
+                        graph['arc_flags'] = graph['arc_flags_pristine'] = graph['hub_labels'] = None
+                rederived = 0
+                if scenario_service is not None:
+                    rederived = self._rederive_scenarios(scenario_service, new_graphs, effects)
+                self._swap_generation(new_graphs)
+
+            build_time = time.perf_counter() - started
+            print(f"🧩 [RAM] Graph delta v{version} applied, generation {self.generation} is live ({build_time:.3f}s).")
+            return {
+                'version': version,
+                'generation': self.generation,
+                'build_time': round(build_time, 3),
+                'changes': summarize(ops),
+                'scenarios_rederived': rederived,
+                'graphs': {
+                    v_type: {'nodes': len(graph['nodes']), 'edges': graph['edge_count'], 'version': graph['version']}
+                    for v_type, graph in new_graphs.items()
+                }
+            }
+        finally:
+            self._reload_lock.release()
+
+    def _rederive_scenarios(self, scenario_service, new_graphs: Dict[str, Dict], effects: DeltaEffects) -> int:
+        """
+        Tập cạnh kịch bản trên thế hệ mới: bỏ cạnh đã xoá, chỉ chạy phép thử hình học trên cạnh vừa thêm.
+        Trọng số kịch bản được áp lại trên cạnh thêm / đổi trọng số / vừa vào kịch bản. Trả về số kịch bản đổi tập cạnh.
+        """
+        versions = self.graph_versions(new_graphs)
+        touched = {v_type: set(edges) for v_type, edges in effects.reweighted.items()}
+        rederived = 0
+        for scenario in scenario_service.active_scenarios:
+            old_map = scenario["affected_edges_map"]
+            added = scenario_service.affected_edges_for(self, scenario, new_graphs, effects.added) if effects.added else {}
+            new_map = {}
+            for v_type in set(old_map) | set(added):
+                removed = effects.removed.get(v_type, set())
+                edges = [edge for edge in old_map.get(v_type, []) if edge not in removed]
+                present = set(edges)
+                edges.extend(edge for edge in added.get(v_type, []) if edge not in present)
+                new_map[v_type] = edges
+                touched.setdefault(v_type, set()).update(edge for edge in edges if edge not in present)
+            if new_map != old_map:
+                rederived += 1
+            # Ghi lại cả kịch bản không đổi để tập cạnh đã lưu mang phiên bản đồ thị mới
+            scenario_service.set_affected_edges(scenario, new_map, versions)
+        self._apply_factors_to(new_graphs, scenario_service.edge_factors(touched))
+        self._apply_closures_to(new_graphs, scenario_service.closure_counts(touched))
+        return rederived
+
+    def in_flight(self) -> Dict[int, int]:
+        """Số request đang giữ mỗi thế hệ đồ thị"""
+        with self._generation_lock:
+            return dict(self._in_flight)
+
+    def _swap_generation(self, new_graphs: Dict[str, Dict]):
+        with self._generation_lock:
+            self._graphs = new_graphs
+            self.generation += 1
+        self._bump_epoch()
+        for v_type in self.vehicle_types:
+            self.load_status[v_type] = 'ready'
+            self._ready_events[v_type].set()
 
 
 # Singleton Instance
@@ -252,4 +1304,6 @@ def get_pathfinding_service() -> PathfindingService:
     global _pathfinding_service
     if _pathfinding_service is None:
         _pathfinding_service = PathfindingService()
+        # Đồ thị được tải ở thread nền; request cần đồ thị chưa sẵn sàng sẽ nhận 503
+        _pathfinding_service.start_background_load()
     return _pathfinding_service
\ No newline at end of file
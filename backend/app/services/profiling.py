@@ -0,0 +1,116 @@
+"""
+Profiling Service
+On-demand cProfile runs for single requests and a rolling log of the slowest requests
+"""
+import cProfile
+import heapq
+import itertools
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+from app.config import get_settings
+
+settings = get_settings()
+
+
+def _prune_profiles(directory: str, keep: int):
+    """Chỉ giữ lại `keep` file pstats mới nhất"""
+    files = sorted(
+        (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".pstats")),
+        key=os.path.getmtime
+    )
+    for path in files[:-keep] if keep > 0 else files:
+        os.remove(path)
+
+
+def profile_call(label: str, fn: Callable, *args, **kwargs) -> Tuple[Any, Dict]:
+    """
+    Chạy fn dưới cProfile (profiler deterministic, chỉ đo thread hiện tại).
+    Trả về (kết quả, báo cáo); file pstats được lưu vào settings.profile_dir.
+    """
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+    elapsed = time.perf_counter() - started
+
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    name = f"{int(time.time() * 1000)}-{label}.pstats"
+    stats.dump_stats(os.path.join(settings.profile_dir, name))
+    _prune_profiles(settings.profile_dir, settings.profile_max_files)
+
+    top = []
+    for func in stats.fcn_list[:settings.profile_top_n]:
+        _, calls, tottime, cumtime, _ = stats.stats[func]
+        filename, line, function = func
+        top.append({
+            "function": f"{os.path.basename(filename)}:{line}({function})",
+            "calls": calls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6)
+        })
+
+    return result, {"seconds": round(elapsed, 6), "pstats": name, "top": top}
+
+
+class SlowRequestLog:
+    """Giữ N request chậm nhất (min-heap theo thời gian) cùng input để chạy lại offline"""
+
+    def __init__(self, size: int = settings.slow_request_log_size):
+        self.size = size
+        self._heap: List[Tuple[float, int, Dict]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, inputs: Dict[str, Any], seconds: float):
+        if self.size <= 0:
+            return
+        entry = {
+            "endpoint": endpoint,
+            "inputs": inputs,
+            "seconds": round(seconds, 6),
+            "at": datetime.now(timezone.utc).isoformat()
+        }
+        item = (seconds, next(self._seq), entry)
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            elif seconds > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self) -> List[Dict]:
+        """Chậm nhất trước"""
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+# Singleton Instance
+_slow_log = None
+
+def get_slow_log() -> SlowRequestLog:
+    global _slow_log
+    if _slow_log is None:
+        _slow_log = SlowRequestLog()
+    return _slow_log
+
+
+@contextmanager
+def timed(endpoint: str, inputs: Dict[str, Any]):
+    """Đo thời gian một khối xử lý và ghi vào slow log"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_slow_log().record(endpoint, inputs, time.perf_counter() - started)
@@ -0,0 +1,238 @@
+"""
+Priority Queues
+Interchangeable open-set queues for the search core. Each queue counts its operations
+(pushes, pops, stale pops, decrease-keys, peak size) so scripts/bench_queues.py can pick
+the best queue per vehicle graph.
+"""
+import heapq
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class SearchQueue:
+    """
+    Giao diện chung cho open set của Dijkstra / A*:
+    - push(item, priority): thêm item, hoặc giảm priority của item đã có (decrease-key).
+      Người gọi chỉ push khi priority tốt hơn (g_score / dist giảm).
+    - pop() -> (priority, item): item có priority nhỏ nhất chưa nằm trong settled (None nếu hết)
+    - items(): các item còn chờ trong hàng đợi
+    settled: tập node đã chốt của search (người gọi thêm item vừa pop vào đó); hàng đợi
+    xóa lười coi mọi bản ghi của item đã chốt là bản ghi cũ (stale).
+    Bộ đếm: pushes = số bản ghi ghi vào hàng đợi, max_size = số bản ghi lớn nhất (kể cả bản ghi cũ).
+    decrease_keys chỉ đếm được ở IndexedHeap; với hàng đợi xóa lười nó hiện ra dưới dạng stale_pops.
+    """
+    name = "base"
+    # True: chỉ đúng khi priority pop ra không bao giờ giảm (Dijkstra, A* với h nhất quán)
+    monotone = False
+    # Bộ đếm là thuộc tính thường (rẻ hơn dict trong vòng lặp nóng), gom lại ở stats()
+    COUNTERS = ('pushes', 'pops', 'stale_pops', 'decrease_keys', 'max_size')
+
+    def __init__(self, settled: set):
+        self.settled = settled
+        self.pushes = self.pops = self.stale_pops = self.decrease_keys = self.max_size = 0
+
+    def push(self, item: Hashable, priority: float):
+        raise NotImplementedError
+
+    def pop(self) -> Optional[Tuple[float, Hashable]]:
+        raise NotImplementedError
+
+    def items(self) -> Iterable[Hashable]:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {'queue': self.name, **{name: getattr(self, name) for name in self.COUNTERS}}
+
+
+class LazyHeap(SearchQueue):
+    """heapq với xóa lười: decrease-key đẩy thêm một bản ghi, bản ghi cũ bị bỏ khi pop (stale pop)"""
+    name = "lazy"
+
+    def __init__(self, settled: set):
+        super().__init__(settled)
+        self._heap: List[Tuple[float, Hashable]] = []
+
+    def push(self, item, priority):
+        heapq.heappush(self._heap, (priority, item))
+        self.pushes += 1
+
+    def pop(self):
+        heap, settled = self._heap, self.settled
+        if len(heap) > self.max_size:
+            self.max_size = len(heap)
+        while heap:
+            priority, item = heapq.heappop(heap)
+            if item in settled:
+                self.stale_pops += 1
+                continue
+            self.pops += 1
+            return priority, item
+        return None
+
+    def items(self):
+        return {item for _, item in self._heap if item not in self.settled}
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class IndexedHeap(SearchQueue):
+    """Binary heap có bảng vị trí: decrease-key sift-up tại chỗ, không có bản ghi thừa"""
+    name = "indexed"
+
+    def __init__(self, settled: set):
+        super().__init__(settled)
+        self._heap: List[Hashable] = []
+        self._priority: Dict[Hashable, float] = {}
+        self._pos: Dict[Hashable, int] = {}
+
+    def push(self, item, priority):
+        pos = self._pos.get(item)
+        if pos is not None:
+            if priority >= self._priority[item]:
+                return
+            self._priority[item] = priority
+            self.decrease_keys += 1
+            self._sift_up(pos)
+            return
+        self._priority[item] = priority
+        self._pos[item] = len(self._heap)
+        self._heap.append(item)
+        self._sift_up(len(self._heap) - 1)
+        self.pushes += 1
+        if len(self._heap) > self.max_size:
+            self.max_size = len(self._heap)
+
+    def pop(self):
+        heap = self._heap
+        if not heap:
+            return None
+        top = heap[0]
+        last = heap.pop()
+        del self._pos[top]
+        if heap:
+            heap[0] = last
+            self._pos[last] = 0
+            self._sift_down(0)
+        self.pops += 1
+        return self._priority.pop(top), top
+
+    def _less(self, a, b) -> bool:
+        # Cùng priority: so item như heapq so tuple (priority, item)
+        pa, pb = self._priority[a], self._priority[b]
+        return pa < pb or (pa == pb and a < b)
+
+    def _sift_up(self, i: int):
+        heap, pos = self._heap, self._pos
+        item = heap[i]
+        while i > 0:
+            parent = (i - 1) >> 1
+            if not self._less(item, heap[parent]):
+                break
+            heap[i] = heap[parent]
+            pos[heap[i]] = i
+            i = parent
+        heap[i] = item
+        pos[item] = i
+
+    def _sift_down(self, i: int):
+        heap, pos = self._heap, self._pos
+        n = len(heap)
+        item = heap[i]
+        while True:
+            child = 2 * i + 1
+            if child >= n:
+                break
+            if child + 1 < n and self._less(heap[child + 1], heap[child]):
+                child += 1
+            if not self._less(heap[child], item):
+                break
+            heap[i] = heap[child]
+            pos[heap[i]] = i
+            i = child
+        heap[i] = item
+        pos[item] = i
+
+    def items(self):
+        return self._pos.keys()
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class RadixHeap(SearchQueue):
+    """
+    Radix heap trên chi phí đã nhân scale và làm tròn xuống số nguyên (hàng đợi đơn điệu).
+    Bucket i chứa khóa có bit khác nhau cao nhất so với khóa vừa pop là bit i-1; pop chỉ phải
+    chia lại bucket nhỏ nhất khác rỗng. Thứ tự trong cùng một khóa nguyên là tùy ý, nên chi phí
+    chỉ chính xác tới 1/scale. Khóa không đơn điệu (vd. weighted A*) làm sai thứ tự pop nên
+    make_queue không chọn radix cho search đó; khóa nhỏ hơn khóa vừa pop (sai số làm tròn) được
+    nâng lên bằng nó và đếm vào 'clamped'. Decrease-key xóa lười như LazyHeap.
+    """
+    name = "radix"
+    monotone = True
+    COUNTERS = SearchQueue.COUNTERS + ('clamped',)
+
+    def __init__(self, settled: set, scale: float = 1000.0):
+        super().__init__(settled)
+        self.scale = scale
+        self.clamped = 0
+        self._last = 0
+        self._buckets: List[List[Tuple[int, float, Hashable]]] = [[] for _ in range(65)]
+        self._size = 0
+
+    def push(self, item, priority):
+        key = int(priority * self.scale)
+        if key < self._last:
+            key = self._last
+            self.clamped += 1
+        self._buckets[(key ^ self._last).bit_length()].append((key, priority, item))
+        self._size += 1
+        self.pushes += 1
+        if self._size > self.max_size:
+            self.max_size = self._size
+
+    def pop(self):
+        buckets, settled = self._buckets, self.settled
+        while True:
+            if not buckets[0]:
+                i = 1
+                while i < len(buckets) and not buckets[i]:
+                    i += 1
+                if i == len(buckets):
+                    return None
+                # Khóa nhỏ nhất của bucket i thành mốc mới, chia lại các phần tử vào bucket thấp hơn
+                entries = buckets[i]
+                buckets[i] = []
+                last = self._last = min(entry[0] for entry in entries)
+                for entry in entries:
+                    buckets[(entry[0] ^ last).bit_length()].append(entry)
+            _, priority, item = buckets[0].pop()
+            self._size -= 1
+            if item in settled:
+                self.stale_pops += 1
+                continue
+            self.pops += 1
+            return priority, item
+
+    def items(self):
+        return {entry[2] for bucket in self._buckets for entry in bucket if entry[2] not in self.settled}
+
+    def __len__(self):
+        return self._size
+
+
+QUEUES = {cls.name: cls for cls in (LazyHeap, IndexedHeap, RadixHeap)}
+
+
+def make_queue(kind: str, settled: set, monotone: bool = True) -> SearchQueue:
+    """monotone=False: khóa có thể giảm (weighted A*) -> hàng đợi đơn điệu được thay bằng LazyHeap"""
+    try:
+        queue_cls = QUEUES[kind]
+    except KeyError:
+        raise ValueError(f"Unknown search queue '{kind}' (expected one of {', '.join(QUEUES)})")
+    if queue_cls.monotone and not monotone:
+        queue_cls = LazyHeap
+    return queue_cls(settled)
@@ -0,0 +1,83 @@
+"""
+Road Classes
+OSM highway classes kept from rawprocessing through the edge tables: a one-byte class
+code per edge, per-class travel speeds for cost and the arterial classes that hierarchical
+search keeps once it is away from both ends of the route
+"""
+from array import array
+from typing import Dict, FrozenSet, Optional
+from app.config import get_settings
+
+settings = get_settings()
+
+# Mã loại đường = vị trí trong tuple (0 = không rõ: bảng cũ không có cột road_class, tag lạ)
+ROAD_CLASSES = (
+    'unknown', 'motorway', 'trunk', 'primary', 'secondary', 'tertiary',
+    'unclassified', 'residential', 'living_street', 'service',
+    'pedestrian', 'footway', 'path', 'steps', 'cycleway', 'bridleway'
+)
+CLASS_CODES = {name: code for code, name in enumerate(ROAD_CLASSES)}
+UNKNOWN = 0
+
+
+def road_class_code(highway: Optional[str]) -> int:
+    """Mã của tag highway; *_link tính như đường chính của nó"""
+    if not highway:
+        return UNKNOWN
+    if highway.endswith('_link'):
+        highway = highway[:-len('_link')]
+    return CLASS_CODES.get(highway, UNKNOWN)
+
+
+def class_speeds(raw: str = settings.road_class_speeds) -> Dict[int, float]:
+    """"motorway=80,primary=50" -> {mã: km/h}; tên lạ / tốc độ <= 0 bị bỏ qua"""
+    speeds = {}
+    for pair in raw.split(","):
+        name, _, value = pair.partition("=")
+        code = CLASS_CODES.get(name.strip())
+        if code is None or not value.strip():
+            continue
+        speed = float(value)
+        if speed > 0:
+            speeds[code] = speed
+    return speeds
+
+
+def arterial_codes(raw: str = settings.hierarchy_classes) -> FrozenSet[int]:
+    """Các loại đường tìm phân cấp được mở rộng khi ở xa hai đầu route"""
+    return frozenset(CLASS_CODES[name.strip()] for name in raw.split(",") if name.strip() in CLASS_CODES)
+
+
+def uses_class_speeds(vehicle_type: str) -> bool:
+    return vehicle_type in {v.strip() for v in settings.road_class_speed_vehicles.split(",")}
+
+
+def edge_speed(code: int, maxspeed: float, speeds: Dict[int, float],
+               default: float = settings.road_class_default_speed) -> float:
+    """km/h của một cạnh: maxspeed nếu có, không thì tốc độ theo loại đường"""
+    return maxspeed or speeds.get(code, default)
+
+
+def edge_factor(code: int, maxspeed: float, speeds: Optional[Dict[int, float]] = None,
+                default: float = settings.road_class_default_speed,
+                reference: float = settings.road_class_reference_speed) -> float:
+    """
+    Hệ số nhân vào độ dài cạnh để ra trọng số theo thời gian: tốc độ tham chiếu / tốc độ của cạnh
+    (maxspeed nếu có, không thì tốc độ theo loại đường). Chỉ phụ thuộc chính cạnh đó.
+    Cạnh nhanh hơn tốc độ tham chiếu giữ hệ số 1 để heuristic Euclid vẫn là cận dưới;
+    cạnh không rõ loại đường và không có maxspeed (bảng cũ) giữ nguyên độ dài.
+    """
+    if code == UNKNOWN and not maxspeed:
+        return 1.0
+    speeds = class_speeds() if speeds is None else speeds
+    return max(1.0, reference / edge_speed(code, maxspeed, speeds, default))
+
+
+def speed_factors(road_class: array, maxspeed: array, access: array, mask: int,
+                  speeds: Optional[Dict[int, float]] = None) -> array:
+    """edge_factor của mọi cạnh phương tiện được đi (1 cho cạnh khác), index theo edge id"""
+    speeds = class_speeds() if speeds is None else speeds
+    return array('d', (
+        edge_factor(road_class[ei], maxspeed[ei], speeds) if access[ei] & mask else 1.0
+        for ei in range(len(access))
+    ))
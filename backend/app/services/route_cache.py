@@ -0,0 +1,186 @@
+"""
+Route Cache
+LRU of /api/path results with an edge -> cached routes reverse index, so a weight
+change evicts only the routes it can affect instead of the whole cache
+"""
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+from app.config import get_settings
+from app.services.pathfinding import DISTANCE_SCALE, get_pathfinding_service
+
+settings = get_settings()
+
+# cost trả về đã làm tròn 2 chữ số -> cộng thêm nửa đơn vị làm tròn khi đổi ngược về trọng số
+COST_ROUNDING = 0.005
+
+
+def route_edges(graph: Dict, result: Dict, ends: Tuple) -> Set[int]:
+    """
+    Edge id các cạnh route đi qua. ends = (đầu, cuối) của route_key: (u, v, t) khi snap vào cạnh,
+    khi đó cả hai chiều của đoạn snap được tính (nửa cạnh nối điểm snap).
+    """
+    edge_index = graph['edge_index']
+    node_ids = result['node_ids']
+    edges = {edge_index[pair] for pair in zip(node_ids, node_ids[1:]) if pair in edge_index}
+    for end in ends:
+        if len(end) == 3:
+            u, v, _ = end
+            edges.update(edge_index[pair] for pair in ((u, v), (v, u)) if pair in edge_index)
+    return edges
+
+
+def weight_cost(result: Dict, speed: float) -> float:
+    """Chi phí của payload quy về đơn vị trọng số (cận trên, inf nếu không có đường / bị chặn)"""
+    cost = result['cost']
+    if isinstance(cost, str):
+        return math.inf
+    # Ngược với _build_path_payload: cost = w * DISTANCE_SCALE / speed (speed <= 0 coi là 1)
+    return (cost + COST_ROUNDING) * (speed if speed > 0 else 1) / DISTANCE_SCALE
+
+
+def route_ends(result: Dict) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    path = result['path']
+    if not path:
+        return (0.0, 0.0), (0.0, 0.0)
+    return (path[0]['x'], path[0]['y']), (path[-1]['x'], path[-1]['y'])
+
+
+def cheaper_edges(graph: Dict, lowered: Set[int]) -> List[Tuple[Tuple[float, float], float, Tuple[float, float]]]:
+    """(toạ độ u, w(u, v), toạ độ v) của các cạnh vừa rẻ đi và đang mở"""
+    nodes, edges, weights = graph['nodes'], graph['edges'], graph['current_weights']
+    disabled = graph['disabled']
+    return [(nodes[edges[ei][0]], weights[ei], nodes[edges[ei][1]]) for ei in lowered if not disabled[ei]]
+
+
+def may_improve(start: Tuple[float, float], end: Tuple[float, float], limit: float, cheaper: List) -> bool:
+    """Có đường qua một cạnh rẻ đi mà cận dưới |start, u| + w(u, v) + |v, end| < limit hay không"""
+    (sx, sy), (tx, ty) = start, end
+    for (ux, uy), w, (vx, vy) in cheaper:
+        if math.hypot(ux - sx, uy - sy) + w + math.hypot(tx - vx, ty - vy) < limit:
+            return True
+    return False
+
+
+@dataclass
+class CachedRoute:
+    """cost: chi phí theo đơn vị trọng số (cận trên, inf nếu không có đường)"""
+    vehicle_type: str
+    result: Dict
+    edges: Set[int]
+    cost: float
+    start: Tuple[float, float]
+    end: Tuple[float, float]
+    epsilon: float
+
+
+class RouteCache:
+    """
+    Khóa = route_key không có weight epoch. Khi trọng số đổi, entry chỉ bị loại nếu có thể sai:
+    - cạnh đắt lên / bị đóng: route đi qua cạnh đó (tra reverse index cạnh -> khóa)
+    - cạnh rẻ đi / mở lại: route đi qua cạnh đó, và route mà một đường đi qua cạnh (u, v) có thể
+      rẻ hơn: cận dưới |start, u| + w(u, v) + |v, end| (heuristic Euclid như A*) < cost / (1 + epsilon)
+    - changes None (reset / reload đồ thị): xóa hết
+    """
+
+    def __init__(self, pathfinding_service, size: int = settings.route_cache_size):
+        self.pf = pathfinding_service
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, CachedRoute]" = OrderedDict()
+        self._by_edge: Dict[Tuple[str, int], Set[Hashable]] = {}
+        self.counters = {
+            'hits': 0, 'misses': 0, 'stores': 0, 'lru_evictions': 0,
+            'invalidated_path': 0, 'invalidated_bound': 0, 'invalidated_full': 0, 'kept': 0
+        }
+
+        pathfinding_service.add_weight_listener(self._on_weight_change)
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry.result
+
+    def put(self, key: Hashable, epoch: int, result: Dict, vehicle_type: str, speed: float, epsilon: float = 0.0):
+        """Lưu kết quả vừa tính ở weight epoch `epoch` (gọi trong pinned(), cùng thế hệ đồ thị với lần tìm)"""
+        edges = route_edges(self.pf.graphs[vehicle_type], result, (key[0], key[1]))
+        entry = CachedRoute(vehicle_type, result, edges, weight_cost(result, speed), *route_ends(result), epsilon)
+
+        with self._lock:
+            # Trọng số đã đổi trong lúc tìm -> kết quả có thể đã cũ, không lưu
+            if epoch != self.pf.weight_epoch:
+                return
+            if key in self._entries:
+                self._unlink(key)
+            self._entries[key] = entry
+            for ei in edges:
+                self._by_edge.setdefault((vehicle_type, ei), set()).add(key)
+            self.counters['stores'] += 1
+            while len(self._entries) > self.size:
+                self._unlink(next(iter(self._entries)))
+                self.counters['lru_evictions'] += 1
+
+    def _unlink(self, key: Hashable):
+        entry = self._entries.pop(key)
+        for ei in entry.edges:
+            keys = self._by_edge.get((entry.vehicle_type, ei))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_edge[(entry.vehicle_type, ei)]
+
+    def _on_weight_change(self, epoch: int, changes: Optional[Dict[str, Dict[str, set]]]):
+        with self._lock:
+            if not self._entries:
+                return
+            if changes is None:
+                self.counters['invalidated_full'] += len(self._entries)
+                self._entries.clear()
+                self._by_edge.clear()
+                return
+
+            on_path, by_bound = set(), set()
+            for v_type, change in changes.items():
+                for ei in change['raised'] | change['lowered']:
+                    on_path.update(self._by_edge.get((v_type, ei), ()))
+                if change['lowered']:
+                    by_bound.update(self._improvable(v_type, change['lowered']) - on_path)
+
+            for key in on_path | by_bound:
+                self._unlink(key)
+            self.counters['invalidated_path'] += len(on_path)
+            self.counters['invalidated_bound'] += len(by_bound)
+            self.counters['kept'] += len(self._entries)
+
+    def _improvable(self, vehicle_type: str, lowered: Set[int]) -> Set[Hashable]:
+        """Route của phương tiện có thể có đường mới rẻ hơn đi qua một cạnh vừa rẻ đi"""
+        cheaper = cheaper_edges(self.pf.graphs[vehicle_type], lowered)
+        if not cheaper:
+            return set()
+        return {
+            key for key, entry in self._entries.items()
+            if entry.vehicle_type == vehicle_type
+            and may_improve(entry.start, entry.end, entry.cost / (1.0 + entry.epsilon), cheaper)
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'size': self.size, 'indexed_edges': len(self._by_edge), **self.counters}
+
+
+# Singleton Instance
+_route_cache = None
+
+def get_route_cache() -> Optional[RouteCache]:
+    """None nếu route_cache_size = 0 (tắt cache)"""
+    global _route_cache
+    if _route_cache is None and settings.route_cache_size > 0:
+        _route_cache = RouteCache(get_pathfinding_service())
+    return _route_cache
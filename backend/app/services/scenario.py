@@ -1,96 +1,368 @@
 """
 Scenario Management Service
-Handles geometric calculations for scenarios using In-Memory Graph data
+Handles geometric calculations for scenarios using In-Memory Graph data.
+Active scenarios are mirrored to SQLite (ScenarioStore) so they survive restarts.
 """
 import math
-from typing import List, Tuple, Dict, Any
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, List, Tuple, Dict, Any, Optional
+from app.services.scenario_store import ScenarioStore
 
 class ScenarioService:
-    """Service for managing scenarios logic without touching DB"""
+    """Service for managing scenarios logic (weights in RAM, scenario list mirrored to DB)"""
     
-    def __init__(self):
+    def __init__(self, store: Optional[ScenarioStore] = None):
         # Lưu trữ metadata các kịch bản đang chạy
         self.active_scenarios: List[Dict[str, Any]] = []
         self.counter_id = 1
+        # None = chỉ giữ trong RAM
+        self.store = store
+        # Bảo vệ danh sách kịch bản + trọng số khi scheduler chạy ở thread riêng
+        self.lock = threading.RLock()
+        # Khôi phục từ DB chạy đúng một lần; tạo/sửa kịch bản phải đợi xong (tránh trùng id)
+        self._restore_lock = threading.Lock()
+        self.restored = threading.Event()
 
     def calculate_affected_edges(
         self, 
         pathfinding_service, 
         line_p1: Tuple[float, float], 
         line_p2: Tuple[float, float], 
-        threshold: float
+        threshold: float,
+        graphs: Optional[Dict[str, Dict]] = None,
+        edge_ids: Optional[Iterable[int]] = None
     ) -> Dict[str, List[Tuple[int, int]]]:
         """
         Tính toán các cạnh bị ảnh hưởng dựa trên dữ liệu RAM của PathfindingService.
+        Phép thử hình học chạy MỘT lần trên base graph dùng chung, rồi chia cạnh cho
+        từng phương tiện theo bit access.
+        graphs: tính trên một thế hệ đồ thị khác (vd. đồ thị mới khi hot reload)
+        edge_ids: chỉ xét các cạnh này (vd. cạnh vừa thêm bởi graph delta)
         """
-        affected_edges_by_type = {'car': [], 'foot': []}
+        graphs = graphs if graphs is not None else pathfinding_service.graphs
+        affected_edges_by_type = {v_type: [] for v_type in graphs}
+        profiles = [(v_type, graph['mask'], affected_edges_by_type[v_type]) for v_type, graph in graphs.items()]
+        base = next(iter(graphs.values()))['base']
+        nodes = base['nodes']
+        access = base['access']
         
         # 2. Chuẩn bị Vector đường vẽ (Nét vẽ của Admin)
         line_vec_x = line_p2[0] - line_p1[0]
         line_vec_y = line_p2[1] - line_p1[1]
         len_sq = line_vec_x ** 2 + line_vec_y ** 2
         
-        # 3. Duyệt qua cả 2 loại phương tiện
-        for v_type in ['car', 'foot']:
-            graph = pathfinding_service.graphs[v_type]
-            nodes = graph['nodes']
-            edges_dict = graph['original_weights']
+        # 3. Duyệt mỗi cạnh của base một lần
+        base_edges = base['edges']
+        candidates = enumerate(base_edges) if edge_ids is None else ((ei, base_edges[ei]) for ei in edge_ids)
+        for ei, (u, v) in candidates:
+            if not access[ei]:
+                continue  # Ô trống do graph delta xoá cạnh (node có thể đã bị xoá)
+            p1 = nodes[u] # (x1, y1)
+            p2 = nodes[v] # (x2, y2)
             
-            for (u, v), _ in edges_dict.items():
-                # Lấy toạ độ Node từ RAM
-                if u not in nodes or v not in nodes:
-                    continue
-                    
-                p1 = nodes[u] # (x1, y1)
-                p2 = nodes[v] # (x2, y2)
-                
-                # --- TOÁN HỌC HÌNH CHIẾU ---
-                mid_x = (p1[0] + p2[0]) / 2
-                mid_y = (p1[1] + p2[1]) / 2
-                
-                if len_sq == 0:
-                    # Trường hợp Mưa (Điểm tròn)
-                    closest_x, closest_y = line_p1
-                else:
-                    # Trường hợp Chặn đường (Đoạn thẳng)
-                    dot = (mid_x - line_p1[0]) * line_vec_x + (mid_y - line_p1[1]) * line_vec_y
-                    t = max(0, min(1, dot / len_sq))
-                    closest_x = line_p1[0] + t * line_vec_x
-                    closest_y = line_p1[1] + t * line_vec_y
-                
-                # Tính khoảng cách
-                dist = math.sqrt((mid_x - closest_x) ** 2 + (mid_y - closest_y) ** 2)
-                
-                if dist < threshold:
-                    affected_edges_by_type[v_type].append((u, v))
+            # --- TOÁN HỌC HÌNH CHIẾU ---
+            mid_x = (p1[0] + p2[0]) / 2
+            mid_y = (p1[1] + p2[1]) / 2
+            
+            if len_sq == 0:
+                # Trường hợp Mưa (Điểm tròn)
+                closest_x, closest_y = line_p1
+            else:
+                # Trường hợp Chặn đường (Đoạn thẳng)
+                dot = (mid_x - line_p1[0]) * line_vec_x + (mid_y - line_p1[1]) * line_vec_y
+                t = max(0, min(1, dot / len_sq))
+                closest_x = line_p1[0] + t * line_vec_x
+                closest_y = line_p1[1] + t * line_vec_y
+            
+            # Tính khoảng cách
+            dist = math.sqrt((mid_x - closest_x) ** 2 + (mid_y - closest_y) ** 2)
+            
+            if dist < threshold:
+                # Chia cho các phương tiện được đi trên cạnh này
+                for v_type, mask, edges in profiles:
+                    if access[ei] & mask:
+                        edges.append((u, v))
                 
         return affected_edges_by_type
     
-    def add_scenario(self, scenario_data: Dict, affected_edges_map: Dict[str, List[Tuple[int, int]]]):
-        """Lưu kịch bản vào danh sách tạm"""
+    def affected_edges_for(self, pathfinding_service, scenario: Dict, graphs: Optional[Dict[str, Dict]] = None,
+                           edge_ids: Optional[Iterable[int]] = None):
+        """Tính lại hình học cho một kịch bản đã lưu"""
+        return self.calculate_affected_edges(
+            pathfinding_service=pathfinding_service,
+            line_p1=(scenario["line_start"]["lng"], scenario["line_start"]["lat"]),
+            line_p2=(scenario["line_end"]["lng"], scenario["line_end"]["lat"]),
+            threshold=scenario["threshold"],
+            graphs=graphs,
+            edge_ids=edge_ids
+        )
+    
+    def add_scenario(
+        self,
+        scenario_data: Dict,
+        affected_edges_map: Dict[str, List[Tuple[int, int]]],
+        graph_versions: Optional[Dict[str, str]] = None
+    ):
+        """Lưu kịch bản (DB + danh sách RAM), chưa áp dụng trọng số"""
         total_edges = sum(len(edges) for edges in affected_edges_map.values())
-        new_scenario = {
-            "id": self.counter_id,
-            "active": True,
-            **scenario_data,
-            "affected_edges_map": affected_edges_map, # Lưu map {type: [edges]}
-            "affected_edges": total_edges  # Tổng số lượng cạnh
-        }
-        self.active_scenarios.append(new_scenario)
-        self.counter_id += 1
+        with self.lock:
+            if self.store is not None:
+                # id kế tiếp không được trùng kịch bản đã lưu (INSERT OR REPLACE sẽ ghi đè)
+                self.counter_id = max(self.counter_id, self.store.max_id() + 1)
+            new_scenario = {
+                "id": self.counter_id,
+                **scenario_data,
+                "active": False,  # True khi trọng số đã được áp dụng
+                "affected_edges_map": affected_edges_map, # Lưu map {type: [edges]}
+                "affected_edges": total_edges  # Tổng số lượng cạnh
+            }
+            if self.store is not None:
+                self.store.save(new_scenario, graph_versions or {})
+            self.active_scenarios.append(new_scenario)
+            self.counter_id += 1
         return new_scenario
 
+    def set_affected_edges(self, scenario: Dict, affected_edges_map: Dict[str, List[Tuple[int, int]]], graph_versions: Dict[str, str]):
+        """Cập nhật tập cạnh sau khi tính lại hình học (vd. đồ thị đổi phiên bản)"""
+        scenario["affected_edges_map"] = affected_edges_map
+        scenario["affected_edges"] = sum(len(edges) for edges in affected_edges_map.values())
+        if self.store is not None:
+            self.store.save_edges(scenario, graph_versions)
+
+    def get_scenario(self, scenario_id: int) -> Optional[Dict]:
+        with self.lock:
+            return next((s for s in self.active_scenarios if s["id"] == scenario_id), None)
+
+    def update_scenario(self, pathfinding_service, scenario_id: int, changes: Dict[str, Any]) -> Optional[Tuple[Dict, Dict[str, int]]]:
+        """
+        Di chuyển / đổi hình dạng kịch bản đang có (vd. vùng mưa trôi dần).
+        Chỉ tính lại trọng số trên hiệu đối xứng giữa tập cạnh cũ và mới (cạnh rời vùng được gỡ phạt,
+        cạnh mới vào vùng bị phạt); đổi penalty_weight thì tính lại cả tập cạnh cũ lẫn mới.
+        Trả về (kịch bản, {'added', 'removed', 'kept'}) hoặc None nếu không tìm thấy.
+        """
+        with self.lock:
+            scenario = self.get_scenario(scenario_id)
+            if scenario is None:
+                return None
+            old_map = {v_type: set(edges) for v_type, edges in scenario["affected_edges_map"].items()}
+            reweigh = changes.get("penalty_weight", scenario["penalty_weight"]) != scenario["penalty_weight"]
+            # Tính trên bản sao: hình học lỗi thì kịch bản trong RAM vẫn giữ nguyên
+            new_map = self.affected_edges_for(pathfinding_service, {**scenario, **changes})
+
+            touched: Dict[str, set] = {}
+            diff = {'added': 0, 'removed': 0, 'kept': 0}
+            for v_type in old_map.keys() | new_map.keys():
+                old, new = old_map.get(v_type, set()), set(new_map.get(v_type, ()))
+                diff['added'] += len(new - old)
+                diff['removed'] += len(old - new)
+                diff['kept'] += len(old & new)
+                touched[v_type] = (old | new) if reweigh else (old ^ new)
+
+            scenario.update(changes)
+            scenario["affected_edges_map"] = new_map
+            scenario["affected_edges"] = sum(len(edges) for edges in new_map.values())
+            if self.store is not None:
+                self.store.save(scenario, pathfinding_service.graph_versions())
+            if scenario["active"]:
+                self._apply_edges(pathfinding_service, touched)
+        return scenario, diff
+
     def remove_scenario(self, scenario_id: int):
-        """Xóa kịch bản khỏi danh sách"""
-        scenario = next((s for s in self.active_scenarios if s["id"] == scenario_id), None)
-        if scenario:
-            self.active_scenarios.remove(scenario)
-            return True
-        return False
+        """Xóa kịch bản khỏi danh sách, trả về kịch bản đã xóa (hoặc None)"""
+        with self.lock:
+            scenario = next((s for s in self.active_scenarios if s["id"] == scenario_id), None)
+            if scenario:
+                self.active_scenarios.remove(scenario)
+                if self.store is not None:
+                    self.store.delete(scenario_id)
+            return scenario
 
     def clear_all(self):
         """Xóa sạch sành sanh"""
-        self.active_scenarios = []
+        with self.lock:
+            self.active_scenarios = []
+            if self.store is not None:
+                self.store.clear()
+
+    def ensure_restored(self, pathfinding_service) -> None:
+        """Khôi phục kịch bản nếu chưa làm; nếu thread khởi động đang khôi phục thì chờ nó xong"""
+        if self.restored.is_set():
+            return
+        with self._restore_lock:
+            if not self.restored.is_set():
+                self.restore(pathfinding_service)
+                self.restored.set()
+
+    def restore(self, pathfinding_service, now: Optional[datetime] = None) -> int:
+        """
+        Khôi phục kịch bản từ DB khi khởi động.
+        Tập cạnh đã lưu được dùng lại nếu phiên bản đồ thị không đổi; chỉ tính lại hình học
+        cho phương tiện có đồ thị khác phiên bản. Trọng số được áp dụng một lượt (bulk).
+        """
+        if self.store is None:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        versions = pathfinding_service.graph_versions()
+
+        with self.lock:
+            for data, stored_edges in self.store.load_all():
+                if data.get("ends_at") is not None and now >= data["ends_at"]:
+                    self.store.delete(data["id"])
+                    continue
+
+                edges_map = {
+                    v_type: edges for v_type, (version, edges) in stored_edges.items()
+                    if version == versions.get(v_type)
+                }
+                stale = [v_type for v_type in versions if v_type not in edges_map]
+                if stale:
+                    recomputed = self.affected_edges_for(pathfinding_service, data)
+                    edges_map.update({v_type: recomputed[v_type] for v_type in stale})
+
+                scenario = {
+                    **data,
+                    "active": self.is_in_window(data, now),
+                    "affected_edges_map": edges_map,
+                    "affected_edges": sum(len(edges) for edges in edges_map.values())
+                }
+                if stale:
+                    self.store.save_edges(scenario, versions)
+                self.active_scenarios.append(scenario)
+                self.counter_id = max(self.counter_id, scenario["id"] + 1)
+
+            self._apply_edges(pathfinding_service, self.penalized_edges())
+        print(f"♻️ Restored {len(self.active_scenarios)} scenarios from database.")
+        return len(self.active_scenarios)
+
+    # --- KHUNG THỜI GIAN (starts_at / ends_at) ---
+
+    @staticmethod
+    def is_in_window(scenario: Dict, now: datetime) -> bool:
+        """Kịch bản có hiệu lực tại thời điểm now hay không"""
+        starts_at = scenario.get("starts_at")
+        ends_at = scenario.get("ends_at")
+        if starts_at is not None and now < starts_at:
+            return False
+        if ends_at is not None and now >= ends_at:
+            return False
+        return True
+
+    def edge_factors(self, edges_map: Dict[str, List[Tuple[int, int]]]) -> Dict[str, Dict[Tuple[int, int], float]]:
+        """
+        Tính hệ số phạt tổng hợp (tích penalty của các kịch bản đang active)
+        cho đúng các cạnh trong edges_map. Cạnh không còn kịch bản nào -> hệ số 1.
+        """
+        factors = {v_type: {edge: 1.0 for edge in edges} for v_type, edges in edges_map.items()}
+        for scenario in self.active_scenarios:
+            if not scenario["active"] or self.is_closure(scenario):
+                continue
+            penalty = scenario["penalty_weight"]
+            for v_type, edges in scenario["affected_edges_map"].items():
+                wanted = factors.get(v_type)
+                if not wanted:
+                    continue
+                for edge in edges:
+                    if edge in wanted:
+                        wanted[edge] *= penalty
+        return factors
+
+    @staticmethod
+    def is_closure(scenario: Dict) -> bool:
+        """Kịch bản chặn đường đóng hẳn cạnh thay vì nhân trọng số"""
+        return scenario.get("scenario_type") == "block"
+
+    def closure_counts(self, edges_map: Dict[str, List[Tuple[int, int]]]) -> Dict[str, Dict[Tuple[int, int], int]]:
+        """
+        Số kịch bản chặn đường đang active trên đúng các cạnh trong edges_map.
+        Cạnh không còn kịch bản chặn nào -> 0 (mở lại).
+        """
+        counts = {v_type: {edge: 0 for edge in edges} for v_type, edges in edges_map.items()}
+        for scenario in self.active_scenarios:
+            if not scenario["active"] or not self.is_closure(scenario):
+                continue
+            for v_type, edges in scenario["affected_edges_map"].items():
+                wanted = counts.get(v_type)
+                if not wanted:
+                    continue
+                for edge in edges:
+                    if edge in wanted:
+                        wanted[edge] += 1
+        return counts
+
+    def penalized_edges(self) -> Dict[str, set]:
+        """Hợp các cạnh của mọi kịch bản đang active"""
+        edges_map: Dict[str, set] = {}
+        for scenario in self.active_scenarios:
+            if scenario["active"]:
+                for v_type, edges in scenario["affected_edges_map"].items():
+                    edges_map.setdefault(v_type, set()).update(edges)
+        return edges_map
+
+    def _apply_delta(self, pathfinding_service, scenarios: List[Dict]):
+        """Tính lại trọng số chỉ trên các cạnh của những kịch bản vừa đổi trạng thái"""
+        edges_map: Dict[str, set] = {}
+        for scenario in scenarios:
+            for v_type, edges in scenario["affected_edges_map"].items():
+                edges_map.setdefault(v_type, set()).update(edges)
+        self._apply_edges(pathfinding_service, edges_map)
+
+    def _apply_edges(self, pathfinding_service, edges_map: Dict[str, set]):
+        """Tính lại hệ số phạt + trạng thái chặn trên đúng các cạnh này (một lần tăng weight epoch)"""
+        if any(edges_map.values()):
+            pathfinding_service.apply_edge_delta(self.edge_factors(edges_map), self.closure_counts(edges_map))
+
+    def activate(self, pathfinding_service, scenario: Dict, now: Optional[datetime] = None) -> bool:
+        """Áp dụng kịch bản nếu đang trong khung thời gian. Trả về trạng thái active"""
+        now = now or datetime.now(timezone.utc)
+        with self.lock:
+            if not scenario["active"] and self.is_in_window(scenario, now):
+                scenario["active"] = True
+                self._apply_delta(pathfinding_service, [scenario])
+            return scenario["active"]
+
+    def deactivate(self, pathfinding_service, scenario: Dict):
+        """Gỡ trọng số của một kịch bản (đã bị xóa khỏi danh sách hoặc hết hạn)"""
+        with self.lock:
+            if scenario["active"]:
+                scenario["active"] = False
+                self._apply_delta(pathfinding_service, [scenario])
+
+    def tick(self, pathfinding_service, now: Optional[datetime] = None) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Đồng bộ trạng thái theo thời gian hiện tại:
+        bật kịch bản tới giờ, gỡ và dọn (GC) kịch bản hết hạn. Chỉ áp dụng delta cạnh.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self.lock:
+            started = [s for s in self.active_scenarios if not s["active"] and self.is_in_window(s, now)]
+            expired = [s for s in self.active_scenarios if s.get("ends_at") is not None and now >= s["ends_at"]]
+
+            for scenario in expired:
+                self.active_scenarios.remove(scenario)
+                scenario["active"] = False
+                if self.store is not None:
+                    self.store.delete(scenario["id"])
+            for scenario in started:
+                scenario["active"] = True
+
+            if started or expired:
+                self._apply_delta(pathfinding_service, started + expired)
+        return started, expired
+
+    def next_transition(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Thời điểm gần nhất có kịch bản bắt đầu hoặc hết hạn"""
+        now = now or datetime.now(timezone.utc)
+        times = []
+        with self.lock:
+            for scenario in self.active_scenarios:
+                starts_at = scenario.get("starts_at")
+                ends_at = scenario.get("ends_at")
+                if not scenario["active"] and starts_at is not None and starts_at > now:
+                    times.append(starts_at)
+                if ends_at is not None:
+                    times.append(ends_at)
+        return min(times) if times else None
 
 # Singleton Instance
 _scenario_service = None
@@ -98,5 +370,5 @@ _scenario_service = None
 def get_scenario_service() -> ScenarioService:
     global _scenario_service
     if _scenario_service is None:
-        _scenario_service = ScenarioService()
+        _scenario_service = ScenarioService(store=ScenarioStore())
     return _scenario_service
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Scenario Store
+Persists active scenarios in SQLite; affected edges are stored as packed int64 arrays
+"""
+import json
+import sys
+from array import array
+from datetime import datetime
+from typing import List, Tuple, Dict, Any
+from app.database import get_db_connection, create_scenario_tables
+
+# Các trường chỉ tồn tại trong RAM, không lưu vào cột data
+RUNTIME_FIELDS = {"id", "active", "affected_edges_map", "affected_edges"}
+TIME_FIELDS = ("starts_at", "ends_at")
+
+
+def pack_edges(edges: List[Tuple[int, int]]) -> bytes:
+    """[(u, v), ...] -> u0 v0 u1 v1 ... (int64 little-endian)"""
+    packed = array('q')
+    for u, v in edges:
+        packed.append(u)
+        packed.append(v)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_edges(blob: bytes) -> List[Tuple[int, int]]:
+    packed = array('q')
+    packed.frombytes(blob)
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return list(zip(packed[0::2], packed[1::2]))
+
+
+class ScenarioStore:
+    """Lưu/xóa/đọc kịch bản trong SQLite (bảng scenarios + scenario_edges)"""
+
+    def __init__(self):
+        self._schema_ready = False
+
+    def _ensure_schema(self, cursor):
+        if self._schema_ready:
+            return
+        create_scenario_tables(cursor)
+        self._schema_ready = True
+
+    @staticmethod
+    def _serialize(scenario: Dict[str, Any]) -> str:
+        data = {k: v for k, v in scenario.items() if k not in RUNTIME_FIELDS}
+        for field in TIME_FIELDS:
+            if data.get(field) is not None:
+                data[field] = data[field].isoformat()
+        return json.dumps(data)
+
+    @staticmethod
+    def _deserialize(raw: str) -> Dict[str, Any]:
+        data = json.loads(raw)
+        for field in TIME_FIELDS:
+            if data.get(field) is not None:
+                data[field] = datetime.fromisoformat(data[field])
+        return data
+
+    def save(self, scenario: Dict[str, Any], graph_versions: Dict[str, str]):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute(
+                "INSERT OR REPLACE INTO scenarios (id, data) VALUES (?, ?)",
+                (scenario["id"], self._serialize(scenario))
+            )
+            self._write_edges(cursor, scenario, graph_versions)
+
+    def save_edges(self, scenario: Dict[str, Any], graph_versions: Dict[str, str]):
+        """Chỉ ghi lại tập cạnh (sau khi tính lại hình học trên đồ thị mới)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            self._write_edges(cursor, scenario, graph_versions)
+
+    @staticmethod
+    def _write_edges(cursor, scenario: Dict[str, Any], graph_versions: Dict[str, str]):
+        cursor.execute("DELETE FROM scenario_edges WHERE scenario_id = ?", (scenario["id"],))
+        cursor.executemany(
+            "INSERT INTO scenario_edges (scenario_id, vehicle, graph_version, edges) VALUES (?, ?, ?, ?)",
+            [
+                (scenario["id"], v_type, graph_versions.get(v_type) or "", pack_edges(edges))
+                for v_type, edges in scenario["affected_edges_map"].items()
+            ]
+        )
+
+    def delete(self, scenario_id: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute("DELETE FROM scenario_edges WHERE scenario_id = ?", (scenario_id,))
+            cursor.execute("DELETE FROM scenarios WHERE id = ?", (scenario_id,))
+
+    def clear(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute("DELETE FROM scenario_edges")
+            cursor.execute("DELETE FROM scenarios")
+
+    def max_id(self) -> int:
+        """id lớn nhất đã lưu (0 nếu chưa có)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute("SELECT MAX(id) FROM scenarios")
+            row = cursor.fetchone()
+        return row[0] or 0
+
+    def load_all(self) -> List[Tuple[Dict[str, Any], Dict[str, Tuple[str, List[Tuple[int, int]]]]]]:
+        """Trả về [(scenario_data, {vehicle: (graph_version, edges)})] theo thứ tự id"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            self._ensure_schema(cursor)
+            cursor.execute("SELECT id, data FROM scenarios ORDER BY id")
+            rows = cursor.fetchall()
+            cursor.execute("SELECT scenario_id, vehicle, graph_version, edges FROM scenario_edges")
+            edge_rows = cursor.fetchall()
+
+        edges_by_id: Dict[int, Dict[str, Tuple[str, List[Tuple[int, int]]]]] = {}
+        for row in edge_rows:
+            edges_by_id.setdefault(row["scenario_id"], {})[row["vehicle"]] = (
+                row["graph_version"], unpack_edges(row["edges"])
+            )
+
+        result = []
+        for row in rows:
+            data = self._deserialize(row["data"])
+            data["id"] = row["id"]
+            result.append((data, edges_by_id.get(row["id"], {})))
+        return result
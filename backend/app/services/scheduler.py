@@ -0,0 +1,85 @@
+"""
+Scenario Scheduler
+Background thread that activates and expires time-windowed scenarios
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+from app.config import get_settings
+from app.services.pathfinding import get_pathfinding_service
+from app.services.scenario import get_scenario_service
+
+settings = get_settings()
+
+# Mốc đã tới nhưng chưa áp dụng được (đồ thị đang tải, tick lỗi): thử lại sau ít nhất chừng này giây
+RETRY_DELAY = 0.5
+
+
+class ScenarioScheduler:
+    """Ngủ tới mốc starts_at/ends_at gần nhất rồi gọi ScenarioService.tick (chỉ áp dụng delta cạnh)"""
+
+    def __init__(self, max_sleep: float = settings.scenario_scheduler_max_sleep):
+        self.max_sleep = max_sleep
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="scenario-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def wake(self):
+        """Gọi khi danh sách kịch bản thay đổi để tính lại mốc thời gian kế tiếp"""
+        self._wake_event.set()
+
+    def _run(self):
+        sc_service = get_scenario_service()
+        while not self._stop_event.is_set():
+            applied = False
+            try:
+                started, expired = [], []
+                # Chưa có kịch bản nào thì không cần chạm tới đồ thị
+                pf_service = get_pathfinding_service() if sc_service.active_scenarios else None
+                if pf_service is None:
+                    applied = True
+                elif all(pf_service.is_ready(v) for v in pf_service.vehicle_types):
+                    started, expired = sc_service.tick(pf_service)
+                    applied = True
+                for scenario in started:
+                    print(f"⏰ Scenario {scenario['id']} started.")
+                for scenario in expired:
+                    print(f"⌛ Scenario {scenario['id']} expired and removed.")
+            except Exception as e:
+                print(f"Scenario scheduler error: {e}")
+
+            now = datetime.now(timezone.utc)
+            next_time = sc_service.next_transition(now)
+            timeout = self.max_sleep
+            if next_time is not None:
+                timeout = min(timeout, max(0.0, (next_time - now).total_seconds()))
+            if not applied:
+                # Mốc đã qua vẫn còn trong danh sách -> timeout 0, không chặn thì thread quay vòng 100% CPU
+                timeout = max(timeout, RETRY_DELAY)
+
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+
+# Singleton Instance
+_scenario_scheduler = None
+
+def get_scenario_scheduler() -> ScenarioScheduler:
+    global _scenario_scheduler
+    if _scenario_scheduler is None:
+        _scenario_scheduler = ScenarioScheduler()
+    return _scenario_scheduler
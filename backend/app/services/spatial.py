@@ -0,0 +1,178 @@
+"""
+Spatial Index
+Uniform grid over edge segments for snapping points onto the nearest road
+"""
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class EdgeSnap:
+    """Hình chiếu của một điểm lên đoạn thẳng (u, v); t = 0 tại u, t = 1 tại v"""
+    u: int
+    v: int
+    t: float
+    x: float
+    y: float
+    distance: float
+
+
+class SegmentIndex:
+    """
+    Lưới đều: mỗi ô chứa các đoạn (u, v) có bounding box chạm vào ô đó.
+    Mỗi đoạn nhớ bitmask phương tiện (OR của hai chiều) để snap theo từng profile.
+    """
+
+    def __init__(self, cell_size: float = 64.0):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        self.nodes: Dict[int, Tuple[float, float]] = {}
+        self.masks: Dict[Tuple[int, int], int] = {}
+        self.segment_count = 0
+        self._bounds = None  # (min_cx, min_cy, max_cx, max_cy)
+        self._shared = set()  # ô còn dùng chung danh sách với bản gốc (sau copy)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def build(
+        self,
+        nodes: Dict[int, Tuple[float, float]],
+        edges: Iterable[Tuple[int, int]],
+        access: Optional[Sequence[int]] = None
+    ):
+        """
+        Mỗi cặp (u, v)/(v, u) chỉ được lưu một lần dưới dạng (min, max).
+        access: bitmask theo thứ tự edges (None = mọi phương tiện)
+        """
+        self.nodes = nodes
+        self.cells = {}
+        self.masks = {}
+        self.segment_count = 0
+        self._bounds = None
+        for i, (u, v) in enumerate(edges):
+            if u not in nodes or v not in nodes:
+                continue
+            key = (u, v) if u < v else (v, u)
+            mask = access[i] if access is not None else -1
+            if key in self.masks:
+                self.masks[key] |= mask
+                continue
+            self.insert(*key, mask=mask)
+        return self
+
+    def copy(self, nodes: Dict[int, Tuple[float, float]]) -> "SegmentIndex":
+        """
+        Bản sao cho một thế hệ đồ thị mới (nodes là dict node của thế hệ đó). Danh sách trong
+        từng ô dùng chung với bản gốc cho tới khi ô bị sửa (copy-on-write).
+        """
+        clone = SegmentIndex(self.cell_size)
+        clone.nodes = nodes
+        clone.cells = dict(self.cells)
+        clone.masks = dict(self.masks)
+        clone.segment_count = self.segment_count
+        clone._bounds = self._bounds
+        clone._shared = set(clone.cells)
+        return clone
+
+    def _cell_list(self, cell: Tuple[int, int]) -> List[Tuple[int, int]]:
+        """Danh sách của ô để sửa (tách khỏi bản gốc nếu đang dùng chung)"""
+        if cell in self._shared:
+            self._shared.discard(cell)
+            self.cells[cell] = list(self.cells[cell])
+        return self.cells.setdefault(cell, [])
+
+    def _span(self, u: int, v: int):
+        (x1, y1), (x2, y2) = self.nodes[u], self.nodes[v]
+        cx1, cy1 = self._cell(min(x1, x2), min(y1, y2))
+        cx2, cy2 = self._cell(max(x1, x2), max(y1, y2))
+        return cx1, cy1, cx2, cy2
+
+    def insert(self, u: int, v: int, mask: int = -1):
+        self.masks[(u, v)] = mask
+        cx1, cy1, cx2, cy2 = self._span(u, v)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                self._cell_list((cx, cy)).append((u, v))
+        self.segment_count += 1
+        if self._bounds is None:
+            self._bounds = (cx1, cy1, cx2, cy2)
+        else:
+            b = self._bounds
+            self._bounds = (min(b[0], cx1), min(b[1], cy1), max(b[2], cx2), max(b[3], cy2))
+
+    def remove(self, u: int, v: int):
+        """Bỏ đoạn (u, v) với u < v (phạm vi lưới _bounds giữ nguyên, chỉ rộng hơn cần thiết)"""
+        if self.masks.pop((u, v), None) is None:
+            return
+        cx1, cy1, cx2, cy2 = self._span(u, v)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                segments = self._cell_list((cx, cy))
+                segments.remove((u, v))
+                if not segments:
+                    del self.cells[(cx, cy)]
+        self.segment_count -= 1
+
+    def set_mask(self, u: int, v: int, mask: int):
+        """Đặt bitmask phương tiện của đoạn (u, v) với u < v: thêm đoạn mới, bỏ đoạn khi mask = 0"""
+        if not mask:
+            self.remove(u, v)
+        elif (u, v) in self.masks:
+            self.masks[(u, v)] = mask
+        else:
+            self.insert(u, v, mask)
+
+    def _project(self, x: float, y: float, u: int, v: int) -> EdgeSnap:
+        (x1, y1), (x2, y2) = self.nodes[u], self.nodes[v]
+        dx, dy = x2 - x1, y2 - y1
+        len_sq = dx * dx + dy * dy
+        t = 0.0 if len_sq == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / len_sq))
+        px, py = x1 + t * dx, y1 + t * dy
+        return EdgeSnap(u, v, t, px, py, math.hypot(x - px, y - py))
+
+    def nearest(
+        self, x: float, y: float, mask: int = -1, usable: Optional[Callable[[int, int], bool]] = None
+    ) -> Optional[EdgeSnap]:
+        """
+        Tìm đoạn gần nhất (có bit trong mask): quét các vòng ô lưới từ trong ra ngoài.
+        usable(u, v): bộ lọc thêm (vd. bỏ đoạn đang bị chặn cả hai chiều)
+        """
+        if self._bounds is None:
+            return None
+
+        cx, cy = self._cell(x, y)
+        min_cx, min_cy, max_cx, max_cy = self._bounds
+        max_ring = max(abs(cx - min_cx), abs(cx - max_cx), abs(cy - min_cy), abs(cy - max_cy))
+
+        best: Optional[EdgeSnap] = None
+        checked = set()
+        for ring in range(max_ring + 1):
+            # Mọi đoạn ở vòng `ring` cách điểm ít nhất (ring - 1) * cell_size
+            if best is not None and best.distance < (ring - 1) * self.cell_size:
+                break
+            for cell in self._ring_cells(cx, cy, ring):
+                for seg in self.cells.get(cell, ()):
+                    if seg in checked:
+                        continue
+                    checked.add(seg)
+                    if not self.masks[seg] & mask or (usable is not None and not usable(*seg)):
+                        continue
+                    snap = self._project(x, y, *seg)
+                    if best is None or snap.distance < best.distance:
+                        best = snap
+        return best
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        """Các ô nằm đúng trên chu vi hình vuông bán kính ring"""
+        if ring == 0:
+            yield cx, cy
+            return
+        for ix in range(cx - ring, cx + ring + 1):
+            yield ix, cy - ring
+            yield ix, cy + ring
+        for iy in range(cy - ring + 1, cy + ring):
+            yield cx - ring, iy
+            yield cx + ring, iy
@@ -0,0 +1,214 @@
+"""
+Route Subscriptions
+Clients register their current route over a WebSocket; when a weight change touches it
+(edges on the route, or a cheaper edge that could beat it) the route is recomputed and pushed
+"""
+import asyncio
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from app.config import get_settings
+from app.services.pathfinding import get_pathfinding_service
+from app.services.route_cache import cheaper_edges, may_improve, route_edges, route_ends, weight_cost
+from app.services.workers import get_routing_pool
+
+settings = get_settings()
+
+
+@dataclass
+class RouteSubscription:
+    """
+    query: start_x, start_y, end_x, end_y, vehicle, speed.
+    vehicle / edges / start / end / cost: route lần tính gần nhất (dùng để quyết định có phải tính lại không).
+    """
+    id: int
+    query: Dict[str, Any]
+    send: Callable[[Dict], Awaitable[None]]
+    loop: asyncio.AbstractEventLoop
+    vehicle: Optional[str] = None
+    edges: Set[int] = field(default_factory=set)
+    start: Tuple[float, float] = (0.0, 0.0)
+    end: Tuple[float, float] = (0.0, 0.0)
+    cost: float = float('inf')
+    result: Optional[Dict] = None
+    running: bool = False
+    # Lý do của lượt tính lại đang chờ (None = không có)
+    reason: Optional[str] = None
+    closed: bool = False
+
+
+class RouteSubscriptions:
+    """
+    Reverse index cạnh -> subscription. Listener trọng số chỉ tra index (chạy trong thread của người
+    đổi trọng số, phải nhanh); việc tính lại chạy trên routing pool và chỉ đẩy khi route thật sự đổi.
+    Subscription đang tính lại mà bị ảnh hưởng tiếp thì được tính thêm một lượt sau lượt hiện tại.
+    """
+
+    def __init__(self, pathfinding_service, max_subscriptions: int = settings.route_subscriptions_max):
+        self.pf = pathfinding_service
+        self.max_subscriptions = max_subscriptions
+        self._lock = threading.Lock()
+        self._subs: Dict[int, RouteSubscription] = {}
+        self._by_edge: Dict[Tuple[str, int], Set[int]] = {}
+        self._ids = itertools.count(1)
+        self.counters = {'notified': 0, 'recomputes': 0, 'pushes': 0, 'unchanged': 0}
+
+        pathfinding_service.add_weight_listener(self._on_weight_change)
+
+    # --- ĐĂNG KÝ ---
+
+    async def subscribe(self, query: Dict[str, Any], send: Callable[[Dict], Awaitable[None]]) -> RouteSubscription:
+        with self._lock:
+            if len(self._subs) >= self.max_subscriptions:
+                raise OverflowError("Too many route subscriptions")
+            sub = RouteSubscription(next(self._ids), query, send, asyncio.get_running_loop())
+            self._subs[sub.id] = sub
+        await self._refresh(sub, "subscribed")
+        return sub
+
+    async def update(self, sub: RouteSubscription, query: Dict[str, Any]):
+        """Client đổi route (đi tiếp, đổi đích): tính lại và đẩy ngay"""
+        sub.query = query
+        await self._refresh(sub, "updated")
+
+    def unsubscribe(self, sub: RouteSubscription):
+        with self._lock:
+            sub.closed = True
+            self._subs.pop(sub.id, None)
+            self._unindex(sub)
+
+    def _unindex(self, sub: RouteSubscription):
+        v_type = sub.vehicle
+        for ei in sub.edges:
+            ids = self._by_edge.get((v_type, ei))
+            if ids is not None:
+                ids.discard(sub.id)
+                if not ids:
+                    del self._by_edge[(v_type, ei)]
+
+    # --- THAY ĐỔI TRỌNG SỐ ---
+
+    def _on_weight_change(self, epoch: int, changes: Optional[Dict[str, Dict[str, set]]]):
+        with self._lock:
+            if not self._subs:
+                return
+            if changes is None:
+                affected = set(self._subs)
+            else:
+                affected = set()
+                for v_type, change in changes.items():
+                    for ei in change['raised'] | change['lowered']:
+                        affected.update(self._by_edge.get((v_type, ei), ()))
+                    cheaper = cheaper_edges(self.pf.graphs[v_type], change['lowered']) if change['lowered'] else None
+                    if cheaper:
+                        affected.update(
+                            sub.id for sub in self._subs.values()
+                            if sub.id not in affected and sub.vehicle == v_type
+                            and may_improve(sub.start, sub.end, sub.cost, cheaper)
+                        )
+            subs = [self._subs[sub_id] for sub_id in affected]
+        self.counters['notified'] += len(subs)
+        for sub in subs:
+            sub.loop.call_soon_threadsafe(self._wake, sub)
+
+    def _wake(self, sub: RouteSubscription):
+        """Chạy trong event loop của WebSocket"""
+        if not sub.closed:
+            asyncio.ensure_future(self._refresh(sub, "scenario"))
+
+    # --- TÍNH LẠI ---
+
+    def _compute(self, query: Dict[str, Any], count_hit: bool) -> Tuple[Optional[Dict], Set[int], int]:
+        pf = self.pf
+        q = query
+        with pf.pinned() as graphs:
+            # Snap một lần: khóa (đầu mút cho route_edges) và search dùng cùng điểm snap
+            snaps = pf.snap_endpoints(q['start_x'], q['start_y'], q['end_x'], q['end_y'], q['vehicle'])
+            key = pf.route_key(q['start_x'], q['start_y'], q['end_x'], q['end_y'], q['vehicle'], q['speed'], snaps=snaps)
+            epoch = key[-1]
+            if snaps is not None:
+                result = pf.route_snapped(*snaps, q['vehicle'], q['speed'], count_hit=count_hit)
+            else:
+                result = pf.find_path(q['start_x'], q['start_y'], q['end_x'], q['end_y'], q['vehicle'], q['speed'],
+                                      count_hit=count_hit)
+            edges = route_edges(graphs[q['vehicle']], result, (key[0], key[1])) if result is not None else set()
+        return result, edges, epoch
+
+    @staticmethod
+    def _signature(result: Optional[Dict]):
+        return None if result is None else (result['node_ids'], result['cost'])
+
+    async def _refresh(self, sub: RouteSubscription, reason: str):
+        """
+        Tính lại tới khi kết quả khớp weight epoch hiện tại (trọng số đổi trong lúc tính -> tính lại).
+        reason 'scenario' chỉ gửi khi route đổi (node_ids hoặc cost); 'subscribed' / 'updated' luôn gửi.
+        """
+        if sub.reason is None or reason != "scenario":
+            sub.reason = reason
+        if sub.running:
+            return  # Lượt đang chạy sẽ tính thêm một lượt
+        sub.running = True
+        try:
+            while not sub.closed and sub.reason is not None:
+                reason, sub.reason = sub.reason, None
+                query = sub.query
+                result, edges, epoch = await get_routing_pool().run(self._compute, query, reason != "scenario")
+                self.counters['recomputes'] += 1
+                if query is not sub.query:
+                    continue  # Client đã đổi route trong lúc tính (sub.reason = 'updated')
+
+                with self._lock:
+                    if sub.closed:
+                        return
+                    self._unindex(sub)
+                    sub.vehicle, sub.edges = query['vehicle'], edges
+                    for ei in edges:
+                        self._by_edge.setdefault((query['vehicle'], ei), set()).add(sub.id)
+                    if result is not None:
+                        sub.start, sub.end = route_ends(result)
+                        sub.cost = weight_cost(result, query['speed'])
+                    else:
+                        # Không có đường: mọi cạnh rẻ đi / mở lại đều có thể nối lại
+                        sub.start, sub.end, sub.cost = (0.0, 0.0), (0.0, 0.0), float('inf')
+
+                previous, sub.result = sub.result, result
+                if reason != "scenario" or self._signature(previous) != self._signature(result):
+                    await sub.send({
+                        'type': 'route',
+                        'reason': reason,
+                        'subscription': sub.id,
+                        'weight_epoch': epoch,
+                        'route': result
+                    })
+                    self.counters['pushes'] += 1
+                else:
+                    self.counters['unchanged'] += 1
+
+                if epoch != self.pf.weight_epoch and sub.reason is None:
+                    sub.reason = "scenario"
+        except Exception as e:
+            # Client ngắt kết nối giữa chừng: bỏ subscription
+            print(f"⚠️ Route subscription {sub.id} dropped: {e}")
+            self.unsubscribe(sub)
+        finally:
+            sub.running = False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'subscriptions': len(self._subs),
+                'max_subscriptions': self.max_subscriptions,
+                'indexed_edges': len(self._by_edge),
+                **self.counters
+            }
+
+
+# Singleton Instance
+_route_subscriptions = None
+
+def get_route_subscriptions() -> RouteSubscriptions:
+    global _route_subscriptions
+    if _route_subscriptions is None:
+        _route_subscriptions = RouteSubscriptions(get_pathfinding_service())
+    return _route_subscriptions
@@ -0,0 +1,56 @@
+"""
+Worker Pools
+Bounded thread pools for blocking work that must not run on the event loop
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+from app.config import get_settings
+
+settings = get_settings()
+
+
+class WorkerPool:
+    """ThreadPoolExecutor + giới hạn số tác vụ đồng thời (kể cả đang xếp hàng)"""
+
+    def __init__(self, name: str, max_workers: int, max_concurrency: int):
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Chạy fn trong pool; các request vượt giới hạn sẽ chờ (không chặn event loop)"""
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+            finally:
+                self.in_flight -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+# Singleton Instance
+_auth_pool = None
+
+def get_auth_pool() -> WorkerPool:
+    """Pool cho hash/verify mật khẩu (pbkdf2 chậm có chủ đích)"""
+    global _auth_pool
+    if _auth_pool is None:
+        _auth_pool = WorkerPool("auth", settings.auth_workers, settings.auth_max_concurrency)
+    return _auth_pool
+
+
+_routing_pool = None
+
+def get_routing_pool() -> WorkerPool:
+    """Pool cho tìm đường (A*/Dijkstra), giữ event loop rảnh trong lúc tìm"""
+    global _routing_pool
+    if _routing_pool is None:
+        _routing_pool = WorkerPool("routing", settings.routing_workers, settings.routing_max_concurrency)
+    return _routing_pool
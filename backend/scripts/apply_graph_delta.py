@@ -0,0 +1,54 @@
+"""
+Write a graph delta to the database without a running server
+Usage: python scripts/apply_graph_delta.py delta.json
+       python scripts/apply_graph_delta.py --list [--limit 20]
+
+The delta uses the same JSON as POST /api/path/delta. It is validated against the graph tables
+in DATABASE_URL, written together with a new graph_changelog version and picked up by the
+server on its next graph load. A running server should get the delta through the endpoint
+instead, which also patches the in-memory graph.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import get_db_connection
+from app.schemas.path import GraphDeltaRequest
+from app.services.graph_delta import list_changelog, summarize, write_delta
+from app.services.pathfinding import PROFILE_BITS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a graph delta to the graph tables")
+    parser.add_argument("delta", nargs="?", help="Delta JSON file")
+    parser.add_argument("--list", action="store_true", help="Show the changelog instead")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.list or not args.delta:
+        changelog = list_changelog(args.limit)
+        print(f"Graph changelog version {changelog['version']}")
+        for entry in changelog['entries']:
+            print(f"  v{entry['version']} {entry['applied_at']} {entry['description'] or '-'}: {entry['summary']}")
+        return
+
+    with open(args.delta, encoding='utf-8') as f:
+        delta = GraphDeltaRequest.model_validate(json.load(f)).model_dump(exclude_none=True)
+    try:
+        with get_db_connection() as conn:
+            version, ops = write_delta(conn.cursor(), delta, list(PROFILE_BITS))
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ Delta rejected, nothing written: {e}")
+        sys.exit(1)
+
+    print(f"✓ Graph changelog version {version}")
+    for v_type, counts in summarize(ops).items():
+        print(f"   {v_type}: {counts}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the search-core priority queues
+Usage: python scripts/bench_queues.py [--pairs N] [--trees N] [--seed S]
+
+Loads the graph from DATABASE_URL and, for every vehicle graph and every queue in
+app/services/queues.py, times the same random A* routes and one-to-all Dijkstra
+trees. Prints queue counters (pushes, stale pops, decrease-keys, peak size) and a
+SEARCH_QUEUE_BY_VEHICLE value with the fastest queue per vehicle.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import get_settings
+from app.services.pathfinding import get_pathfinding_service
+from app.services.queues import QUEUES
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare search queues per vehicle graph")
+    parser.add_argument("--pairs", type=int, default=300, help="Random A* routes per vehicle")
+    parser.add_argument("--trees", type=int, default=10, help="One-to-all Dijkstra runs per vehicle")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    settings = get_settings()
+    pf = get_pathfinding_service()
+    if not pf.wait_until_ready():
+        print("❌ Graph failed to load")
+        sys.exit(1)
+    # Mọi truy vấn phải thật sự tìm kiếm
+    pf.destination_trees = None
+    settings.search_queue_by_vehicle = ""
+
+    best = {}
+    for v_type, graph in pf.graphs.items():
+        rng = random.Random(args.seed)
+        nodes = [n for n in graph['nodes'] if pf._node_has_access(graph, n)]
+        if len(nodes) < 2:
+            continue
+        pairs = [(graph['nodes'][rng.choice(nodes)], graph['nodes'][rng.choice(nodes)]) for _ in range(args.pairs)]
+        roots = [rng.choice(nodes) for _ in range(args.trees)]
+
+        print(f"\n=== {v_type}: {len(nodes)} nodes, {graph['edge_count']} edges ===")
+        print(f"  {'queue':<8} {'A* ms/route':>12} {'Dijkstra ms':>12} {'pushes':>10} {'stale pops':>11} "
+              f"{'decr-keys':>10} {'peak size':>10}")
+        timings = {}
+        for kind in QUEUES:
+            settings.search_queue = kind
+            totals = {'pushes': 0, 'stale_pops': 0, 'decrease_keys': 0, 'max_size': 0}
+            started = time.perf_counter()
+            for (sx, sy), (ex, ey) in pairs:
+                stats = {}
+                pf.find_path(sx, sy, ex, ey, v_type, 1.0, 0.0, stats)
+                for name, value in stats.get('queue', {}).items():
+                    if name in totals:
+                        totals[name] = max(totals[name], value) if name == 'max_size' else totals[name] + value
+            route_ms = (time.perf_counter() - started) * 1000 / len(pairs)
+
+            started = time.perf_counter()
+            for root in roots:
+                pf.dijkstra(root, v_type)
+            tree_ms = (time.perf_counter() - started) * 1000 / max(len(roots), 1)
+
+            timings[kind] = route_ms
+            print(f"  {kind:<8} {route_ms:>12.3f} {tree_ms:>12.2f} {totals['pushes']:>10} {totals['stale_pops']:>11} "
+                  f"{totals['decrease_keys']:>10} {totals['max_size']:>10}")
+        best[v_type] = min(timings, key=timings.get)
+
+    print("\nFastest A* queue per vehicle:")
+    print("  SEARCH_QUEUE_BY_VEHICLE=" + ",".join(f"{v}={k}" for v, k in best.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Offline arc flag computation
+Usage: python scripts/build_arc_flags.py [--grid N]
+
+Loads the graph from DATABASE_URL (original weights, no scenarios), partitions every
+vehicle graph into an N x N grid of cells and writes one flags file per vehicle to
+ARC_FLAGS_DIR. The server picks the files up on its next graph load; files built for
+another graph version are ignored.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import get_settings
+from app.services.pathfinding import get_pathfinding_service
+from app.services.arc_flags import build_arc_flags, flags_path, save_arc_flags
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Build arc flags for every vehicle graph")
+    parser.add_argument("--grid", type=int, default=settings.arc_flags_grid, help="Cells per side (grid * grid <= 64)")
+    args = parser.parse_args()
+
+    pf = get_pathfinding_service()
+    if not pf.wait_until_ready():
+        print("❌ Graph failed to load")
+        sys.exit(1)
+
+    versions = pf.graph_versions()
+    for v_type, graph in pf.graphs.items():
+        started = time.perf_counter()
+        flags = build_arc_flags(graph, args.grid, versions)
+        path = flags_path(v_type)
+        save_arc_flags(flags, path)
+        flagged = sum(1 for f in flags.flags if f)
+        print(f"✓ {v_type}: {args.grid}x{args.grid} cells, {flagged}/{graph['edge_count']} edges flagged, "
+              f"{time.perf_counter() - started:.2f}s -> {path}")
+
+
+if __name__ == "__main__":
+    main()
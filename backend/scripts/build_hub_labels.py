@@ -0,0 +1,48 @@
+"""
+Offline hub label computation
+Usage: python scripts/build_hub_labels.py [--vehicle car]
+
+Loads the graph from DATABASE_URL (original weights, no scenarios), runs pruned landmark
+labeling on every vehicle graph and writes one labels file per vehicle to HUB_LABELS_DIR.
+The server memory-maps the files on its next graph load; files built for another graph
+version are ignored.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.pathfinding import get_pathfinding_service
+from app.services.hub_labels import build_hub_labels, labels_path, save_hub_labels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hub labels for every vehicle graph")
+    parser.add_argument("--vehicle", action="append", help="Only build these vehicles (repeatable)")
+    parser.add_argument("--progress", type=int, default=1000, help="Print progress every N hubs (0 = off)")
+    args = parser.parse_args()
+
+    pf = get_pathfinding_service()
+    if not pf.wait_until_ready():
+        print("❌ Graph failed to load")
+        sys.exit(1)
+
+    versions = pf.graph_versions()
+    for v_type, graph in pf.graphs.items():
+        if args.vehicle and v_type not in args.vehicle:
+            continue
+        started = time.perf_counter()
+        labels = build_hub_labels(graph, versions, args.progress)
+        path = labels_path(v_type)
+        save_hub_labels(labels, path)
+        nodes = len(labels.node_ids)
+        print(f"✓ {v_type}: {nodes} nodes, {labels.entries()} label entries "
+              f"({labels.entries() / max(nodes, 1):.1f} per node), {labels.nbytes / 1024:.0f} KB, "
+              f"{time.perf_counter() - started:.2f}s -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Import rawprocessing output into the graph tables
+Usage: python scripts/import_graph_csv.py --vehicle car [--nodes nodes.csv] [--edges edges.csv]
+
+Replaces nodes_<vehicle> / edges_<vehicle> in DATABASE_URL with the CSV contents. The
+highway and maxspeed columns of edges.csv are stored as road_class / maxspeed; older CSVs
+without them import with both NULL. Existing edge tables are upgraded with the two columns.
+"""
+import argparse
+import csv
+import sys
+from collections import Counter
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import add_road_class_columns, create_graph_tables, get_db_connection
+
+
+def read_edges(path: str):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            maxspeed = row.get("maxspeed") or None
+            yield (
+                int(row["u"]), int(row["v"]), float(row["weight"]),
+                row.get("highway") or None, float(maxspeed) if maxspeed else None
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import nodes.csv / edges.csv into the graph tables")
+    parser.add_argument("--vehicle", required=True, help="Profile whose tables are replaced (car, foot)")
+    parser.add_argument("--nodes", default="nodes.csv")
+    parser.add_argument("--edges", default="edges.csv")
+    args = parser.parse_args()
+    v_type = args.vehicle
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        create_graph_tables(cursor, v_type)
+        if add_road_class_columns(cursor, v_type):
+            print(f"✓ edges_{v_type}: added road_class / maxspeed columns")
+        cursor.execute(f"DELETE FROM edges_{v_type}")
+        cursor.execute(f"DELETE FROM nodes_{v_type}")
+
+        with open(args.nodes, newline='', encoding='utf-8') as f:
+            cursor.executemany(
+                f"INSERT INTO nodes_{v_type} (id, x, y) VALUES (?, ?, ?)",
+                ((int(r["node_id"]), float(r["pixel_x"]), float(r["pixel_y"])) for r in csv.DictReader(f))
+            )
+        node_count = cursor.rowcount
+
+        classes = Counter()
+
+        def counted(rows):
+            for row in rows:
+                classes[row[3]] += 1
+                yield row
+
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO edges_{v_type} (node_from, node_to, weight, road_class, maxspeed) VALUES (?, ?, ?, ?, ?)",
+            counted(read_edges(args.edges))
+        )
+
+    print(f"✓ {v_type}: {node_count} nodes, {sum(classes.values())} edges")
+    for road_class, count in classes.most_common():
+        print(f"   {road_class or '(no class)'}: {count}")
+
+
+if __name__ == "__main__":
+    main()
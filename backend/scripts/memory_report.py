@@ -0,0 +1,75 @@
+"""
+Memory accounting report for the in-memory graph
+Usage: python scripts/memory_report.py [--tracemalloc] [--json]
+
+Loads the graph from DATABASE_URL, then prints the deep size of every structure,
+bytes per node/edge and (with --tracemalloc) the allocation diff of a second load.
+"""
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.pathfinding import get_pathfinding_service
+from app.services.scenario import get_scenario_service
+from app.services.memory import memory_report, tracemalloc_graph_load
+
+
+def fmt(n):
+    if n is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
+
+
+def main():
+    pf = get_pathfinding_service()
+    if not pf.wait_until_ready():
+        print("❌ Graph failed to load")
+        sys.exit(1)
+    sc = get_scenario_service()
+    sc.ensure_restored(pf)
+
+    report = memory_report(pf, sc)
+    if "--tracemalloc" in sys.argv[1:]:
+        report["graph_load"] = tracemalloc_graph_load(pf)
+
+    if "--json" in sys.argv[1:]:
+        print(json.dumps(report, indent=2))
+        return
+
+    g = report["graph"]
+    print(f"\n=== Graph: {g['nodes']} nodes, {g['edges']} edges (generation {g['generation']}) ===")
+    for name, size in g["base"]["bytes"].items():
+        print(f"  base.{name:<16} {fmt(size):>12}")
+    print(f"  base total         {fmt(g['base']['total_bytes']):>12}  "
+          f"({g['base']['bytes_per_node']} B/node, {g['base']['bytes_per_edge']} B/edge)")
+    for v_type, p in g["profiles"].items():
+        for name, size in p["bytes"].items():
+            print(f"  {v_type}.{name:<{20 - len(v_type)}} {fmt(size):>12}")
+        print(f"  {v_type} total{'':<{13 - len(v_type)}} {fmt(p['total_bytes']):>12}  ({p['bytes_per_edge']} B/edge)")
+    print(f"  TOTAL              {fmt(g['total_bytes']):>12}  "
+          f"({g['total_bytes_per_node']} B/node, {g['total_bytes_per_edge']} B/edge)")
+
+    s = report["scenarios"]
+    print(f"\n=== Scenarios: {s['count']} ({fmt(s['total_bytes'])}) ===")
+    for row in s["scenarios"]:
+        print(f"  #{row['id']:<5} {row['affected_edges']:>8} edges {fmt(row['bytes']):>12}  cumulative {fmt(row['cumulative_bytes'])}")
+
+    p = report["process"]
+    print(f"\n=== Process: RSS {fmt(p['rss_bytes'])}, peak {fmt(p['peak_rss_bytes'])} ===")
+
+    if "graph_load" in report:
+        t = report["graph_load"]
+        print(f"\n=== tracemalloc graph load: {t['load_seconds']}s, retained {fmt(t['retained_bytes'])}, "
+              f"peak {fmt(t['peak_traced_bytes'])} ===")
+        for row in t["top"]:
+            print(f"  {fmt(row['size_diff']):>12} {row['count_diff']:>9}  {row['location']}")
+
+
+if __name__ == "__main__":
+    main()
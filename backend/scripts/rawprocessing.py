@@ -8,7 +8,9 @@ lonLeft = 105.840676
 lonRight = 105.861112
 latTop = 21.041218
 latBottom = 21.023721
-# Giới hạn khoảng cách pixel để chia nhỏ cạnh
+# Giới hạn khoảng cách pixel để chia nhỏ cạnh.
+# Backend snap điểm click lên đoạn cạnh gần nhất (không chỉ lên node), nên
+# có thể tăng LIMIT để giảm số node mà không làm mất độ chính xác khi snap.
 LIMIT = 6
 # Kích thước ảnh
 WIDTH = 8500
@@ -116,6 +118,19 @@ def extract_edges(data: List[Dict[str, Any]]) -> List[Edge]:
     return edges
 
 
+def parse_maxspeed(tags: Dict[str, Any]) -> Optional[float]:
+    """Tag maxspeed -> km/h ("50", "30 mph"); giá trị không phải số (vd. "signals", "none") -> None"""
+    raw = str(tags.get("maxspeed", "")).strip().lower()
+    factor = 1.0
+    if raw.endswith("mph"):
+        raw, factor = raw[:-3].strip(), 1.609344
+    try:
+        speed = float(raw) * factor
+    except ValueError:
+        return None
+    return speed if speed > 0 else None
+
+
 def convert_coords(nodes: Dict[int, Node]):
     """Chuyển đổi (lon, lat) sang tọa độ pixel (x, y)."""
     for node in nodes.values():
@@ -289,10 +304,14 @@ def main(input_file: str):
         writer.writerows([[node.id, node.x, node.y] for node in nodes.values()])
     print("  -> Đã lưu nodes.csv")
 
+    # Giữ loại đường (tag highway) và maxspeed (km/h, trống nếu không có) cho chi phí theo tốc độ
     with open("edges.csv", "w", newline='', encoding='utf-8') as f:
         writer = csv.writer(f)
-        writer.writerow(["u", "v", "weight"])
-        writer.writerows([[edge.start, edge.end, edge.weight] for edge in edges])
+        writer.writerow(["u", "v", "weight", "highway", "maxspeed"])
+        writer.writerows([
+            [edge.start, edge.end, edge.weight, edge.tags.get("highway", ""), parse_maxspeed(edge.tags) or ""]
+            for edge in edges
+        ])
     print("  -> Đã lưu edges.csv")
     print("Lưu file CSV hoàn tất.")
 
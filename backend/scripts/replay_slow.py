@@ -0,0 +1,88 @@
+"""
+Replay slow requests offline
+Usage: python scripts/replay_slow.py slow.json [--profile]
+
+slow.json is the body of GET /api/diagnostics/slow. Each entry is re-run in-process
+against the local database (DATABASE_URL) and timed; --profile prints the cProfile top list.
+"""
+import json
+import sys
+import time
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.services.pathfinding import get_pathfinding_service
+from app.services.scenario import ScenarioService
+from app.services.isochrone import IsochroneService
+from app.services.alternatives import find_alternatives
+from app.services.multistop import plan_multi_stop
+from app.services.profiling import profile_call
+
+
+def build_call(pf, endpoint, inputs):
+    """Trả về hàm không tham số tái hiện request, hoặc None nếu endpoint không hỗ trợ"""
+    if endpoint == "/api/path":
+        return lambda: pf.find_path(
+            inputs["start_x"], inputs["start_y"], inputs["end_x"], inputs["end_y"], inputs["vehicle"], inputs["speed"],
+            inputs.get("epsilon") or 0.0, hierarchy=inputs.get("hierarchy", False)
+        )
+    if endpoint == "/api/path/alternatives":
+        return lambda: find_alternatives(
+            pf, inputs["start_x"], inputs["start_y"], inputs["end_x"], inputs["end_y"], inputs["vehicle"],
+            inputs["speed"], k=inputs["k"], max_overlap=inputs["max_overlap"], max_stretch=inputs["max_stretch"]
+        )
+    if endpoint == "/api/path/multi":
+        return lambda: plan_multi_stop(
+            pf, [(wp["x"], wp["y"]) for wp in inputs["waypoints"]], inputs["vehicle"], inputs["speed"],
+            optimize=inputs["optimize"], fixed_start=inputs["fixed_start"], fixed_end=inputs["fixed_end"]
+        )
+    if endpoint == "/api/isochrone":
+        # Service mới (cache rỗng) để đo đúng chi phí tính toán
+        return lambda: IsochroneService().compute(
+            pf, inputs["x"], inputs["y"], inputs["vehicle"], inputs["speed"],
+            inputs["max_seconds"], inputs["bands"], inputs["shape"]
+        )
+    if endpoint == "/api/scenarios":
+        return lambda: ScenarioService().calculate_affected_edges(
+            pf,
+            (inputs["line_start"]["lng"], inputs["line_start"]["lat"]),
+            (inputs["line_end"]["lng"], inputs["line_end"]["lat"]),
+            inputs["threshold"]
+        )
+    return None
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        entries = json.load(f)["requests"]
+    profile = "--profile" in sys.argv[2:]
+
+    pf = get_pathfinding_service()
+    if not pf.wait_until_ready():
+        print("❌ Graph failed to load")
+        sys.exit(1)
+
+    for entry in entries:
+        call = build_call(pf, entry["endpoint"], entry["inputs"])
+        if call is None:
+            print(f"- skip {entry['endpoint']} (not replayable)")
+            continue
+        if profile:
+            _, report = profile_call("replay", call)
+            print(f"{entry['endpoint']} {entry['inputs']}: {report['seconds']:.4f}s (recorded {entry['seconds']:.4f}s)")
+            for row in report["top"][:10]:
+                print(f"    {row['cumtime']:>10.6f} {row['calls']:>8} {row['function']}")
+        else:
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            print(f"{entry['endpoint']} {entry['inputs']}: {elapsed:.4f}s (recorded {entry['seconds']:.4f}s)")
+
+
+if __name__ == "__main__":
+    main()
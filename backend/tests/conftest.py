@@ -0,0 +1,180 @@
+"""
+Shared fixtures: a small synthetic road graph in a temporary SQLite file and a plain
+Dijkstra to check the routing services against.
+
+Settings are read once at import time, so the environment is pointed at the temporary
+directory before anything from app is imported.
+"""
+import heapq
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+TEST_DIR = tempfile.mkdtemp(prefix="pathfinding-tests-")
+DB_PATH = os.path.join(TEST_DIR, "graph.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["ARC_FLAGS_DIR"] = os.path.join(TEST_DIR, "arc_flags")
+os.environ["HUB_LABELS_DIR"] = os.path.join(TEST_DIR, "hub_labels")
+os.environ["PROFILE_DIR"] = os.path.join(TEST_DIR, "profiles")
+
+from app.config import get_settings  # noqa: E402
+from app.services.pathfinding import PathfindingService  # noqa: E402
+
+MAP_HEIGHT = get_settings().MAP_HEIGHT
+
+# Lưới GRID x GRID node cách nhau SPACING pixel, cộng một đảo 3 node không nối với lưới
+GRID = 8
+SPACING = 60.0
+ORIGIN = 100.0
+ISLAND = [(9001, 900.0, 900.0), (9002, 960.0, 900.0), (9003, 960.0, 960.0)]
+
+
+def grid_id(i: int, j: int) -> int:
+    return i * GRID + j + 1
+
+
+def build_graph_db(path: str = DB_PATH, seed: int = 7):
+    """
+    Ghi bảng nodes_*/edges_* cho car và foot. Trọng số = độ dài * (1..1.5) nên heuristic Euclid
+    vẫn chấp nhận được và hầu như không có hai đường bằng chi phí. Car có vài đường một chiều.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    nodes = {}
+    for i in range(GRID):
+        for j in range(GRID):
+            nodes[grid_id(i, j)] = (ORIGIN + i * SPACING + rng.uniform(-8, 8), ORIGIN + j * SPACING + rng.uniform(-8, 8))
+    for nid, x, y in ISLAND:
+        nodes[nid] = (x, y)
+
+    pairs = []
+    for i in range(GRID):
+        for j in range(GRID):
+            for di, dj in ((1, 0), (0, 1)):
+                if i + di < GRID and j + dj < GRID:
+                    pairs.append((grid_id(i, j), grid_id(i + di, j + dj), (i + j) % 5 == 0))
+    pairs += [(9001, 9002, False), (9002, 9003, False)]
+
+    conn = sqlite3.connect(path)
+    for v_type in ("car", "foot"):
+        conn.execute(f"CREATE TABLE nodes_{v_type} (id INTEGER PRIMARY KEY, x REAL, y REAL)")
+        conn.execute(f"CREATE TABLE edges_{v_type} (node_from INTEGER, node_to INTEGER, weight REAL)")
+        conn.executemany(f"INSERT INTO nodes_{v_type} VALUES (?, ?, ?)", [(n, x, y) for n, (x, y) in nodes.items()])
+        rows = []
+        for u, v, one_way in pairs:
+            length = math.dist(nodes[u], nodes[v])
+            rows.append((u, v, length * rng.uniform(1.0, 1.5)))
+            if v_type == "foot" or not one_way:
+                rows.append((v, u, length * rng.uniform(1.0, 1.5)))
+        conn.executemany(f"INSERT INTO edges_{v_type} VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def open_edges(graph, reverse: bool = False):
+    """node -> [(hàng xóm, edge id)] trên các cạnh phương tiện được đi và đang mở"""
+    access, mask, disabled = graph['access'], graph['mask'], graph['disabled']
+    adjacency = graph['rev_adj_list'] if reverse else graph['adj_list']
+    return {
+        node: [(n, ei) for n, ei in adj if access[ei] & mask and not disabled[ei]]
+        for node, adj in adjacency.items()
+    }
+
+
+def reference_dijkstra(graph, sources, weights=None, reverse: bool = False):
+    """Dijkstra không tối ưu gì: sources là node hoặc dict node -> chi phí ban đầu"""
+    weights = graph['current_weights'] if weights is None else weights
+    adjacency = open_edges(graph, reverse)
+    dist = {}
+    heap = [(c, n) for n, c in (sources.items() if isinstance(sources, dict) else [(sources, 0.0)])]
+    heapq.heapify(heap)
+    while heap:
+        d, node = heapq.heappop(heap)
+        if node in dist:
+            continue
+        dist[node] = d
+        for neighbor, ei in adjacency.get(node, ()):
+            if neighbor not in dist:
+                heapq.heappush(heap, (d + weights[ei], neighbor))
+    return dist
+
+
+def reference_snap_cost(pf, start_snap, end_snap, vehicle_type: str) -> float:
+    """Chi phí (đơn vị trọng số) giữa hai điểm snap: Dijkstra từ các nửa cạnh đi ra tới các nửa cạnh đi vào"""
+    graph = pf.graphs[vehicle_type]
+    sources, _ = pf.snap_sources(start_snap, vehicle_type, outgoing=True)
+    targets, _ = pf.snap_sources(end_snap, vehicle_type, outgoing=False)
+    dist = reference_dijkstra(graph, sources)
+    best = min((dist[n] + tail for n, tail in targets.items() if n in dist), default=math.inf)
+    direct = pf.direct_leg(start_snap, end_snap, vehicle_type)
+    if direct is not None:
+        best = min(best, graph['current_weights'][direct[0]] * direct[1])
+    return best
+
+
+def random_points(count: int, seed: int):
+    """Điểm ngẫu nhiên quanh lưới, theo toạ độ RAM (trục Y đã lật) như tham số của /path"""
+    rng = random.Random(seed)
+    low, high = ORIGIN - 10, ORIGIN + (GRID - 1) * SPACING + 10
+    return [(rng.uniform(low, high), MAP_HEIGHT - rng.uniform(low, high)) for _ in range(count)]
+
+
+def block_line(x1: float, y1: float, x2: float, y2: float, threshold: float = 25.0, penalty: float = 1.0):
+    """Dữ liệu kịch bản chặn đường theo toạ độ RAM (lng = x, lat = y) như ScenarioRequest.dict()"""
+    return {
+        "scenario_type": "block",
+        "line_start": {"lng": x1, "lat": y1},
+        "line_end": {"lng": x2, "lat": y2},
+        "penalty_weight": penalty,
+        "threshold": threshold,
+        "starts_at": None,
+        "ends_at": None
+    }
+
+
+def rain_area(x: float, y: float, radius: float, penalty: float):
+    """Kịch bản mưa (điểm tròn): nhân trọng số các cạnh có trung điểm trong bán kính"""
+    return {**block_line(x, y, x, y, radius, penalty), "scenario_type": "rain"}
+
+
+@pytest.fixture
+def graph_db():
+    build_graph_db()
+    return DB_PATH
+
+
+@pytest.fixture
+def pf(graph_db):
+    """PathfindingService mới trên đồ thị tổng hợp (không dùng singleton của app)"""
+    service = PathfindingService()
+    assert service.wait_until_ready(timeout=30)
+    return service
+
+
+def apply_scenario(scenario_service, pathfinding_service, data):
+    """Như POST /api/scenarios: tính hình học, lưu kịch bản rồi áp trọng số"""
+    edges = scenario_service.calculate_affected_edges(
+        pathfinding_service,
+        (data["line_start"]["lng"], data["line_start"]["lat"]),
+        (data["line_end"]["lng"], data["line_end"]["lat"]),
+        data["threshold"]
+    )
+    scenario = scenario_service.add_scenario(data, edges)
+    scenario_service.activate(pathfinding_service, scenario)
+    return scenario
+
+
+def remove_scenario(scenario_service, pathfinding_service, scenario):
+    """Như DELETE /api/scenarios/{id}"""
+    scenario_service.remove_scenario(scenario["id"])
+    scenario_service.deactivate(pathfinding_service, scenario)
@@ -0,0 +1,29 @@
+"""Plateau alternatives: the first route is the /path optimum and every route stays within the stretch bound"""
+import pytest
+
+from app.services.alternatives import find_alternatives
+from app.services.pathfinding import DISTANCE_SCALE
+
+from conftest import random_points, reference_snap_cost
+
+
+@pytest.mark.parametrize("vehicle_type", ["car", "foot"])
+def test_alternatives_start_with_optimum(pf, vehicle_type):
+    points = random_points(40, seed=5)
+    checked = 0
+    for start, end in zip(points, points[1:]):
+        routes = find_alternatives(pf, *start, *end, vehicle_type, 1.0, k=3, max_stretch=0.3)
+        optimum = reference_snap_cost(pf, pf.snap_to_edge(*start, vehicle_type), pf.snap_to_edge(*end, vehicle_type), vehicle_type)
+        if optimum == float('inf'):
+            assert routes is None
+            continue
+        checked += 1
+        assert routes[0]['cost'] == pytest.approx(optimum * DISTANCE_SCALE, abs=0.011)
+        assert routes[0]['cost'] == pytest.approx(pf.find_path(*start, *end, vehicle_type, 1.0)['cost'], abs=0.011)
+        for route in routes:
+            assert 1.0 <= route['stretch'] <= 1.3 + 1e-9
+            assert route['cost'] <= optimum * 1.3 * DISTANCE_SCALE + 0.011
+            assert len(set(route['node_ids'])) == len(route['node_ids'])
+        assert len({tuple(route['node_ids']) for route in routes}) == len(routes)
+    # Car có đường một chiều nên một phần các cặp không tới được
+    assert checked > 20
@@ -0,0 +1,78 @@
+"""Component labels after closures and reopenings match a from-scratch labelling and plain reachability"""
+from app.services.components import ComponentIndex
+from app.services.scenario import ScenarioService
+
+from conftest import (GRID, ISLAND, MAP_HEIGHT, ORIGIN, SPACING, apply_scenario, block_line, grid_id,
+                      reference_dijkstra, remove_scenario)
+
+# Đường dọc giữa cột 3 và cột 4: chặn mọi cạnh nối hai nửa lưới
+CUT_X = ORIGIN + 3.5 * SPACING
+
+
+def partition(index: ComponentIndex):
+    groups = {}
+    for node, label in index.labels.items():
+        groups.setdefault(label, set()).add(node)
+    return {frozenset(nodes) for nodes in groups.values()}
+
+
+def assert_consistent(pf, vehicle_type):
+    graph = pf.graphs[vehicle_type]
+    index = graph['components']
+    assert partition(index) == partition(ComponentIndex(graph).build())
+    assert index.sizes == {label: sum(1 for l in index.labels.values() if l == label) for label in index.sizes}
+    # Khác nhãn -> chắc chắn không có đường (ngược lại không bắt buộc vì đồ thị có hướng)
+    for source in (grid_id(0, 0), grid_id(GRID - 1, GRID - 1), ISLAND[0][0]):
+        reachable = reference_dijkstra(graph, source)
+        for target in graph['nodes']:
+            if pf.separated([source], [target], vehicle_type):
+                assert target not in reachable
+
+
+def cut(threshold=15.0, rows=GRID):
+    top = MAP_HEIGHT - ORIGIN + SPACING / 2
+    return block_line(CUT_X, top, CUT_X, top - rows * SPACING, threshold)
+
+
+def test_initial_labels_separate_the_island(pf):
+    for vehicle_type in ("car", "foot"):
+        assert_consistent(pf, vehicle_type)
+        components = pf.graphs[vehicle_type]['components']
+        assert components.count() == 2
+        assert components.label(ISLAND[0][0]) != components.label(grid_id(0, 0))
+
+
+def test_closure_splits_and_reopening_merges(pf):
+    scenarios = ScenarioService()
+    scenario = apply_scenario(scenarios, pf, cut())
+    for vehicle_type in ("car", "foot"):
+        assert_consistent(pf, vehicle_type)
+        components = pf.graphs[vehicle_type]['components']
+        assert components.count() == 3
+        assert components.label(grid_id(3, 0)) != components.label(grid_id(4, 0))
+        assert pf.find_path(*pf.graphs[vehicle_type]['nodes'][grid_id(0, 0)],
+                            *pf.graphs[vehicle_type]['nodes'][grid_id(GRID - 1, 0)], vehicle_type, 1.0)['cost'] == "Unreachable"
+
+    remove_scenario(scenarios, pf, scenario)
+    for vehicle_type in ("car", "foot"):
+        assert_consistent(pf, vehicle_type)
+        assert pf.graphs[vehicle_type]['components'].count() == 2
+
+
+def test_partial_and_overlapping_closures(pf):
+    scenarios = ScenarioService()
+    # Chặn một phần: vẫn liên thông qua hàng cuối
+    partial = apply_scenario(scenarios, pf, cut(rows=GRID - 1))
+    assert_consistent(pf, "car")
+    assert pf.graphs['car']['components'].count() == 2
+
+    # Chặn nốt, rồi gỡ kịch bản đầu: cạnh chung vẫn bị kịch bản sau giữ đóng
+    full = apply_scenario(scenarios, pf, cut())
+    assert pf.graphs['car']['components'].count() == 3
+    remove_scenario(scenarios, pf, partial)
+    assert_consistent(pf, "car")
+    assert pf.graphs['car']['components'].count() == 3
+
+    remove_scenario(scenarios, pf, full)
+    assert_consistent(pf, "car")
+    assert pf.graphs['car']['components'].count() == 2
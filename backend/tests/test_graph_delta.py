@@ -0,0 +1,186 @@
+"""Graph deltas patch a copy of the live generation and end up where a full reload of the same tables would"""
+import pickle
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.dependencies.access_control import require_admin
+from app.main import app
+from app.services.graph_delta import clone_generation, current_version
+from app.services.pathfinding import PathfindingService
+from app.services.scenario import ScenarioService
+
+from conftest import (GRID, MAP_HEIGHT, ORIGIN, SPACING, apply_scenario, block_line, grid_id, rain_area,
+                      reference_dijkstra)
+
+
+DELTA = {
+    "description": "new link road, closed footpath node",
+    "changes": {
+        "car": {
+            "remove_edges": [{"u": grid_id(2, 2), "v": grid_id(2, 3)}, {"u": grid_id(2, 3), "v": grid_id(2, 2)}],
+            "add_nodes": [{"id": 9100, "x": ORIGIN + 3.5 * SPACING, "y": ORIGIN + 3.5 * SPACING}],
+            "add_edges": [
+                {"u": grid_id(3, 3), "v": 9100}, {"u": 9100, "v": grid_id(3, 3)},
+                {"u": 9100, "v": grid_id(4, 4), "weight": 60.0}, {"u": grid_id(4, 4), "v": 9100, "weight": 60.0}
+            ],
+            "set_weights": [{"u": grid_id(5, 5), "v": grid_id(5, 6), "weight": 500.0}]
+        },
+        "foot": {
+            "remove_nodes": [grid_id(6, 1)]
+        }
+    }
+}
+
+
+def snapshot(graphs):
+    base = next(iter(graphs.values()))['base']
+    index = base['segment_index']
+    return pickle.dumps((
+        base['nodes'], base['adj_list'], base['rev_adj_list'], base['edges'], base['edge_index'],
+        base['access'].tobytes(), base['remap'], index.cells, index.masks, index.segment_count,
+        {
+            v_type: (graph['original_weights'].tobytes(), graph['current_weights'].tobytes(), graph['lengths'].tobytes(),
+                     graph['disabled'].tobytes(), graph['components'].labels, graph['components'].sizes,
+                     graph['closed_edges'], graph['version'])
+            for v_type, graph in graphs.items()
+        }
+    ))
+
+
+def profile_state(graph):
+    """Trạng thái so sánh được giữa hai lần tải (edge id có thể khác nhau)"""
+    access, mask = graph['access'], graph['mask']
+    edges = {
+        (u, v): (round(graph['original_weights'][ei], 9), round(graph['current_weights'][ei], 9), graph['disabled'][ei])
+        for ei, (u, v) in enumerate(graph['edges']) if access[ei] & mask
+    }
+    groups = {}
+    for node, label in graph['components'].labels.items():
+        groups.setdefault(label, set()).add(node)
+    return edges, {frozenset(nodes) for nodes in groups.values()}, graph['version']
+
+
+def assert_same_as_reload(pf, scenario_data=()):
+    fresh = PathfindingService()
+    assert fresh.wait_until_ready(timeout=30)
+    scenarios = ScenarioService()
+    for data in scenario_data:
+        apply_scenario(scenarios, fresh, data)
+    for vehicle_type in pf.vehicle_types:
+        graph, expected = pf.graphs[vehicle_type], fresh.graphs[vehicle_type]
+        assert profile_state(graph) == profile_state(expected)
+        for source in (grid_id(0, 0), grid_id(3, 3), grid_id(GRID - 1, GRID - 1)):
+            assert reference_dijkstra(graph, source) == pytest.approx(reference_dijkstra(expected, source))
+            # Search của service trên thế hệ mới cũng cho đúng khoảng cách đó
+            dist, _ = pf.dijkstra(source, vehicle_type)
+            assert dist == pytest.approx(reference_dijkstra(graph, source))
+
+
+def graph_rows(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        # Chỉ so các cột đồ thị: cột road class được thêm khi migrate schema, không thuộc delta
+        rows = {}
+        for v_type in ("car", "foot"):
+            rows[f"nodes_{v_type}"] = sorted(conn.execute(f"SELECT id, x, y FROM nodes_{v_type}").fetchall())
+            rows[f"edges_{v_type}"] = sorted(conn.execute(f"SELECT node_from, node_to, weight FROM edges_{v_type}").fetchall())
+        return rows
+    finally:
+        conn.close()
+
+
+def test_clone_generation_is_copy_on_write(pf):
+    before = snapshot(pf.graphs)
+    clone = clone_generation(pf.graphs)
+    graph = clone['car']
+    ei = graph['edge_index'][(grid_id(0, 0), grid_id(0, 1))]
+    graph['current_weights'][ei] *= 10
+    graph['disabled'][ei] = 1
+    graph['nodes'][424242] = (1.0, 1.0)
+    graph['access'][ei] = 0
+    graph['components'].on_closed([ei])
+    assert snapshot(pf.graphs) == before
+
+
+def test_delta_leaves_old_generation_and_matches_reload(pf):
+    old_graphs, generation = pf._graphs, pf.generation
+    before = snapshot(old_graphs)
+
+    result = pf.apply_graph_delta(DELTA)
+
+    assert result['version'] == 1
+    assert pf.generation == generation + 1 and pf._graphs is not old_graphs
+    assert snapshot(old_graphs) == before
+    assert 9100 in pf.graphs['car']['nodes']
+    foot = pf.graphs['foot']
+    assert not any(grid_id(6, 1) in edge for ei, edge in enumerate(foot['edges']) if foot['access'][ei] & foot['mask'])
+    assert_same_as_reload(pf)
+
+
+def test_delta_rederives_active_scenarios(pf):
+    center = (ORIGIN + 3.5 * SPACING, MAP_HEIGHT - ORIGIN - 3.5 * SPACING)
+    scenario_data = [
+        rain_area(*center, SPACING, 3.0),
+        block_line(ORIGIN + 5.5 * SPACING, MAP_HEIGHT - ORIGIN, ORIGIN + 5.5 * SPACING, MAP_HEIGHT - ORIGIN - 3 * SPACING, 15.0)
+    ]
+    scenarios = ScenarioService()
+    for data in scenario_data:
+        apply_scenario(scenarios, pf, data)
+
+    result = pf.apply_graph_delta(DELTA, scenarios)
+
+    assert result['scenarios_rederived'] >= 1
+    # Cạnh mới của node 9100 nằm trong vùng mưa -> đã bị nhân hệ số như khi tạo kịch bản trên đồ thị mới
+    assert any(9100 in edge for edge in scenarios.active_scenarios[0]["affected_edges_map"]["car"])
+    assert_same_as_reload(pf, scenario_data)
+
+
+def test_stale_base_version_is_rejected_without_changes(pf, graph_db):
+    pf.apply_graph_delta(DELTA)
+    rows, generation = graph_rows(graph_db), pf.generation
+    state = {v_type: profile_state(graph) for v_type, graph in pf.graphs.items()}
+
+    stale = {"base_version": 0, "changes": {"car": {"set_weights": [{"u": grid_id(0, 0), "v": grid_id(0, 1), "weight": 5.0}]}}}
+    with pytest.raises(RuntimeError):
+        pf.apply_graph_delta(stale)
+
+    assert graph_rows(graph_db) == rows
+    assert pf.generation == generation
+    assert {v_type: profile_state(graph) for v_type, graph in pf.graphs.items()} == state
+
+    # Soạn trên version hiện tại thì được áp
+    assert pf.apply_graph_delta({**stale, "base_version": 1})['version'] == 2
+
+
+def test_invalid_delta_rolls_back(pf, graph_db):
+    rows = graph_rows(graph_db)
+    invalid = {"changes": {"car": {
+        "set_weights": [{"u": grid_id(0, 0), "v": grid_id(0, 1), "weight": 5.0}],
+        "remove_edges": [{"u": grid_id(0, 0), "v": grid_id(7, 7)}]
+    }}}
+    with pytest.raises(ValueError):
+        pf.apply_graph_delta(invalid)
+    assert graph_rows(graph_db) == rows
+    conn = sqlite3.connect(graph_db)
+    try:
+        assert current_version(conn.cursor()) == 0
+    finally:
+        conn.close()
+
+
+def test_delta_endpoint_status_codes(pf, monkeypatch):
+    monkeypatch.setattr("app.api.path.get_pathfinding_service", lambda: pf)
+    monkeypatch.setattr("app.api.path.get_scenario_service", lambda: ScenarioService())
+    app.dependency_overrides[require_admin] = lambda: None
+    try:
+        client = TestClient(app)
+        change = {"car": {"set_weights": [{"u": grid_id(0, 0), "v": grid_id(0, 1), "weight": 5.0}]}}
+        assert client.post("/api/path/delta", json={"base_version": 0, "changes": change}).status_code == 200
+        conflict = client.post("/api/path/delta", json={"base_version": 0, "changes": change})
+        assert conflict.status_code == 409
+        missing = {"car": {"remove_edges": [{"u": grid_id(0, 0), "v": grid_id(7, 7)}]}}
+        assert client.post("/api/path/delta", json={"changes": missing}).status_code == 400
+    finally:
+        app.dependency_overrides.pop(require_admin, None)
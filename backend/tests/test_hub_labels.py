@@ -0,0 +1,97 @@
+"""Hub label distances equal plain Dijkstra; the oracle falls back whenever a scenario can change the answer"""
+import math
+import os
+
+import pytest
+
+from app.services.hub_labels import build_hub_labels, labels_path, load_hub_labels, save_hub_labels
+from app.services.pathfinding import PathfindingService
+from app.services.scenario import ScenarioService
+
+from conftest import (MAP_HEIGHT, ORIGIN, SPACING, apply_scenario, block_line, rain_area, random_points,
+                      reference_dijkstra, reference_snap_cost, remove_scenario)
+
+
+@pytest.fixture
+def labelled_pf(pf):
+    """Dựng nhãn như scripts/build_hub_labels.py rồi tải lại đồ thị để service đọc file nhãn"""
+    versions = pf.graph_versions()
+    paths = []
+    for vehicle_type, graph in pf.graphs.items():
+        path = labels_path(vehicle_type)
+        save_hub_labels(build_hub_labels(graph, versions), path)
+        paths.append(path)
+    service = PathfindingService()
+    assert service.wait_until_ready(timeout=30)
+    yield service
+    for path in paths:
+        os.remove(path)
+
+
+@pytest.mark.parametrize("vehicle_type", ["car", "foot"])
+def test_label_distances_match_dijkstra(pf, vehicle_type):
+    graph = pf.graphs[vehicle_type]
+    labels = build_hub_labels(graph, pf.graph_versions())
+    nodes = sorted(graph['nodes'])
+    for source in nodes:
+        dist = reference_dijkstra(graph, source, graph['original_weights'])
+        for target in nodes:
+            expected = dist.get(target, math.inf)
+            d = 0.0 if source == target else labels.distance(source, target)
+            if expected == math.inf:
+                assert d == math.inf
+            else:
+                assert d == pytest.approx(expected, rel=1e-9)
+
+
+def test_saved_labels_round_trip(pf, tmp_path):
+    graph = pf.graphs['car']
+    versions = pf.graph_versions()
+    labels = build_hub_labels(graph, versions)
+    path = str(tmp_path / "car.labels")
+    save_hub_labels(labels, path)
+    for use_mmap in (True, False):
+        loaded = load_hub_labels(path, versions, use_mmap)
+        assert loaded is not None
+        assert loaded.entries() == labels.entries()
+        assert all(loaded.distance(s, t) == labels.distance(s, t) for s in (1, 10, 40) for t in (5, 33, 64))
+    # Nhãn dựng cho phiên bản đồ thị khác bị bỏ qua
+    assert load_hub_labels(path, {**versions, 'car': 'other'}) is None
+
+
+def test_oracle_matches_search_or_falls_back(labelled_pf):
+    pf = labelled_pf
+    oracle = pf.hub_labels
+    points = random_points(40, seed=5)
+    pairs = list(zip(points, points[1:]))
+    scenarios = ScenarioService()
+
+    def check(vehicle_type):
+        for start, end in pairs:
+            answer = oracle.distance(*start, *end, vehicle_type)
+            expected = reference_snap_cost(pf, pf.snap_to_edge(*start, vehicle_type), pf.snap_to_edge(*end, vehicle_type), vehicle_type)
+            if answer is not None:
+                assert answer['cost'] == pytest.approx(expected, rel=1e-9)
+
+    check("car")
+    check("foot")
+    assert oracle.counters['label_queries'] > 0
+
+    # Listener thay cặp (raised, lowered) bằng bản mới, không sửa bản truy vấn đang đọc
+    labels = pf.graphs["car"]["hub_labels"]
+    published = labels.changed
+    center = (ORIGIN + 3 * SPACING, MAP_HEIGHT - ORIGIN - 3 * SPACING)
+    rain = apply_scenario(scenarios, pf, rain_area(*center, 1.5 * SPACING, 3.0))
+    block = apply_scenario(scenarios, pf, block_line(ORIGIN + 4.5 * SPACING, MAP_HEIGHT - ORIGIN,
+                                                     ORIGIN + 4.5 * SPACING, MAP_HEIGHT - ORIGIN - 3 * SPACING, 15.0))
+    assert published == (frozenset(), frozenset()) and labels.changed[0]
+    check("car")
+    check("foot")
+    assert oracle.counters['fallback_changed'] > 0
+
+    # Gỡ kịch bản: cạnh rẻ đi lại so với lúc có kịch bản, nhãn lại đúng hoàn toàn
+    remove_scenario(scenarios, pf, rain)
+    remove_scenario(scenarios, pf, block)
+    before = oracle.counters['fallback_changed']
+    check("car")
+    assert oracle.counters['fallback_changed'] == before
@@ -0,0 +1,66 @@
+"""Multi-stop routes: leg costs match plain Dijkstra, the order is the brute-force optimum, merged legs repeat nothing"""
+import itertools
+
+import pytest
+
+from app.config import get_settings
+from app.services.multistop import path_cost, plan_multi_stop
+from app.services.pathfinding import DISTANCE_SCALE
+
+from conftest import ISLAND, random_points, reference_dijkstra, reference_snap_cost
+
+
+def reference_matrix(pf, waypoints, vehicle_type):
+    snaps = [pf.snap_to_edge(x, y, vehicle_type) for x, y in waypoints]
+    return [[0.0 if a is b else reference_snap_cost(pf, a, b, vehicle_type) for b in snaps] for a in snaps]
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_multi_stop_matches_brute_force(pf, seed):
+    waypoints = random_points(5, seed=100 + seed)
+    matrix = reference_matrix(pf, waypoints, 'foot')
+    result = plan_multi_stop(pf, waypoints, 'foot', 1.0, optimize=True, fixed_start=True)
+
+    order = result['order']
+    assert order[0] == 0 and sorted(order) == list(range(len(waypoints)))
+    for leg in result['legs']:
+        assert leg['cost'] == pytest.approx(matrix[leg['from']][leg['to']] * DISTANCE_SCALE, abs=0.011)
+    best = min(path_cost([0, *rest], matrix) for rest in itertools.permutations(range(1, len(waypoints))))
+    assert path_cost(order, matrix) == pytest.approx(best)
+
+    ids = result['node_ids']
+    assert all(a != b for a, b in zip(ids, ids[1:]))
+    coords = [(p['x'], p['y']) for p in result['path']]
+    assert all(a != b for a, b in zip(coords, coords[1:]))
+    assert result['nodes'] == len(ids)
+
+
+def test_multi_stop_keeps_given_order(pf):
+    waypoints = random_points(4, seed=42)
+    matrix = reference_matrix(pf, waypoints, 'foot')
+    result = plan_multi_stop(pf, waypoints, 'foot', 1.0, optimize=False)
+    assert result['order'] == [0, 1, 2, 3]
+    assert result['cost'] == pytest.approx(path_cost([0, 1, 2, 3], matrix) * DISTANCE_SCALE, abs=0.03)
+
+
+def test_multi_stop_rejects_other_components_without_searching(pf, monkeypatch):
+    island_x, island_y = pf.graphs['foot']['nodes'][ISLAND[0][0]]
+    waypoints = random_points(3, seed=7) + [(island_x, island_y)]
+
+    def no_search(*args, **kwargs):
+        raise AssertionError("searched although a stop is in another component")
+
+    monkeypatch.setattr(pf, "dijkstra", no_search)
+    assert plan_multi_stop(pf, waypoints, 'foot', 1.0) is None
+
+
+def test_multi_stop_uses_nearest_nodes_without_edge_snapping(pf, monkeypatch):
+    monkeypatch.setattr(get_settings(), "snap_to_edges", False)
+    waypoints = random_points(4, seed=9)
+    nodes = [pf.find_nearest_node(x, y, 'foot') for x, y in waypoints]
+    result = plan_multi_stop(pf, waypoints, 'foot', 1.0, optimize=False)
+    assert result['node_ids'][0] == nodes[0] and result['node_ids'][-1] == nodes[-1]
+    graph = pf.graphs['foot']
+    for leg in result['legs']:
+        expected = reference_dijkstra(graph, nodes[leg['from']])[nodes[leg['to']]]
+        assert leg['cost'] == pytest.approx(expected * DISTANCE_SCALE, abs=0.011)
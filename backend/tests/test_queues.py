@@ -0,0 +1,50 @@
+"""Every open-set queue gives the plain Dijkstra distances; weighted A* never runs on the radix heap"""
+import random
+
+import pytest
+
+from app.services.queues import QUEUES, make_queue
+
+from conftest import GRID, grid_id, reference_dijkstra
+
+
+@pytest.mark.parametrize("kind", sorted(QUEUES))
+def test_dijkstra_distances_per_queue(pf, kind):
+    for vehicle_type in ("car", "foot"):
+        graph = pf.graphs[vehicle_type]
+        for source in (grid_id(0, 0), grid_id(4, 3), 9001):
+            dist, came_from = pf.dijkstra(source, vehicle_type, queue=kind)
+            assert dist == pytest.approx(reference_dijkstra(graph, source))
+            # Cây cha khớp khoảng cách: dist[v] = dist[cha] + w(cha, v)
+            for node, parent in came_from.items():
+                ei = graph['edge_index'][(parent, node)]
+                assert dist[node] == pytest.approx(dist[parent] + graph['current_weights'][ei])
+
+
+@pytest.mark.parametrize("kind", sorted(QUEUES))
+def test_a_star_cost_per_queue(pf, kind):
+    rng = random.Random(3)
+    graph = pf.graphs['car']
+    for _ in range(30):
+        start, goal = grid_id(rng.randrange(GRID), rng.randrange(GRID)), grid_id(rng.randrange(GRID), rng.randrange(GRID))
+        optimum = reference_dijkstra(graph, start).get(goal)
+        for epsilon in (0.0, 0.5):
+            stats = {}
+            result = pf._search({start: 0.0}, {goal: 0.0}, graph['nodes'][goal], 'car', epsilon, stats, queue=kind)
+            if optimum is None:
+                assert result is None
+                continue
+            if epsilon == 0:
+                assert result[1] == pytest.approx(optimum)
+            else:
+                assert optimum - 1e-9 <= result[1] <= (1 + epsilon) * optimum + 1e-9
+                # Khoá f của weighted A* có thể giảm -> không được dùng radix heap
+                assert stats['queue']['queue'] != 'radix'
+
+
+def test_make_queue_falls_back_for_non_monotone_keys():
+    assert make_queue('radix', set()).name == 'radix'
+    assert make_queue('radix', set(), monotone=False).name == 'lazy'
+    assert make_queue('indexed', set(), monotone=False).name == 'indexed'
+    with pytest.raises(ValueError):
+        make_queue('fibonacci', set())
@@ -0,0 +1,121 @@
+"""Route cache entries and destination trees that survive a weight change still give the plain Dijkstra answer"""
+import time
+
+import pytest
+
+from app.services.pathfinding import DISTANCE_SCALE
+from app.services.route_cache import RouteCache
+from app.services.scenario import ScenarioService
+
+from conftest import (MAP_HEIGHT, ORIGIN, SPACING, apply_scenario, block_line, rain_area, random_points,
+                      reference_snap_cost, remove_scenario)
+
+
+def expected_cost(pf, start, end, vehicle_type):
+    """Chi phí /api/path (speed = 1) theo Dijkstra tham chiếu"""
+    cost = reference_snap_cost(pf, pf.snap_to_edge(*start, vehicle_type), pf.snap_to_edge(*end, vehicle_type), vehicle_type)
+    return "Unreachable" if cost == float('inf') else cost * DISTANCE_SCALE
+
+
+def assert_cost(result, expected):
+    if isinstance(expected, str):
+        assert result['cost'] == expected
+    else:
+        assert result['cost'] == pytest.approx(expected, abs=0.011)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "background work did not finish"
+        time.sleep(0.01)
+
+
+# Mưa nhân trọng số vùng giữa lưới, chặn một đoạn cột, rồi gỡ lần lượt (cạnh rẻ đi lại)
+CENTER = (ORIGIN + 3 * SPACING, MAP_HEIGHT - ORIGIN - 3 * SPACING)
+CHANGES = [
+    ("add", rain_area(*CENTER, 2 * SPACING, 4.0)),
+    ("add", block_line(ORIGIN + 1.5 * SPACING, MAP_HEIGHT - ORIGIN, ORIGIN + 1.5 * SPACING, MAP_HEIGHT - ORIGIN - 4 * SPACING, 15.0)),
+    ("remove", 0),
+    ("remove", 1),
+]
+
+
+def test_route_cache_keeps_only_correct_routes(pf):
+    pf.destination_trees = None
+    cache = RouteCache(pf, size=10000)
+    scenarios = ScenarioService()
+    points = random_points(60, seed=1)
+    queries = [(points[i], points[i + 1], vehicle_type) for i in range(len(points) - 1) for vehicle_type in ("car", "foot")]
+
+    def fill():
+        for start, end, vehicle_type in queries:
+            key = pf.route_key(*start, *end, vehicle_type, 1.0, snaps=pf.snap_endpoints(*start, *end, vehicle_type))
+            if cache.get(key[:-1]) is None:
+                result = pf.find_path(*start, *end, vehicle_type, 1.0)
+                if result is not None:
+                    cache.put(key[:-1], key[-1], result, vehicle_type, 1.0)
+
+    fill()
+    kept = 0
+    applied = []
+    for action, value in CHANGES:
+        if action == "add":
+            applied.append(apply_scenario(scenarios, pf, value))
+        else:
+            remove_scenario(scenarios, pf, applied[value])
+        for start, end, vehicle_type in queries:
+            key = pf.route_key(*start, *end, vehicle_type, 1.0, snaps=pf.snap_endpoints(*start, *end, vehicle_type))
+            cached = cache.get(key[:-1])
+            if cached is not None:
+                assert_cost(cached, expected_cost(pf, start, end, vehicle_type))
+                kept += 1
+        fill()
+
+    stats = cache.stats()
+    assert kept > 0
+    assert stats['invalidated_path'] > 0
+    assert stats['invalidated_bound'] > 0
+
+
+def test_destination_trees_never_serve_stale_routes(pf):
+    trees = pf.destination_trees
+    trees.min_hits = 1
+    scenarios = ScenarioService()
+    goals = [pf.snap_to_edge(x, y, "car") for x, y in random_points(4, seed=2)]
+    starts = [pf.snap_to_edge(x, y, "car") for x, y in random_points(25, seed=3)]
+
+    def fresh():
+        return all(
+            key in trees._trees and trees._trees[key].epoch == pf.weight_epoch and key not in trees._pending
+            for key in (trees._key("car", goal) for goal in goals)
+        )
+
+    def check(require_served):
+        for goal in goals:
+            for start in starts:
+                result = trees.route(start, goal, "car", 1.0, count_hit=False)
+                expected = reference_snap_cost(pf, start, goal, "car")
+                if expected == float('inf'):
+                    assert result is None
+                elif result is None:
+                    assert not require_served
+                else:
+                    assert_cost(result, expected * DISTANCE_SCALE)
+
+    for goal in goals:
+        pf.route_snapped(starts[0], goal, "car", 1.0)
+    wait_for(fresh)
+    check(require_served=True)
+
+    applied = []
+    for action, value in CHANGES:
+        if action == "add":
+            applied.append(apply_scenario(scenarios, pf, value))
+        else:
+            remove_scenario(scenarios, pf, applied[value])
+        # Ngay sau khi đổi: cây chưa dựng lại phải trả None, không được trả route cũ
+        check(require_served=False)
+        wait_for(fresh)
+        check(require_served=True)
+    assert trees.stats()['builds'] > len(goals)
@@ -0,0 +1,35 @@
+"""The scheduler backs off while a due transition cannot be applied instead of spinning"""
+import time
+from datetime import timedelta
+
+from app.services import scheduler
+
+
+class DueScenarios:
+    """Kịch bản có mốc đã qua nhưng chưa được tick (đồ thị chưa sẵn sàng)"""
+    active_scenarios = [{"id": 1}]
+
+    def __init__(self):
+        self.loops = 0
+
+    def next_transition(self, now):
+        self.loops += 1
+        return now - timedelta(seconds=1)
+
+
+class LoadingGraphs:
+    vehicle_types = ["car"]
+
+    def is_ready(self, vehicle_type):
+        return False
+
+
+def test_due_transition_waits_for_retry_delay(monkeypatch):
+    scenarios = DueScenarios()
+    monkeypatch.setattr(scheduler, "get_scenario_service", lambda: scenarios)
+    monkeypatch.setattr(scheduler, "get_pathfinding_service", LoadingGraphs)
+    runner = scheduler.ScenarioScheduler()
+    runner.start()
+    time.sleep(1.0)
+    runner.stop()
+    assert scenarios.loops <= 1.0 / scheduler.RETRY_DELAY + 2